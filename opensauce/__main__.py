@@ -11,23 +11,38 @@ from __future__ import print_function
 
 import argparse
 import csv
+import multiprocessing
 import os
 import shlex
 import sys
 import platform
 import numpy as np
 
+try:
+    from math import gcd
+except ImportError: # pragma: no cover
+    # Python 2
+    from fractions import gcd
+
 # Import user-defined global configuration variables
 from conf.userconf import user_default_snack_method, user_tcl_shell_cmd, user_praat_path, user_reaper_path
 
 # Import from soundfile.py in opensauce package
-from .soundfile import SoundFile
+from .soundfile import SoundFile, valid_resample_methods, valid_precisions
 # Import from helpers.py in opensauce package
-from .helpers import remove_empty_lines_from_file, round_half_away_from_zero
+from .helpers import round_half_away_from_zero
 # Import from snack.py in opensauce package
 from .snack import valid_snack_methods, sformant_names
 # Import from praat.py in opensauce package
 from .praat import valid_praat_f0_methods
+# Import from cache.py in opensauce package
+from .cache import MeasurementCache
+# Import profiling.py from opensauce package
+from . import profiling
+# Import from output.py in opensauce package
+from .output import (OutputStream, OutputTable, TextWriter, native_dialect,
+                     output_writer, valid_output_formats, valid_output_dtypes,
+                     output_format_libraries)
 
 # Override default 'error' method so that it doesn't print out the noisy usage
 # prefix on the error messages, and so that we get a useful command name
@@ -47,6 +62,15 @@ class MyArgumentParser(argparse.ArgumentParser):
 
         return ivalue
 
+    def nonnegative_int(self, value):
+        """Check that type is non-negative integer
+        """
+        ivalue = int(value)
+        if ivalue < 0:
+            raise argparse.ArgumentTypeError("%s is an invalid non-negative integer value" % value)
+
+        return ivalue
+
     def pos_half_int(self, value):
         """Check that type is positive half integer
         """
@@ -82,8 +106,11 @@ class CLI(object):
                            'use_textgrid', 'include_labels',
                            'include_empty_labels', 'ignore_label',
                            'time_starts_at_zero', 'include_interval_endpoint',
-                           'NaN', 'output_delimiter', 'resample_freq', 'f0',
-                           'formants', 'frame_shift', 'window_size',
+                           'analyze_intervals', 'interval_padding',
+                           'NaN', 'output_delimiter', 'output_format',
+                           'output_dtype', 'resample_freq',
+                           'resample_method', 'precision', 'f0', 'formants',
+                           'frame_shift', 'window_size',
                            'frame_precision', 'snack_method', 'tcl_cmd',
                            'snack_min_f0', 'snack_max_f0', 'pre_emphasis',
                            'lpc_order', 'shr_min_f0', 'shr_max_f0',
@@ -97,7 +124,57 @@ class CLI(object):
                            'no_high_pass', 'use_hilbert_transform',
                            'inter_mark']
     excluded_args = ['wavfiles', 'settings', 'output_filepath',
-                     'output_settings', 'output_settings_path']
+                     'output_settings', 'output_settings_path', 'jobs',
+                     'batch_size', 'threads', 'cache_dir', 'cache_size',
+                     'profile']
+    # Inputs of each measurement algorithm.  'wavpath' means that the
+    # algorithm reads the sound file, and 'wavdata' that it uses the samples
+    # in memory (both refer to the resampled sound with --resample-freq).
+    # 'F0' and 'formants' stand for the results of the --f0 and --formants
+    # algorithms, and any other input is the result of that measurement.
+    measurement_inputs = {
+        'snackF0': ['wavpath'],
+        'snackFormants': ['wavpath'],
+        'praatF0': ['wavpath'],
+        'praatFormants': ['wavpath'],
+        'shrF0': ['wavdata'],
+        'SHR': ['wavdata'],
+        'reaperF0': ['wavpath'],
+        }
+    # Measurements that one algorithm wrapper computes together, when all of
+    # them have to be computed for a sound file
+    joint_measurements = [
+        (('praatF0', 'praatFormants'), '_praat_pitch_and_formants'),
+        (('shrF0', 'SHR'), '_shr_pitch_and_SHR'),
+        ]
+    # Measurements that can't be computed for part of a sound file with the
+    # same result as for the whole file: Praat places its frames relative to
+    # the middle of the analyzed sound, and Praat and REAPER choose the
+    # pitch of each frame with a path through the whole sound.  With
+    # --analyze-intervals, they are computed for the whole sound file.
+    whole_file_measurements = ['praatF0', 'praatFormants', 'reaperF0']
+    # Parameters that each measurement algorithm uses, which determine its
+    # result for a given sound file, in addition to the resampling settings
+    measurement_params = {
+        'snackF0': ['frame_shift', 'window_size', 'snack_min_f0',
+                    'snack_max_f0'],
+        'snackFormants': ['frame_shift', 'window_size', 'pre_emphasis',
+                          'lpc_order'],
+        'praatF0': ['frame_shift', 'frame_precision', 'praat_f0_method',
+                    'praat_min_f0', 'praat_max_f0', 'silence_threshold',
+                    'voice_threshold', 'octave_cost', 'octave_jumpcost',
+                    'voiced_unvoiced_cost', 'kill_octave_jumps',
+                    'interpolate', 'smooth', 'smooth_bandwidth'],
+        'praatFormants': ['frame_shift', 'window_size', 'frame_precision',
+                          'num_formants', 'max_formant_freq'],
+        'shrF0': ['frame_shift', 'window_size', 'frame_precision',
+                  'shr_min_f0', 'shr_max_f0'],
+        'SHR': ['frame_shift', 'window_size', 'frame_precision',
+                'shr_min_f0', 'shr_max_f0'],
+        'reaperF0': ['frame_shift', 'use_pyreaper', 'reaper_min_f0',
+                     'reaper_max_f0', 'no_high_pass',
+                     'use_hilbert_transform', 'inter_mark'],
+        }
 
     #
     # Command Line Parsing and Execution.
@@ -123,10 +200,35 @@ class CLI(object):
             self.args.measurements.append(self.args.formants)
         if not self.args.measurements:
             self.parser.error("No measurements requested")
-        # Cache for measurement results
-        self._cached_results = {}
-        # Cache for keys of measurements with multiple measurement vectors
-        self._cached_measurement_keys = {}
+        if self.args.output_format != 'text':
+            if self.args.output_filepath in (None, '-'):
+                self.parser.error("--output-format {} requires an output "
+                                  "file (-o)".format(self.args.output_format))
+            library = output_format_libraries.get(self.args.output_format)
+            if library is not None:
+                try:
+                    __import__(library)
+                except ImportError:
+                    self.parser.error("--output-format {} requires the "
+                                      "Python library {}".format(
+                                          self.args.output_format, library))
+        # Requested measurements and the measurements they depend on
+        self._required = self._required_measurements(self.args.measurements)
+        # Raw Praat and Snack estimates computed in advance for a batch of
+        # sound files
+        self._praat_batch_results = {}
+        self._snack_batch_results = {}
+        # Snack session shared by all sound files, created when first needed
+        self._snack_session = None
+        # Threads for running measurements concurrently (--threads), created
+        # when first needed
+        self._thread_pool = None
+        # Persistent cache of measurement results, if requested
+        if self.args.cache_dir is not None:
+            self._cache = MeasurementCache(self.args.cache_dir,
+                                           self.args.cache_size * 1024 * 1024)
+        else:
+            self._cache = None
         # Initialize length of measurement vectors
         # There is a distinct data_len for each sound file
         self.data_len = 0
@@ -187,19 +289,6 @@ class CLI(object):
     def _assemble_fields(self, filename, textgrid_data, offset, data):
         return ([filename] + (textgrid_data if self.args.use_textgrid and self.args.include_labels else []) + [offset] + data)
 
-    def _get_value(self, vector, index):
-        try:
-            res = vector[index]
-        except IndexError:
-            res = self.args.NaN
-        else:
-            if isinstance(res, float) and np.isnan(res):
-                res = self.args.NaN
-            else:
-                res = format(res, '.3f')
-
-        return res
-
     def _write_settings(self, args_dict, path):
         with open(path, 'w') as oset:
             for a in self.included_args_order:
@@ -214,6 +303,22 @@ class CLI(object):
                     # Don't put --smooth-bandwidth in settings output
                     # unless --smooth is set to True
                     continue
+                if (a == 'resample_method') and (args_dict['resample_freq'] is None):
+                    # Don't put --resample-method in settings output
+                    # unless --resample-freq is set
+                    continue
+                if (a in ('output_format', 'output_dtype')) and (args_dict['output_format'] == 'text'):
+                    # Don't put --output-format and --output-dtype in
+                    # settings output unless a binary format is used
+                    continue
+                if (a == 'interval_padding') and (not args_dict['analyze_intervals']):
+                    # Don't put --interval-padding in settings output
+                    # unless --analyze-intervals is set
+                    continue
+                if (a == 'precision') and (val == 'float64'):
+                    # Don't put --precision in settings output unless
+                    # single precision is used
+                    continue
 
                 # Print argument in output settings file
                 if isinstance(val, list):
@@ -254,6 +359,9 @@ class CLI(object):
                     elif a == 'include_empty_labels':
                         if val:
                             print('--include-empty-labels', file=oset)
+                    elif a == 'analyze_intervals':
+                        if val:
+                            print('--analyze-intervals', file=oset)
                     elif a == 'kill_octave_jumps':
                         if val:
                             print('--kill-octave-jumps', file=oset)
@@ -284,11 +392,24 @@ class CLI(object):
                     print('--{} {}'.format(a.replace('_', '-'), val), file=oset)
 
     def process(self):
+        if self.args.profile is not None:
+            profiling.enable()
+        try:
+            self._process_and_write_settings()
+        finally:
+            profiler = profiling.disable()
+        if profiler is not None:
+            profiler.write_report(self.args.profile)
+
+    def _process_and_write_settings(self):
         use_stdout = self.args.output_filepath in (None, '-')
-        if use_stdout:
-            of = sys.stdout
+        if self.args.output_format == 'text':
+            # Same buffered stream for stdout and file output, so the line
+            # endings are written the same way to both
+            of = OutputStream(None if use_stdout else self.args.output_filepath)
         else:
-            of = open(self.args.output_filepath, 'w')
+            # The binary output writers open the file themselves
+            of = None
         try:
             self._process(of)
         except:
@@ -312,11 +433,10 @@ class CLI(object):
                 # Write settings to file
                 self._write_settings(args_dict, output_settings_path)
         finally:
-            if not use_stdout:
+            if of is not None:
                 of.close()
-                remove_empty_lines_from_file(self.args.output_filepath)
 
-    def _process(self, of):
+    def _data_fields(self):
         # Data fields to be printed to output
         data_fields = []
         for m in self.args.measurements:
@@ -329,13 +449,36 @@ class CLI(object):
                     data_fields.append('pB' + str(i))
             else:
                 data_fields.append(m)
+        return data_fields
+
+    def _process(self, of):
+        data_fields = self._data_fields()
+
+        if self.args.output_format != 'text':
+            output = output_writer(
+                self.args.output_format, self.args.output_filepath,
+                data_fields,
+                self.args.use_textgrid and self.args.include_labels,
+                dtype=self.args.output_dtype)
+            try:
+                self._process_wavfiles_to(output, data_fields)
+            finally:
+                output.close()
+            return
 
         if self.args.output_delimiter == 'comma':
-            output = csv.writer(of, dialect=csv.excel)
+            dialect = csv.excel
         elif self.args.output_delimiter == 'tab':
-            output = csv.writer(of, dialect=csv.excel_tab)
+            dialect = csv.excel_tab
         else: # pragma: no cover
             raise ValueError('Unknown output delimiter {}'.format(self.args.output_delimiter))
+        if of.native_line_endings:
+            # Output files have the line endings of the platform, and no
+            # trailing whitespace
+            dialect = native_dialect(dialect)
+        output = TextWriter(of, dialect,
+                            self.args.use_textgrid and self.args.include_labels,
+                            self.args.NaN, rstrip=of.native_line_endings)
 
         output.writerow(
             self._assemble_fields(
@@ -344,147 +487,629 @@ class CLI(object):
                 offset='t_ms',
                 data=data_fields
             ))
+        self._process_wavfiles_to(output, data_fields)
+
+    def _process_wavfiles_to(self, output, data_fields):
+        """Process all sound files, and write their tables with output"""
+        wavfiles = self.args.wavfiles
+        jobs = min(self.args.jobs, len(wavfiles))
+        if jobs > 1:
+            # Each batch of sound files is processed in a worker process.
+            # imap hands the results back in the order of the input files,
+            # so the output is identical to a serial run.
+            batch_size = min(self.args.batch_size,
+                             -(-len(wavfiles) // jobs))
+            pool = multiprocessing.Pool(jobs, _init_worker, (self,))
+            try:
+                for results, records in pool.imap(
+                        _process_wavfiles_job, _batches(wavfiles, batch_size)):
+                    profiling.merge(records)
+                    for notes, table in results:
+                        self._write_wavfile_table(output, notes, table)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            try:
+                for batch in _batches(wavfiles, self.args.batch_size):
+                    for notes, table in self._process_wavfiles(batch,
+                                                               data_fields):
+                        self._write_wavfile_table(output, notes, table)
+            finally:
+                if self._thread_pool is not None:
+                    self._thread_pool.close()
+                    self._thread_pool.join()
+                    self._thread_pool = None
+
+    def _process_wavfiles(self, wavfiles, data_fields):
+        """Generate the notes and output table for each of wavfiles"""
+        batch = wavfiles
+        if self.args.use_textgrid and self.args.analyze_intervals:
+            # Sound files with a TextGrid are analyzed by segments instead,
+            # except by Praat (see whole_file_measurements)
+            batch = [w for w in wavfiles
+                     if not os.path.exists(SoundFile(w).tgpath)]
+        self._praat_batch_results = self._praat_batch(wavfiles)
+        self._snack_batch_results = self._snack_batch(batch)
+        try:
+            for wavfile in wavfiles:
+                yield self._process_wavfile(wavfile, data_fields)
+        finally:
+            self._praat_batch_results = {}
+            self._snack_batch_results = {}
+
+    def _praat_batch(self, wavfiles):
+        """Compute raw Praat estimates for wavfiles with one Praat process
 
-        for wavfile in self.args.wavfiles:
-            self._cached_results.clear()
-            self._cached_measurement_keys.clear()
+        Returns a dictionary mapping each of wavfiles to the (pitch_raw,
+        formants_raw) tuple returned by praat_raw_batch, or an empty
+        dictionary if no batch analysis was done.
+        """
+        measure_pitch, measure_formants = self._praat_measurements()
+        wavfiles = self._uncached(wavfiles, [m for m, needed in
+                                             (('praatF0', measure_pitch),
+                                              ('praatFormants', measure_formants))
+                                             if needed])
+        if (len(wavfiles) < 2 or self.args.resample_freq is not None or
+                not (measure_pitch or measure_formants)):
+            return {}
+        from .praat import praat_raw_batch
+        try:
+            with profiling.stage('praat batch'):
+                results = praat_raw_batch(
+                    wavfiles, self.args.praat_path,
+                    measure_pitch=measure_pitch,
+                    measure_formants=measure_formants,
+                    frame_shift=self.args.frame_shift,
+                    window_size=self.args.window_size,
+                    method=self.args.praat_f0_method,
+                    min_pitch=self.args.praat_min_f0,
+                    max_pitch=self.args.praat_max_f0,
+                    silence_threshold=self.args.silence_threshold,
+                    voice_threshold=self.args.voice_threshold,
+                    octave_cost=self.args.octave_cost,
+                    octave_jumpcost=self.args.octave_jumpcost,
+                    voiced_unvoiced_cost=self.args.voiced_unvoiced_cost,
+                    kill_octave_jumps=self.args.kill_octave_jumps,
+                    interpolate=self.args.interpolate,
+                    smooth=self.args.smooth,
+                    smooth_bandwidth=self.args.smooth_bandwidth,
+                    num_formants=self.args.num_formants,
+                    max_formant_freq=self.args.max_formant_freq)
+        except (OSError, IOError, ValueError):
+            # Let the per-file analysis report the problem
+            return {}
+        return dict(zip(wavfiles, results))
+
+    def _snack_batch(self, wavfiles):
+        """Compute raw Snack estimates for wavfiles with one Tcl shell
+
+        Returns a dictionary mapping each of wavfiles to the (pitch_raw,
+        formants_raw) tuple returned by snack_raw_batch_tcl, or an empty
+        dictionary if no batch analysis was done.
+        """
+        measure_pitch, measure_formants = self._snack_measurements()
+        wavfiles = self._uncached(wavfiles, [m for m, needed in
+                                             (('snackF0', measure_pitch),
+                                              ('snackFormants', measure_formants))
+                                             if needed])
+        # A single file is worth a batch if it saves a second Tcl shell
+        if (self.args.snack_method != 'tcl' or
+                self.args.resample_freq is not None or
+                not (measure_pitch or measure_formants) or
+                (len(wavfiles) < 2 and not (measure_pitch and measure_formants))):
+            return {}
+        from .snack import snack_raw_batch_tcl
+        try:
+            with profiling.stage('snack batch'):
+                results = snack_raw_batch_tcl(
+                    wavfiles, self.args.tcl_cmd,
+                    measure_pitch=measure_pitch,
+                    measure_formants=measure_formants,
+                    frame_shift=self.args.frame_shift,
+                    window_size=self.args.window_size,
+                    max_pitch=self.args.snack_max_f0,
+                    min_pitch=self.args.snack_min_f0,
+                    pre_emphasis=self.args.pre_emphasis,
+                    lpc_order=self.args.lpc_order)
+        except (OSError, IOError, ValueError):
+            # Let the per-file analysis report the problem
+            return {}
+        return dict(zip(wavfiles, results))
+
+    def _uncached(self, wavfiles, measurements):
+        """Return the wavfiles lacking a cached result for one of measurements"""
+        if self._cache is None:
+            return wavfiles
+        return [w for w in wavfiles
+                if not all(self._cache_key(w, m) in self._cache
+                           for m in measurements)]
+
+    def _cache_key(self, wavpath, measurement):
+        """Return the measurement cache key for measurement of wavpath"""
+        names = list(self.measurement_params[measurement])
+        if self.args.resample_freq is not None:
+            names.extend(['resample_freq', 'resample_method'])
+        if (self.args.precision != 'float64' and
+                'wavdata' in self.measurement_inputs[measurement]):
+            # Keys for the default precision are the same as before
+            # --precision existed
+            names.append('precision')
+        params = [(a, getattr(self.args, a)) for a in names]
+        return self._cache.key(wavpath, measurement, params)
+
+    def _dependencies(self, measurement):
+        """Return the measurements whose results measurement uses"""
+        aliases = {'F0': self.args.f0, 'formants': self.args.formants}
+        return [aliases.get(i, i) for i in self.measurement_inputs[measurement]
+                if i not in ('wavpath', 'wavdata')]
+
+    def _required_measurements(self, measurements, available=None):
+        """Return measurements and the measurements they depend on
+
+        The list is in an order in which the measurements can be computed.
+        The dependencies of a measurement for which available(measurement)
+        is true aren't included.
+        """
+        order = []
+        def visit(measurement, path):
+            if measurement in order:
+                return
+            if measurement in path:
+                raise ValueError('Circular dependency of measurement '
+                                 '{}'.format(measurement))
+            if available is None or not available(measurement):
+                for m in self._dependencies(measurement):
+                    visit(m, path + [measurement])
+            order.append(measurement)
+        for measurement in measurements:
+            visit(measurement, [])
+        return order
+
+    def _compute_measurements(self, soundfile, measurements=None,
+                              results=None):
+        """Compute measurements for soundfile
+
+        measurements defaults to the requested measurements, and results is
+        an optional dictionary with the results of measurements that are
+        already known.  Returns a dictionary with the result of each
+        measurement that was needed, i.e. measurements and the measurements
+        they depend on.  Results are taken from the persistent measurement
+        cache, if it is enabled.  The remaining measurements are grouped into
+        tasks, which are run as soon as the measurements they depend on are
+        available, several at a time with --threads.
+        """
+        if measurements is None:
+            measurements = self.args.measurements
+        results = {} if results is None else dict(results)
+        def cached(measurement):
+            if measurement in results:
+                return True
+            if self._cache is None:
+                return False
+            with profiling.stage('cache', soundfile.wavfn):
+                result = self._cache.get(
+                    self._cache_key(soundfile.wavpath, measurement))
+            if result is None:
+                return False
+            results[measurement] = result
+            return True
+        order = self._required_measurements(measurements, cached)
+        tasks = self._tasks([m for m in order if m not in results])
+        while tasks:
+            ready = [t for t in tasks
+                     if all(d in results or d in t[0]
+                            for m in t[0] for d in self._dependencies(m))]
+            for names, values in self._run_tasks(ready, soundfile):
+                for name, result in zip(names, values):
+                    results[name] = result
+                    if self._cache is not None:
+                        with profiling.stage('cache', soundfile.wavfn):
+                            self._cache.put(
+                                self._cache_key(soundfile.wavpath, name),
+                                result)
+            tasks = [t for t in tasks if t not in ready]
+        return results
 
-            if self.args.resample_freq is None:
-                soundfile = SoundFile(wavfile)
-                # Length of all measurement vectors written to output
-                self.data_len = np.int_(np.floor(soundfile.ns / soundfile.fs / self.args.frame_shift * 1000))
+    def _tasks(self, measurements):
+        """Group measurements into tasks
+
+        Returns a list of (names, function) tuples, where function computes
+        the measurements in names for a sound file, and returns their results
+        in a sequence.
+        """
+        joint = {}
+        for names, wrapper in self.joint_measurements:
+            if all(m in measurements for m in names):
+                for m in names:
+                    joint[m] = (names, getattr(self, wrapper))
+        tasks = []
+        for m in measurements:
+            task = joint.get(m, ((m,), self._single_measurement(m)))
+            if task not in tasks:
+                tasks.append(task)
+        return tasks
+
+    def _single_measurement(self, measurement):
+        compute_measurement = self._algorithm(measurement)
+        return lambda soundfile: (compute_measurement(soundfile),)
+
+    def _run_tasks(self, tasks, soundfile):
+        """Run tasks for soundfile, and return (names, results) for each"""
+        if profiling.enabled():
+            tasks = [(names, _profiled_task(names, f, soundfile.wavfn))
+                     for names, f in tasks]
+        if self.args.threads == 1 or len(tasks) < 2:
+            return [(names, f(soundfile)) for names, f in tasks]
+        # Decode the samples once, or compute the resampled sound and write
+        # it to a file if it is read from a file, before the threads need it
+        inputs = set(i for names, _ in tasks for m in names
+                     for i in self.measurement_inputs[m])
+        if soundfile.fs_rs is not None:
+            if 'wavpath' in inputs:
+                soundfile.wavpath_rs
+            elif 'wavdata' in inputs:
+                soundfile.wavdata_rs
+        elif 'wavdata' in inputs:
+            soundfile.wavdata
+        if self._thread_pool is None:
+            from multiprocessing.pool import ThreadPool
+            self._thread_pool = ThreadPool(self.args.threads)
+        # The in-process Snack session can only be used in the thread that
+        # created it, i.e. the main thread
+        main_thread = self.args.snack_method == 'python'
+        async_results = []
+        for names, f in tasks:
+            if main_thread and any(m.startswith('snack') for m in names):
+                async_results.append(None)
             else:
-                soundfile = SoundFile(wavfile, resample_freq=self.args.resample_freq)
-                # Length of all measurement vectors written to output
-                self.data_len = np.int_(np.floor(soundfile.ns_rs / soundfile.fs_rs / self.args.frame_shift * 1000))
-
-            results = {}
-            # Compute default F0 for parameters dependent on F0
-            results[self.args.f0] = self._algorithm(self.args.f0)(soundfile)
-            # Compute default formants for parameters dependent on formants
-            formant_results = self._algorithm(self.args.formants)(soundfile)
-            for k in formant_results:
-                results[k] = formant_results[k]
-            # Compute other measurements
-            for measurement in self.args.measurements:
-                # Check if result previously cached
-                if measurement in self._cached_results:
-                    results[measurement] = self._cached_results[measurement]
-                elif measurement in self._cached_measurement_keys:
-                    for k in self._cached_measurement_keys[measurement]:
-                        results[k] = self._cached_results[k]
-                # Otherwise, compute measurement
-                else:
-                    compute_measurement = self._algorithm(measurement)
-                    computed_result = compute_measurement(soundfile)
-                    if isinstance(computed_result, dict):
-                        # Case of multiple measurements in dictionary
-                        for k in computed_result:
-                            results[k] = computed_result[k]
-                    else:
-                        # Case of single measurement vector
-                        results[measurement] = computed_result
-
-            # end_time is time for last sample in seconds
-            # Time starts at zero
-            beg_time = 0
-            if self.args.resample_freq is None:
-                end_time = soundfile.ns / soundfile.fs
+                async_results.append(
+                    self._thread_pool.apply_async(f, (soundfile,)))
+        return [(names, f(soundfile) if r is None else r.get())
+                for (names, f), r in zip(tasks, async_results)]
+
+    def _praat_measurements(self):
+        """Return whether Praat F0 and Praat formants need to be computed"""
+        return 'praatF0' in self._required, 'praatFormants' in self._required
+
+    def _snack_measurements(self):
+        """Return whether Snack F0 and Snack formants need to be computed"""
+        return 'snackF0' in self._required, 'snackFormants' in self._required
+
+    def _write_wavfile_table(self, output, notes, table):
+        if notes:
+            # The notes go to stdout, which may also be the output stream,
+            # so keep them in order with the rows written before
+            output.flush()
+            for note in notes:
+                # XXX covert this to use logging.
+                print(note)
+            sys.stdout.flush()
+        with profiling.stage('write', table.filename):
+            output.write(table)
+
+    def _process_wavfile(self, wavfile, data_fields):
+        """Compute the requested measurements for a single sound file
+
+        Returns a list of notes to print for the user and an OutputTable
+        with the output rows for the sound file.
+        """
+        if self.args.resample_freq is None:
+            soundfile = SoundFile(wavfile, precision=self.args.precision)
+            # Length of all measurement vectors written to output
+            self.data_len = np.int_(np.floor(soundfile.ns / soundfile.fs / self.args.frame_shift * 1000))
+        else:
+            soundfile = SoundFile(wavfile, resample_freq=self.args.resample_freq,
+                                  resample_method=self.args.resample_method,
+                                  precision=self.args.precision)
+            # Length of all measurement vectors written to output
+            self.data_len = np.int_(np.floor(soundfile.ns_rs / soundfile.fs_rs / self.args.frame_shift * 1000))
+
+        try:
+            return self._process_soundfile(soundfile, data_fields)
+        finally:
+            # Cleanup: remove wav file corresponding to resample,
+            #          if one was written
+            soundfile.cleanup()
+            if self._snack_session is not None:
+                self._snack_session.clear()
+
+    def _process_soundfile(self, soundfile, data_fields):
+        notes = []
+
+        # end_time is time for last sample in seconds
+        # Time starts at zero
+        beg_time = 0
+        if self.args.resample_freq is None:
+            end_time = soundfile.ns / soundfile.fs
+        else:
+            end_time = soundfile.ns_rs / soundfile.fs_rs
+        # Determine intervals
+        # Intervals are expressed in seconds
+        use_textgrid = self.args.use_textgrid and soundfile.textgrid
+        if use_textgrid:
+            intervals = soundfile.textgrid_intervals
+        else:
+            if self.args.use_textgrid:
+                notes.append("Found no TextGrid for {}, reporting all"
+                             " data".format(soundfile.wavfn))
+            intervals = (('no textgrid', beg_time, end_time),)
+
+        frame_shift = self.args.frame_shift
+        table_intervals = []
+        interval_frames = []
+        for (label, start, stop) in intervals:
+            if label in self.args.ignore_label:
+                continue
+            if not label.strip() and not self.args.include_empty_labels:
+                continue
+            # Convert intervals from seconds to frame number
+            fstart = np.int_(round_half_away_from_zero(start * 1000 / frame_shift))
+            fstop = min(np.int_(round_half_away_from_zero(stop * 1000 / frame_shift)),
+                        np.int_(np.floor(end_time * 1000 / frame_shift)))
+            if not self.args.time_starts_at_zero:
+                fstart = fstart + 1
+                fstop = fstop + 1
+            if self.args.include_interval_endpoint:
+                fstop = fstop + 1
+            s = np.arange(fstart, fstop, dtype=np.int_)
+            interval_frames.append(s)
+            # Intervals are output in milliseconds
+            table_intervals.append((label, start * 1000, stop * 1000, len(s)))
+        if interval_frames:
+            frames = np.concatenate(interval_frames)
+        else:
+            frames = np.zeros(0, dtype=np.int_)
+
+        if use_textgrid and self.args.analyze_intervals:
+            measurements = self._compute_interval_measurements(
+                soundfile, interval_frames)
+        else:
+            measurements = self._compute_measurements(soundfile)
+        results = {}
+        for measurement, result in measurements.items():
+            if isinstance(result, dict):
+                # Case of multiple measurements in dictionary
+                results.update(result)
             else:
-                end_time = soundfile.ns_rs / soundfile.fs_rs
-            # Determine intervals
-            # Intervals are expressed in seconds
-            if self.args.use_textgrid and soundfile.textgrid:
-                intervals = soundfile.textgrid_intervals
+                # Case of single measurement vector
+                results[measurement] = result
+
+        # Measurement values for each frame, NaN past the end of the vector
+        data = []
+        for x in data_fields:
+            # No results if no interval was analyzed
+            vector = np.asarray(results.get(x, ()), dtype=np.float64)
+            values = np.full(len(frames), np.nan)
+            valid = frames < len(vector)
+            values[valid] = vector[frames[valid]]
+            data.append(values)
+
+        table = OutputTable(soundfile.wavfn, table_intervals,
+                            frames * frame_shift, data)
+        return notes, table
+
+    def _interval_segments(self, interval_frames, fs):
+        """Group the frames of the output intervals into segments to analyze
+
+        interval_frames is a list with the frame numbers of each output
+        interval, and fs the sampling rate of the analyzed sound.  The
+        frames of each interval are extended by --interval-padding on both
+        sides, and intervals whose extended frames overlap or touch are
+        analyzed together.  Segments start at a frame whose time is a whole
+        number of samples, so that the frames of a segment are at the same
+        samples as in the whole sound file.  Returns a list of (first, stop,
+        frames) tuples, one for each segment, where first is the first frame
+        of the segment, stop the frame after its last one, and frames the
+        frame numbers of the output intervals in it.
+        """
+        frame_shift = self.args.frame_shift
+        padding = int(np.ceil(self.args.interval_padding / frame_shift))
+        # Number of frames between frames that start on a sample
+        align = 1000 // gcd(fs * frame_shift, 1000)
+        ranges = sorted((max(0, f[0] - padding) // align * align,
+                         f[-1] + 1 + padding, f)
+                        for f in interval_frames if len(f))
+        segments = []
+        for first, stop, frames in ranges:
+            if segments and first <= segments[-1][1]:
+                prev_first, prev_stop, prev_frames = segments[-1]
+                segments[-1] = (prev_first, max(prev_stop, stop),
+                                prev_frames + [frames])
             else:
-                if self.args.use_textgrid:
-                    # XXX covert this to use logging.
-                    print("Found no TextGrid for {}, reporting all"
-                          " data".format(soundfile.wavfn))
-                intervals = (('no textgrid', beg_time, end_time),)
-
-            frame_shift = self.args.frame_shift
-            for (label, start, stop) in intervals:
-                if label in self.args.ignore_label:
-                    continue
-                if not label.strip() and not self.args.include_empty_labels:
-                    continue
-                # Convert intervals from seconds to frame number
-                fstart = np.int_(round_half_away_from_zero(start * 1000 / frame_shift))
-                fstop = min(np.int_(round_half_away_from_zero(stop * 1000 / frame_shift)),
-                            np.int_(np.floor(end_time * 1000 / frame_shift)))
-                if not self.args.time_starts_at_zero:
-                    fstart = fstart + 1
-                    fstop = fstop + 1
-                # Print intervals in milliseconds
-                start_str = format(start * 1000, '.3f')
-                stop_str = format(stop * 1000, '.3f')
-                if self.args.include_interval_endpoint:
-                    fstop = fstop + 1
-                for s in range(fstart, fstop):
-                    output.writerow(
-                        self._assemble_fields(
-                            filename=soundfile.wavfn,
-                            textgrid_data=[label, start_str, stop_str],
-                            offset=format(s * frame_shift, 'd'),
-                            data=[self._get_value(results[x], s)
-                                  for x in data_fields]
-                        ))
-            # Cleanup: remove wav file corresponding to resample,
-            #          if necessary
-            if self.args.resample_freq is not None:
-                os.remove(soundfile.wavpath_rs)
+                segments.append((first, stop, [frames]))
+        return [(first, stop, np.concatenate(frames))
+                for first, stop, frames in segments]
+
+    def _compute_interval_measurements(self, soundfile, interval_frames):
+        """Compute the measurements for the output intervals of soundfile
+
+        Instead of analyzing the whole sound file, each segment returned
+        by _interval_segments is analyzed on its own with
+        _compute_measurements, and the measurement values for the frames
+        of the output intervals are put into vectors for the whole sound
+        file.  The values of all other frames are NaN.  The
+        whole_file_measurements are computed for the whole sound file, and
+        the segments use the part of their results for the segment's
+        frames.  Returns a dictionary like _compute_measurements.
+        """
+        frame_shift = self.args.frame_shift
+        if soundfile.fs_rs is None:
+            fs = soundfile.fs
+        else:
+            fs = soundfile.fs_rs
+        if not interval_frames:
+            # No interval is in the output, so there is nothing to analyze
+            return {}
+        data_len = self.data_len
+        results = {}
+        def stitch(target, name, vector, first, frames):
+            vector = np.asarray(vector, dtype=np.float64)
+            if name not in target:
+                # Vectors for the whole sound file have the length they
+                # would have when analyzing the whole sound file
+                target[name] = np.full(data_len + len(vector) - self.data_len,
+                                       np.nan)
+            whole = target[name]
+            frames = frames[(frames - first < len(vector)) &
+                            (frames < len(whole))]
+            whole[frames] = vector[frames - first]
+        def part(vector, first):
+            # The values of a segment's frames in a whole sound file vector,
+            # with as many values past the segment's data_len as the whole
+            # vector has past data_len
+            vector = np.asarray(vector)
+            return vector[first:first + self.data_len + len(vector) - data_len]
+        whole_file = [m for m in self.whole_file_measurements
+                      if m in self._required]
+        if whole_file:
+            whole_results = self._compute_measurements(soundfile, whole_file)
+            all_frames = np.concatenate(interval_frames)
+            for measurement, result in whole_results.items():
+                if isinstance(result, dict):
+                    target = results.setdefault(measurement, {})
+                    for name, vector in result.items():
+                        stitch(target, name, vector, 0, all_frames)
+                else:
+                    stitch(results, measurement, result, 0, all_frames)
+        else:
+            whole_results = {}
+        if all(m in whole_results for m in self.args.measurements):
+            # Nothing is left to analyze by segments
+            return results
+        segments = [(soundfile.segment(first * frame_shift / 1000,
+                                       stop * frame_shift / 1000),
+                     first, frames)
+                    for first, stop, frames
+                    in self._interval_segments(interval_frames, fs)]
+        snack_batch_results = self._snack_batch_results
+        try:
+            self._segment_batches([segment for segment, _, _ in segments])
+            for segment, first, frames in segments:
+                if segment.fs_rs is None:
+                    self.data_len = np.int_(np.floor(
+                        segment.ns / segment.fs / frame_shift * 1000))
+                else:
+                    self.data_len = np.int_(np.floor(
+                        segment.ns_rs / segment.fs_rs / frame_shift * 1000))
+                known = {}
+                for measurement, result in whole_results.items():
+                    if isinstance(result, dict):
+                        known[measurement] = dict(
+                            (name, part(vector, first))
+                            for name, vector in result.items())
+                    else:
+                        known[measurement] = part(result, first)
+                measurements = self._compute_measurements(segment,
+                                                          results=known)
+                # Remove the segment's wav files as soon as possible
+                segment.cleanup()
+                for measurement, result in measurements.items():
+                    if measurement in whole_results:
+                        continue
+                    if isinstance(result, dict):
+                        target = results.setdefault(measurement, {})
+                        for name, vector in result.items():
+                            stitch(target, name, vector, first, frames)
+                    else:
+                        stitch(results, measurement, result, first, frames)
+        finally:
+            self.data_len = data_len
+            self._snack_batch_results = snack_batch_results
+            for segment, _, _ in segments:
+                segment.cleanup()
+        return results
+
+    def _segment_batches(self, segments):
+        """Compute the batch results for segments, when they are analyzed by
+        Snack running as a separate program
+
+        All the segments of a sound file are analyzed with a single Snack
+        process, as a batch of sound files is by _process_wavfiles.  (Praat
+        analyzes the whole sound file, see whole_file_measurements.)
+        """
+        if (not any(self._snack_measurements()) or
+                self.args.resample_freq is not None):
+            return
+        wavpaths = [segment.wavpath for segment in segments]
+        self._snack_batch_results = self._snack_batch(wavpaths)
 
     #
     # Algorithm wrappers.
     #
 
     def DO_snackF0(self, soundfile):
-        from .snack import snack_pitch
+        from .snack import snack_pitch, snack_pitch_from_raw
+        pitch_raw, _ = self._snack_batch_results.get(soundfile.wavpath,
+                                                     (None, None))
         if soundfile.fs_rs is None:
              wavpath = soundfile.wavpath
         else:
              wavpath = soundfile.wavpath_rs
-        F0, V = snack_pitch(wavpath,
-                            self.args.snack_method,
-                            self.data_len,
-                            frame_shift=self.args.frame_shift,
-                            window_size=self.args.window_size,
-                            min_pitch=self.args.snack_min_f0,
-                            max_pitch=self.args.snack_max_f0,
-                            tcl_shell_cmd=self.args.tcl_cmd
-                            )
+        if pitch_raw is not None:
+            F0_raw, V_raw = pitch_raw
+            F0, V = snack_pitch_from_raw(F0_raw, V_raw, self.data_len,
+                                         frame_shift=self.args.frame_shift,
+                                         window_size=self.args.window_size)
+        else:
+            F0, V = snack_pitch(wavpath,
+                                self.args.snack_method,
+                                self.data_len,
+                                frame_shift=self.args.frame_shift,
+                                window_size=self.args.window_size,
+                                min_pitch=self.args.snack_min_f0,
+                                max_pitch=self.args.snack_max_f0,
+                                tcl_shell_cmd=self.args.tcl_cmd,
+                                snack_session=self._get_snack_session()
+                                )
 
-        self._cached_results['snackF0'] = F0
         return F0
 
     def DO_praatF0(self, soundfile):
-        from .praat import praat_pitch
+        from .praat import praat_pitch, praat_pitch_from_raw
+        pitch_raw, _ = self._praat_batch_results.get(soundfile.wavpath,
+                                                     (None, None))
         if soundfile.fs_rs is None:
              wavpath = soundfile.wavpath
         else:
              wavpath = soundfile.wavpath_rs
-        F0 = praat_pitch(wavpath, self.data_len,
-                         self.args.praat_path,
-                         frame_shift=self.args.frame_shift,
-                         method=self.args.praat_f0_method,
-                         frame_precision=self.args.frame_precision,
-                         min_pitch=self.args.praat_min_f0,
-                         max_pitch=self.args.praat_max_f0,
-                         silence_threshold=self.args.silence_threshold,
-                         voice_threshold=self.args.voice_threshold,
-                         octave_cost=self.args.octave_cost,
-                         octave_jumpcost=self.args.octave_jumpcost,
-                         voiced_unvoiced_cost=self.args.voiced_unvoiced_cost,
-                         kill_octave_jumps=self.args.kill_octave_jumps,
-                         interpolate=self.args.interpolate,
-                         smooth=self.args.smooth,
-                         smooth_bandwidth=self.args.smooth_bandwidth)
-
-        self._cached_results['praatF0'] = F0
+        if pitch_raw is not None:
+            t_raw, F0_raw = pitch_raw
+            F0 = praat_pitch_from_raw(t_raw, F0_raw, self.data_len,
+                                      frame_shift=self.args.frame_shift,
+                                      frame_precision=self.args.frame_precision)
+        else:
+            F0 = praat_pitch(wavpath, self.data_len,
+                             self.args.praat_path,
+                             frame_shift=self.args.frame_shift,
+                             method=self.args.praat_f0_method,
+                             frame_precision=self.args.frame_precision,
+                             min_pitch=self.args.praat_min_f0,
+                             max_pitch=self.args.praat_max_f0,
+                             silence_threshold=self.args.silence_threshold,
+                             voice_threshold=self.args.voice_threshold,
+                             octave_cost=self.args.octave_cost,
+                             octave_jumpcost=self.args.octave_jumpcost,
+                             voiced_unvoiced_cost=self.args.voiced_unvoiced_cost,
+                             kill_octave_jumps=self.args.kill_octave_jumps,
+                             interpolate=self.args.interpolate,
+                             smooth=self.args.smooth,
+                             smooth_bandwidth=self.args.smooth_bandwidth)
+
         return F0
 
     def DO_shrF0(self, soundfile):
+        SHR, F0 = self._shr_pitch(soundfile)
+        return F0
+
+    def _shr_pitch_and_SHR(self, soundfile):
+        SHR, F0 = self._shr_pitch(soundfile)
+        return F0, SHR
+
+    def _shr_pitch(self, soundfile):
         from .shrp import shr_pitch
         if soundfile.fs_rs is None:
              wavdata = soundfile.wavdata
@@ -501,9 +1126,7 @@ class CLI(object):
                             frame_precision=self.args.frame_precision,
                             )
 
-        self._cached_results['shrF0'] = F0
-        self._cached_results['SHR'] = SHR
-        return F0
+        return SHR, F0
 
     def DO_reaperF0(self, soundfile):
         from .reaper import reaper_pitch
@@ -517,54 +1140,102 @@ class CLI(object):
                           hilbert_transform=self.args.use_hilbert_transform,
                           inter_mark=self.args.inter_mark)
 
-        self._cached_results['reaperF0'] = F0
         return F0
 
     def DO_snackFormants(self, soundfile):
-        from .snack import snack_formants
+        from .snack import snack_formants, snack_formants_from_raw
+        _, formants_raw = self._snack_batch_results.get(soundfile.wavpath,
+                                                        (None, None))
         if soundfile.fs_rs is None:
              wavpath = soundfile.wavpath
         else:
              wavpath = soundfile.wavpath_rs
-        estimates = snack_formants(wavpath,
-                                   self.args.snack_method,
-                                   self.data_len,
-                                   frame_shift=self.args.frame_shift,
-                                   window_size=self.args.window_size,
-                                   pre_emphasis=self.args.pre_emphasis,
-                                   lpc_order=self.args.lpc_order,
-                                   tcl_shell_cmd=self.args.tcl_cmd
-                                  )
-
-        self._cached_measurement_keys['snackFormants'] = estimates.keys()
-        for k in estimates:
-            self._cached_results[k] = estimates[k]
+        if formants_raw is not None:
+            estimates = snack_formants_from_raw(
+                formants_raw, self.data_len,
+                frame_shift=self.args.frame_shift,
+                window_size=self.args.window_size)
+        else:
+            estimates = snack_formants(wavpath,
+                                       self.args.snack_method,
+                                       self.data_len,
+                                       frame_shift=self.args.frame_shift,
+                                       window_size=self.args.window_size,
+                                       pre_emphasis=self.args.pre_emphasis,
+                                       lpc_order=self.args.lpc_order,
+                                       tcl_shell_cmd=self.args.tcl_cmd,
+                                       snack_session=self._get_snack_session()
+                                      )
 
         return estimates
 
     def DO_praatFormants(self, soundfile):
-        from .praat import praat_formants
+        from .praat import praat_formants, praat_formants_from_raw
+        _, formants_raw = self._praat_batch_results.get(soundfile.wavpath,
+                                                        (None, None))
         if soundfile.fs_rs is None:
              wavpath = soundfile.wavpath
         else:
              wavpath = soundfile.wavpath_rs
-        estimates = praat_formants(wavpath, self.data_len,
-                                   self.args.praat_path,
-                                   frame_shift=self.args.frame_shift,
-                                   window_size=self.args.window_size,
-                                   frame_precision=self.args.frame_precision,
-                                   num_formants=self.args.num_formants,
-                                   max_formant_freq=self.args.max_formant_freq)
-
-        self._cached_measurement_keys['praatFormants'] = estimates.keys()
-        for k in estimates:
-            self._cached_results[k] = estimates[k]
+        if formants_raw is not None:
+            estimates = praat_formants_from_raw(
+                formants_raw, self.data_len,
+                frame_shift=self.args.frame_shift,
+                frame_precision=self.args.frame_precision)
+        else:
+            estimates = praat_formants(wavpath, self.data_len,
+                                       self.args.praat_path,
+                                       frame_shift=self.args.frame_shift,
+                                       window_size=self.args.window_size,
+                                       frame_precision=self.args.frame_precision,
+                                       num_formants=self.args.num_formants,
+                                       max_formant_freq=self.args.max_formant_freq)
 
         return estimates
 
+    def _get_snack_session(self):
+        """Return the Snack session for this run, if Snack runs in-process"""
+        if self.args.snack_method != 'python':
+            return None
+        if self._snack_session is None:
+            from .snack import SnackSession
+            self._snack_session = SnackSession()
+        return self._snack_session
+
+    def _praat_pitch_and_formants(self, soundfile):
+        from .praat import praat_pitch_and_formants
+        if soundfile.wavpath in self._praat_batch_results:
+            # Computed in advance for the batch of sound files
+            return self.DO_praatF0(soundfile), self.DO_praatFormants(soundfile)
+        if soundfile.fs_rs is None:
+             wavpath = soundfile.wavpath
+        else:
+             wavpath = soundfile.wavpath_rs
+        F0, estimates = praat_pitch_and_formants(
+            wavpath, self.data_len, self.args.praat_path,
+            frame_shift=self.args.frame_shift,
+            window_size=self.args.window_size,
+            method=self.args.praat_f0_method,
+            frame_precision=self.args.frame_precision,
+            min_pitch=self.args.praat_min_f0,
+            max_pitch=self.args.praat_max_f0,
+            silence_threshold=self.args.silence_threshold,
+            voice_threshold=self.args.voice_threshold,
+            octave_cost=self.args.octave_cost,
+            octave_jumpcost=self.args.octave_jumpcost,
+            voiced_unvoiced_cost=self.args.voiced_unvoiced_cost,
+            kill_octave_jumps=self.args.kill_octave_jumps,
+            interpolate=self.args.interpolate,
+            smooth=self.args.smooth,
+            smooth_bandwidth=self.args.smooth_bandwidth,
+            num_formants=self.args.num_formants,
+            max_formant_freq=self.args.max_formant_freq)
+
+        return F0, estimates
+
     def DO_SHR(self, soundfile):
-        self.DO_shrF0(soundfile)
-        return self._cached_results['SHR']
+        SHR, F0 = self._shr_pitch(soundfile)
+        return SHR
 
     _valid_measurements = [x[3:] for x in list(locals()) if x.startswith('DO_')]
     _valid_f0 = [x for x in _valid_measurements if x.endswith('F0')]
@@ -724,6 +1395,28 @@ class CLI(object):
                               "output, so that the upper endpoint is not in "
                               "the reported time points, i.e. [a,b). "
                              "By default, endpoints are excluded.")
+    parser.add_argument('--analyze-intervals', action='store_true',
+                        help="Only analyze the parts of the sound file "
+                             "around the TextGrid intervals that are in the "
+                             "output (see --ignore-label and "
+                             "--include-empty-labels), instead of the whole "
+                             "file.  This is faster when the intervals cover "
+                             "a small part of the recordings.  Measurements "
+                             "near the ends of the analyzed parts may differ "
+                             "slightly from those of the whole file, "
+                             "depending on --interval-padding.  Praat and "
+                             "REAPER measurements (praatF0, praatFormants and "
+                             "reaperF0) are always computed for the whole "
+                             "file, because their frames and pitch tracks "
+                             "depend on all of the analyzed sound.")
+    parser.add_argument('--interval-padding', default=100,
+                        type=parser.nonnegative_int,
+                        help="With --analyze-intervals, the number of "
+                             "milliseconds of sound before and after each "
+                             "interval that are analyzed with it, so that "
+                             "the analysis windows of the frames in the "
+                             "interval are filled.  Default is %(default)s "
+                             "milliseconds.")
 
     parser.set_defaults(include_f0_column=False, include_formant_cols=False,
                         use_textgrid=True, include_labels=True,
@@ -743,6 +1436,24 @@ class CLI(object):
                         choices=_valid_delimiters,
                         help="Delimiter to use for output file.  It defaults "
                              "to %(default)s.")
+    parser.add_argument('--output-format', default='text',
+                        choices=valid_output_formats,
+                        help="Format of the output file.  'text' writes a "
+                             "text table with the delimiter given by "
+                             "--output-delimiter.  'npz' (NumPy), 'hdf5' "
+                             "and 'parquet' write the columns in binary "
+                             "form: the measurements as float columns, the "
+                             "times as integer columns, and the file names "
+                             "and labels as string columns.  Missing values "
+                             "are NaN.  The binary formats require an output "
+                             "file (-o); 'hdf5' requires the Python library "
+                             "h5py, and 'parquet' the Python library "
+                             "pyarrow.  Default is %(default)s.")
+    parser.add_argument('--output-dtype', default='float64',
+                        choices=valid_output_dtypes,
+                        help="Float type of the measurement columns for the "
+                             "binary output formats.  Default is "
+                             "%(default)s.")
     parser.add_argument('--no-output-settings', action="store_false",
                         dest='output_settings',
                         help="Do not write settings file corresponding to "
@@ -762,9 +1473,76 @@ class CLI(object):
                              "if the output file is 'output.txt', the settings "
                              "file path used is 'output.settings').")
     # These options are general settings for the analysis
+    parser.add_argument('-j', '--jobs', default=1, type=parser.positive_int,
+                        help="Number of sound files to process in parallel, "
+                             "each in its own worker process.  The output is "
+                             "the same as for a serial run.  Default is "
+                             "%(default)s.")
+    parser.add_argument('--batch-size', default=16, type=parser.positive_int,
+                        help="Number of sound files to analyze with a single "
+                             "Praat process, or a single Tcl shell process "
+                             "when --snack-method is tcl.  Each file is read "
+                             "once for both the F0 and the formant analysis "
+                             "of a program.  A value of 1 runs Praat and the "
+                             "Tcl shell separately for every file.  Batching "
+                             "is not used with --resample-freq.  Default is "
+                             "%(default)s.")
+    parser.add_argument('--threads', default=1, type=parser.positive_int,
+                        help="Number of measurement algorithms to run at "
+                             "the same time for a sound file, each in its "
+                             "own thread.  Algorithms that don't depend on "
+                             "each other's results are run concurrently, "
+                             "e.g. Praat and Snack analyze a sound file in "
+                             "parallel.  The output is the same as for a "
+                             "serial run.  Default is %(default)s.")
+    parser.add_argument('--cache-dir',
+                        help="Directory for a persistent cache of "
+                             "measurement results.  A result is reused when "
+                             "the same measurement is requested again for a "
+                             "sound file with the same contents and the same "
+                             "measurement parameters, e.g. when a corpus is "
+                             "reanalyzed with another output format or with "
+                             "additional measurements.  The directory is "
+                             "created if it doesn't exist.  By default, no "
+                             "cache is used.")
+    parser.add_argument('--cache-size', default=1024,
+                        type=parser.positive_int,
+                        help="Maximum size of the measurement cache in "
+                             "megabytes.  When the cache grows larger, the "
+                             "least recently used results are removed. "
+                             "Default is %(default)s megabytes.")
+    parser.add_argument('--profile', metavar='REPORT',
+                        help="Record the time and resources used by each "
+                             "stage of the analysis of each sound file "
+                             "(reading and resampling the sound, each "
+                             "measurement algorithm, running and reading "
+                             "the output of Praat, Snack and REAPER, and "
+                             "writing the output), and write a report to "
+                             "the file REPORT at the end of the run: CSV if "
+                             "its name ends with '.csv', JSON otherwise.  "
+                             "The report has the wall time, CPU time, "
+                             "subprocess CPU time, number of subprocesses "
+                             "and peak memory use of each stage.")
     parser.add_argument('--resample-freq', type=parser.positive_int,
                         help="Resample sound files at specified frequency in"
                              " Hz.")
+    parser.add_argument('--resample-method', default='fft',
+                        choices=valid_resample_methods,
+                        help="The algorithm to use for resampling with "
+                             "--resample-freq.  'fft' resamples the whole "
+                             "signal at once using an FFT.  'polyphase' uses "
+                             "a polyphase filter, computed in blocks, which "
+                             "is much faster and uses less memory for long "
+                             "sound files.  Default is %(default)s.")
+    parser.add_argument('--precision', default='float64',
+                        choices=valid_precisions,
+                        help="Floating point precision of the sound data "
+                             "analyzed by the algorithms implemented in "
+                             "Python (currently SHR).  'float32' halves the "
+                             "memory they use, and is faster, at a small "
+                             "cost in accuracy (see "
+                             "tools/compare_precision.py).  Default is "
+                             "%(default)s.")
     parser.add_argument('-f', '--f0', '--F0', default='snackF0',
                         choices=_valid_f0,
                         help="The algorithm to use to compute F0 for use as "
@@ -962,6 +1740,40 @@ class CLI(object):
                              "Default is %(default)s milliseconds.")
 
 
+# Worker process state and entry point for parallel processing (--jobs).
+# These have to be module level functions so that they can be used by
+# multiprocessing.
+
+_worker_cli = None
+
+def _init_worker(cli):
+    global _worker_cli
+    _worker_cli = cli
+    # A forked worker starts with a copy of the main process's profiler
+    profiling.disable()
+    if cli.args.profile is not None:
+        profiling.enable()
+
+def _process_wavfiles_job(wavfiles):
+    # The stages recorded by the worker go back to the main process with
+    # the results
+    results = list(_worker_cli._process_wavfiles(wavfiles,
+                                                 _worker_cli._data_fields()))
+    return results, profiling.take_records()
+
+def _profiled_task(names, f, filename):
+    """Return task function f, recording its calls as a profiling stage"""
+    def task(soundfile):
+        with profiling.stage('+'.join(names), filename):
+            return f(soundfile)
+    return task
+
+def _batches(items, batch_size):
+    """Generate successive lists of at most batch_size of items"""
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+
 if __name__ == '__main__':
     try: # pragma: no cover
         my_cli = CLI()
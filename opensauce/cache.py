@@ -0,0 +1,179 @@
+"""Persistent on-disk cache of measurement results
+
+The cache stores the result of a measurement for a sound file, so that
+reanalyzing a corpus with the same settings doesn't have to run the
+measurement algorithms again.  Entries are addressed by a hash of the
+contents of the sound file, the name of the measurement, and the values of
+the parameters the measurement algorithm uses.  Changing the sound file or
+one of those parameters therefore never returns a stale result.
+
+The total size of the cache is limited.  When it is exceeded, the least
+recently used entries are removed.
+
+"""
+
+# Licensed under Apache v2 (see LICENSE)
+
+from __future__ import division
+
+import errno
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+# Name under which a single measurement vector is stored in an entry file
+_single_name = '__single__'
+# Extension of entry files
+_entry_ext = '.npz'
+
+
+def file_digest(fn, block_size=1 << 20):
+    """Return the SHA-1 hex digest of the contents of file fn"""
+    h = hashlib.sha1()
+    with open(fn, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class MeasurementCache(object):
+
+    def __init__(self, cache_dir, max_size):
+        """Cache of measurement results in directory cache_dir
+
+        max_size is the maximum total size of the entry files in bytes.
+        The directory is created if it doesn't exist.  Several OpenSauce
+        processes can share a cache directory: entries are written to a
+        temporary file and then renamed, so a reader never sees a partial
+        entry.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # Digests of the sound files seen in this run, keyed by path
+        self._digests = {}
+        # Estimated total size of the entries
+        self._size = None
+        try:
+            os.makedirs(cache_dir)
+        except OSError as err:
+            if err.errno != errno.EEXIST or not os.path.isdir(cache_dir):
+                raise
+        # The cache may have been filled with a larger max_size
+        if self.size() > self.max_size:
+            self.evict()
+
+    def key(self, wavpath, name, params):
+        """Return the cache key for measurement name of sound file wavpath
+
+        params is a sequence of (parameter name, value) pairs, with the
+        values of all parameters used to compute the measurement.
+        """
+        st = os.stat(wavpath)
+        stamp = (st.st_size, st.st_mtime)
+        cached = self._digests.get(wavpath)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, file_digest(wavpath))
+            self._digests[wavpath] = cached
+        h = hashlib.sha1()
+        h.update(cached[1].encode('ascii'))
+        h.update(repr((name, sorted(params))).encode('utf-8'))
+        return h.hexdigest()
+
+    def __contains__(self, key):
+        return os.path.exists(self._entry_path(key))
+
+    def get(self, key):
+        """Return the result stored for key, or None if there is none
+
+        The result is either a NumPy vector, or a dictionary of NumPy vectors
+        for measurements that return several vectors.
+        """
+        path = self._entry_path(key)
+        try:
+            with np.load(path) as entry:
+                values = {k: entry[k] for k in entry.files}
+        except (IOError, OSError, ValueError):
+            # Missing, or removed or damaged by another process
+            return None
+        try:
+            # Mark entry as recently used
+            os.utime(path, None)
+        except OSError: # pragma: no cover
+            pass
+        if list(values) == [_single_name]:
+            return values[_single_name]
+        return values
+
+    def put(self, key, result):
+        """Store result for key, and evict old entries if the cache is full"""
+        path = self._entry_path(key)
+        entry_dir = os.path.dirname(path)
+        try:
+            os.makedirs(entry_dir)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        if isinstance(result, dict):
+            values = result
+        else:
+            values = {_single_name: result}
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=entry_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **values)
+            os.rename(tmp_path, path)
+        except OSError:
+            # On Windows, rename fails if another process stored the same
+            # entry in the meantime
+            os.remove(tmp_path)
+            return
+        except:
+            os.remove(tmp_path)
+            raise
+        if self._size is not None:
+            self._size += os.path.getsize(path)
+        if self.size() > self.max_size:
+            self.evict()
+
+    def size(self):
+        """Return the estimated total size of the entries in bytes"""
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_size"""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Already removed by another process
+                pass
+            total -= size
+        self._size = total
+
+    def _entry_path(self, key):
+        # Spread the entries over subdirectories to keep directories small
+        return os.path.join(self.cache_dir, key[:2], key + _entry_ext)
+
+    def _entries(self):
+        """Generate (path, size, last use time) for all cache entries"""
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for fn in filenames:
+                if not fn.endswith(_entry_ext):
+                    continue
+                path = os.path.join(dirpath, fn)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
@@ -25,6 +25,9 @@ def correction_iseli_i(f, F_i, B_i, fs):
         fs     - sampling frequency (Hz)
     Returns:
         corr_i - i-th correction to harmonic amplitude in dB [NumPy vector]
+
+    The correction is computed in the precision of the frequency vectors:
+    float32 vectors give a float32 correction.
     """
     # These variable names are from the Iseli-Alwan paper
     # Normalize frequencies to sampling frequency
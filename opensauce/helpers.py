@@ -6,11 +6,20 @@
 
 from __future__ import division
 
+import os
 import math
 import fileinput
+import tempfile
 
 import numpy as np
 from scipy.io import wavfile
+from scipy.signal import firwin, upfirdn
+
+try:
+    from math import gcd
+except ImportError: # pragma: no cover
+    # Python 2
+    from fractions import gcd
 
 
 def wavread(fn):
@@ -34,25 +43,209 @@ def wavread(fn):
     32767.  (matlab's wavread *can* return the integers, but does not by
     default and voicesauce uses the default).  Consequently, after reading the
     data using scipy's io.wavfile, we convert to float by dividing each integer
-    by 32768.
+    by 32768 (see pcm_to_float).
 
     Also, save the 16-bit integer data in another NumPy vector.
 
     The input WAV file is assumed to be in 16-bit integer PCM format.
     """
+    y, Fs = wavread_int(fn)
+    return pcm_to_float(y), y, Fs
+
+
+def wavread_int(fn, mmap=False):
+    """Read in the samples of a 16-bit integer PCM WAV file as integers
+
+    Args:
+        fn   - filename of WAV file [string]
+        mmap - Whether to memory-map the samples instead of reading them
+               into memory [boolean] (default = False)
+
+    Returns:
+        y_int - Audio samples in int format [NumPy vector]
+        Fs    - Sampling frequency in Hz [integer]
+
+    With mmap=True, y_int is a read-only view of the samples in the file, so
+    the samples are only read from disk when they are used, and the memory
+    is shared with the operating system's file cache.  The file stays
+    mapped as long as y_int (or a view of it) is referenced.
+
+    The input WAV file is assumed to be in 16-bit integer PCM format; an
+    IOError is raised otherwise.
+    """
     # For reference, I figured this out from:
     # http://mirlab.org/jang/books/audiosignalprocessing/matlab4waveRead.asp?title=4-2%20Reading%20Wave%20Files
     # XXX: if we need to handle 8 bit files we'll need to detect them and
     # special case them here.
     try:
-        Fs, y = wavfile.read(fn)
+        Fs, y = wavfile.read(fn, mmap=mmap)
     except ValueError:
-        raise
+        if not mmap:
+            raise
+        # Formats that can't be mapped, e.g. 24-bit PCM, are not supported
+        # anyway; read the file to report the actual problem
+        return wavread_int(fn)
     if y.dtype != 'int16':
         raise IOError('Input WAV file must be in 16-bit integer PCM format')
+    if mmap:
+        # Plain read-only array view of the mapped samples, so that results
+        # computed from it are ordinary arrays, and the samples can be
+        # shared safely
+        y = y.view(np.ndarray)
+        y.flags.writeable = False
+    return y, Fs
+
+
+def pcm_to_float(y_int, start=0, stop=None, dtype=np.float64):
+    """Convert 16-bit integer PCM samples to float samples between -1 and 1
+
+    Args:
+        y_int - Audio samples in int format [NumPy vector]
+        start - Index of the first sample to convert [integer] (default = 0)
+        stop  - Index after the last sample to convert [integer]
+                (default = None, i.e. up to the end)
+        dtype - Float type of the result [NumPy dtype] (default = float64)
+
+    Returns:
+        y_float - Audio samples y_int[start:stop] in float format
+                  [NumPy vector]
+
+    Converting a range of samples gives the same values as converting all
+    samples and taking the range, so long signals can be converted block by
+    block.  16-bit samples are represented exactly in float32 as well.
+    """
+    return np.true_divide(y_int[start:stop], 32768.0, dtype=dtype)
+
+
+def make_scratch_dir():
+    """Create a private directory for intermediate files
+
+    Returns:
+        path - path of the new directory [string]
+
+    The directory is created on a tmpfs (RAM backed) file system if one is
+    available, so that intermediate files passed to external programs don't
+    have to go through the disk.  Otherwise, it is created in the system's
+    default temporary directory.  The directory is only accessible by the
+    current user, and its name is unique, so several OpenSauce processes can
+    use scratch directories at the same time.  The caller is responsible for
+    removing the directory when done with it.
+    """
+    tmpfs_dir = '/dev/shm'
+    if os.path.isdir(tmpfs_dir) and os.access(tmpfs_dir, os.W_OK | os.X_OK):
+        base_dir = tmpfs_dir
+    else:
+        base_dir = None
+
+    return tempfile.mkdtemp(prefix='opensauce-', dir=base_dir)
+
+def resample_polyphase(x, up, down, block_len=65536):
+    """Resample a signal by a rational factor using a polyphase filter
 
-    return y/np.float64(32768.0), y, Fs
+    Args:
+        x         - Signal to resample [NumPy vector]
+        up        - Upsampling factor [integer]
+        down      - Downsampling factor [integer]
+        block_len - Number of output samples computed at a time [integer]
+                    (default = 65536)
+
+    Returns:
+        y - Resampled signal, with ceil(len(x) * up / down) samples
+            [NumPy vector]
+
+    The result is the same as scipy.signal.resample_poly(x, up, down) with
+    its default Kaiser window: the signal is upsampled by up, low-pass
+    filtered with a linear phase FIR filter, and downsampled by down.  Unlike
+    resample_poly, which filters the whole signal at once, the output is
+    computed in blocks of block_len samples, so the memory needed for
+    intermediate results doesn't grow with the length of the signal.  The
+    running time is linear in the length of the signal, whereas FFT based
+    resampling (scipy.signal.resample) can be very slow for signal lengths
+    with large prime factors.
+    """
+    g = gcd(up, down)
+    up //= g
+    down //= g
+    if up == down == 1:
+        return np.array(x, dtype=np.float64)
 
+    n_in = len(x)
+    n_out = -(-n_in * up // down)
+
+    # Design low-pass filter, with cutoff relative to Nyquist frequency
+    # (same design as scipy.signal.resample_poly)
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = firwin(2 * half_len + 1, 1. / max_rate, window=('kaiser', 5.0)) * up
+    # Zero-pad filter to put the output samples at the center
+    n_pre_pad = down - half_len % down
+    n_pre_remove = (half_len + n_pre_pad) // down
+    h = np.concatenate((np.zeros(n_pre_pad), h))
+
+    y = np.zeros(n_out)
+    for k0 in range(0, n_out, block_len):
+        k1 = min(k0 + block_len, n_out)
+        # Positions of the first and last output sample of the block on the
+        # time axis of the upsampled signal
+        n0 = (k0 + n_pre_remove) * down
+        n1 = (k1 - 1 + n_pre_remove) * down
+        # Range of input samples contributing to the output block
+        i0 = max(0, (n0 - len(h)) // up + 1)
+        i1 = min(n_in, n1 // up + 1)
+        if i0 >= i1:
+            continue
+        # Delay the filter, so that the output samples of the block fall on
+        # the grid of samples kept by upfirdn's downsampling
+        shift = (i0 * up) % down
+        h_shift = np.concatenate((np.zeros(shift), h))
+        y_block = upfirdn(h_shift, x[i0:i1], up, down)
+        m0 = (n0 - i0 * up + shift) // down
+        y_block = y_block[m0:m0 + k1 - k0]
+        y[k0:k0 + len(y_block)] = y_block
+
+    return y
+
+def nearest_time_indices(t_raw, t, max_distance):
+    """Find the closest raw measurement time for each output time
+
+    Args:
+        t_raw        - Times of the raw measurements [NumPy vector]
+        t            - Output times to align the measurements to [NumPy vector]
+        max_distance - Largest allowed distance between an output time and
+                       the closest raw measurement time [number]
+
+    Returns:
+        index - For each output time, the index into t_raw of the closest raw
+                measurement time [NumPy vector]
+        valid - For each output time, whether the closest raw measurement
+                time is within max_distance of it [NumPy boolean vector]
+
+    The result is the same as computing np.argmin(np.abs(t_raw - t[i])) for
+    each output time t[i], including the choice of the first index among
+    equally close raw times, but the closest times are found with a binary
+    search instead of by comparing each output time with every raw time.
+    """
+    t_raw = np.asarray(t_raw)
+    t = np.asarray(t)
+    # Stable sort, so that equal raw times stay in order of their index
+    order = np.argsort(t_raw, kind='mergesort')
+    t_sorted = t_raw[order]
+    # Index in order of the first occurrence of each distinct raw time
+    first = np.searchsorted(t_sorted, t_sorted, side='left')
+    # Closest raw times below t and at or above t
+    pos = np.searchsorted(t_sorted, t, side='left')
+    right = np.minimum(pos, len(t_sorted) - 1)
+    left = np.maximum(pos - 1, 0)
+    dist_left = np.abs(t_sorted[left] - t)
+    dist_right = np.abs(t_sorted[right] - t)
+    index_left = order[first[left]]
+    index_right = order[first[right]]
+    # When both are equally close, argmin would return the smaller index
+    use_left = ((dist_left < dist_right) |
+                ((dist_left == dist_right) & (index_left < index_right)))
+    index = np.where(use_left, index_left, index_right)
+    dist = np.where(use_left, dist_left, dist_right)
+    return index, dist <= max_distance
 
 def round_half_away_from_zero(x):
     """Rounds a number according to round half away from zero method
@@ -0,0 +1,343 @@
+"""Writers for the measurement output
+
+The measurement results for each sound file are collected in an OutputTable,
+which holds the output rows by column.  The writers in this module write the
+columns in bulk: the text writer formats the rows of a whole interval at
+once, and the binary writers store the columns as typed arrays, without
+formatting the values as text.
+
+"""
+
+# Licensed under Apache v2 (see LICENSE)
+
+from __future__ import division
+
+import csv
+import io
+import sys
+
+import numpy as np
+
+valid_output_formats = ['text', 'npz', 'hdf5', 'parquet']
+valid_output_dtypes = ['float64', 'float32']
+
+# Python libraries needed for each binary output format
+output_format_libraries = {'hdf5': 'h5py', 'parquet': 'pyarrow'}
+# Size of the buffer for writing text output
+output_buffer_size = 1 << 20
+
+
+class OutputStream(object):
+
+    def __init__(self, path=None, buffer_size=output_buffer_size):
+        """Buffered text stream for writing the output to path, or to
+        standard output if path is None
+
+        A file is written in text mode, so rows that end with '\\n' (see
+        native_dialect) get the native line endings of the platform, and
+        native_line_endings is True.  Standard output gets the line endings
+        written to it as they are, without translation, so the '\\r\\n'
+        line terminator of the csv dialects is written correctly on every
+        platform (a text mode stream on Windows turns it into '\\r\\r\\n',
+        i.e. an empty line after every row).  The stream writes to the
+        binary buffer underneath sys.stdout, unless sys.stdout has been
+        replaced by a stream without one, e.g. a StringIO, which is then
+        written to directly.
+        """
+        self.path = path
+        self.native_line_endings = path is not None
+        # How to close the stream: 'close' a file, 'detach' from the
+        # standard output buffer, or just 'flush' sys.stdout
+        if path is not None:
+            if sys.version_info[0] < 3: # pragma: no cover
+                self.stream = open(path, 'w', buffer_size)
+            else:
+                self.stream = io.open(path, 'w', buffering=buffer_size)
+            self._close = 'close'
+        elif (sys.version_info[0] < 3 or
+                getattr(sys.stdout, 'buffer', None) is None):
+            self.stream = sys.stdout
+            self._close = 'flush'
+        else:
+            sys.stdout.flush()
+            self.stream = io.TextIOWrapper(sys.stdout.buffer,
+                                           encoding=sys.stdout.encoding,
+                                           errors=sys.stdout.errors,
+                                           newline='')
+            self._close = 'detach'
+
+    def write(self, text):
+        self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        """Flush the stream, and close it if it writes to a file"""
+        if self._close == 'close':
+            self.stream.close()
+        elif self._close == 'detach':
+            # Leave sys.stdout.buffer open
+            self.stream.flush()
+            self.stream.detach()
+        else:
+            self.stream.flush()
+
+
+def native_dialect(dialect):
+    """Return a copy of csv dialect whose rows end with '\\n', for writing
+    to a text mode stream that translates it to the native line ending"""
+    class native(dialect):
+        lineterminator = '\n'
+    return native
+
+
+class OutputTable(object):
+
+    def __init__(self, filename, intervals, t_ms, data):
+        """The output rows for the sound file filename
+
+        intervals is a list of (label, start, stop, nrows) tuples, one for
+        each TextGrid interval in the output, where start and stop are the
+        interval endpoints in milliseconds, and nrows is the number of rows
+        for the interval.  t_ms is an integer vector with the time of each
+        row in milliseconds.  data is a list of float vectors, one for each
+        data field, with the measurement value for each row (NaN if there
+        is none).
+        """
+        self.filename = filename
+        self.intervals = intervals
+        self.t_ms = t_ms
+        self.data = data
+
+    def __len__(self):
+        return len(self.t_ms)
+
+    def columns(self, fields, include_labels, dtype='float64'):
+        """Generate (name, vector) for each output column
+
+        fields are the names of the data fields.  The Label, seg_Start and
+        seg_End columns are only included if include_labels is true.  The
+        data columns have type dtype.
+        """
+        nrows = [n for _, _, _, n in self.intervals]
+        yield 'Filename', np.repeat(np.array([self.filename], dtype='U'),
+                                    len(self))
+        if include_labels:
+            yield 'Label', np.repeat(
+                np.array([label for label, _, _, _ in self.intervals],
+                         dtype='U'), nrows)
+            yield 'seg_Start', np.repeat(
+                np.array([start for _, start, _, _ in self.intervals],
+                         dtype=np.float64), nrows)
+            yield 'seg_End', np.repeat(
+                np.array([stop for _, _, stop, _ in self.intervals],
+                         dtype=np.float64), nrows)
+        yield 't_ms', np.asarray(self.t_ms, dtype=np.int64)
+        for name, values in zip(fields, self.data):
+            yield name, np.asarray(values, dtype=dtype)
+
+
+def output_columns(fields, include_labels, dtype='float64'):
+    """Return a list of (name, type) for the output columns
+
+    The arguments are as for OutputTable.columns.  The type is 'str' for
+    text columns, and a NumPy type name otherwise.
+    """
+    columns = [('Filename', 'str')]
+    if include_labels:
+        columns.extend([('Label', 'str'), ('seg_Start', 'float64'),
+                        ('seg_End', 'float64')])
+    columns.append(('t_ms', 'int64'))
+    columns.extend((name, dtype) for name in fields)
+    return columns
+
+
+def output_writer(output_format, path, fields, include_labels,
+                  dtype='float64'):
+    """Return a writer for output_format that writes the file path
+
+    fields, include_labels and dtype are as for OutputTable.columns.  The
+    writer has a write(table) method to add the rows of an OutputTable, and
+    a close() method that has to be called when all tables are written.
+    """
+    if output_format == 'npz':
+        writer_class = NpzWriter
+    elif output_format == 'hdf5':
+        writer_class = Hdf5Writer
+    elif output_format == 'parquet':
+        writer_class = ParquetWriter
+    else:
+        raise ValueError('Unknown binary output format {}'.format(output_format))
+    return writer_class(path, fields, include_labels, dtype)
+
+
+class TextWriter(object):
+    """Write OutputTables as delimited text, like a csv.writer
+
+    The output is the same as writing one row per frame with a csv.writer
+    for dialect, with the measurement values formatted with three decimals
+    and missing values written as the NaN string.  The rows of each
+    TextGrid interval are formatted with a few string operations on the
+    whole block, instead of cell by cell.
+
+    If rstrip is True, trailing whitespace is removed from each row, as in
+    the output files of earlier versions; it only matters when the NaN
+    string can leave whitespace at the end of a row, e.g. an empty NaN
+    string with the tab delimiter.
+    """
+
+    def __init__(self, f, dialect, include_labels, NaN, rstrip=False):
+        self.f = f
+        self.dialect = dialect
+        self.include_labels = include_labels
+        self.delimiter = dialect.delimiter
+        self.lineterminator = dialect.lineterminator
+        self.NaN = self._quote(NaN)
+        # Only a missing value can end a row with whitespace
+        last = self.delimiter + self.NaN
+        self.rstrip = rstrip and last != last.rstrip()
+
+    def _quote(self, value):
+        """Return value as the csv module writes it in a row of several fields"""
+        buf = io.StringIO() if isinstance(value, type(u'')) else io.BytesIO()
+        csv.writer(buf, dialect=self.dialect).writerow([value, ''])
+        return buf.getvalue()[:-len(self.delimiter) - len(self.lineterminator)]
+
+    def writerow(self, row):
+        """Write the list of strings row, e.g. the header"""
+        csv.writer(self.f, dialect=self.dialect).writerow(row)
+
+    def flush(self):
+        self.f.flush()
+
+    def write(self, table):
+        delimiter = self.delimiter
+        lineterminator = self.lineterminator
+        # Format string for the time and measurement values of a row
+        values_fmt = ('%d' + (delimiter + '%.3f') * len(table.data) + '\n')
+        values = np.column_stack([np.asarray(table.t_ms, dtype=np.float64)]
+                                 + [np.asarray(v, dtype=np.float64)
+                                    for v in table.data])
+        filename = self._quote(table.filename) + delimiter
+        i = 0
+        for label, start, stop, nrows in table.intervals:
+            if not nrows:
+                continue
+            block = values[i:i + nrows]
+            i += nrows
+            # Only the values are in text, so 'nan' is a missing value
+            text = (values_fmt * nrows) % tuple(block.ravel().tolist())
+            text = text.replace('nan', self.NaN)
+            prefix = filename
+            if self.include_labels:
+                prefix += delimiter.join([self._quote(label),
+                                          format(start, '.3f'),
+                                          format(stop, '.3f')]) + delimiter
+            lines = text.split('\n')[:-1]
+            if self.rstrip:
+                lines = [line.rstrip() for line in lines]
+            self.f.write(prefix + (lineterminator + prefix).join(lines) +
+                         lineterminator)
+
+
+class _ColumnWriter(object):
+
+    def __init__(self, path, fields, include_labels, dtype):
+        self.path = path
+        self.fields = fields
+        self.include_labels = include_labels
+        self.dtype = dtype
+        self.column_types = output_columns(fields, include_labels, dtype)
+
+    def _columns(self, table):
+        return table.columns(self.fields, self.include_labels, self.dtype)
+
+    def flush(self):
+        # The file is complete only after close()
+        pass
+
+
+class NpzWriter(_ColumnWriter):
+    """Write the columns as arrays in a NumPy .npz file
+
+    The columns are kept in memory until the file is written by close().
+    """
+
+    def __init__(self, *args):
+        super(NpzWriter, self).__init__(*args)
+        self._parts = [[] for _ in self.column_types]
+
+    def write(self, table):
+        for parts, (_, values) in zip(self._parts, self._columns(table)):
+            parts.append(values)
+
+    def close(self):
+        columns = {}
+        for parts, (name, column_type) in zip(self._parts, self.column_types):
+            if parts:
+                columns[name] = np.concatenate(parts)
+            else:
+                columns[name] = np.array([], dtype=column_type.replace('str', 'U'))
+        self._parts = [[] for _ in self.column_types]
+        with open(self.path, 'wb') as f:
+            np.savez(f, **columns)
+
+
+class Hdf5Writer(_ColumnWriter):
+    """Write the columns as one-dimensional datasets in an HDF5 file
+
+    The datasets are extended with the rows of each table as it is written.
+    """
+
+    def __init__(self, *args):
+        super(Hdf5Writer, self).__init__(*args)
+        import h5py
+        # Keep the datasets in the order of the output columns
+        self._file = h5py.File(self.path, 'w', track_order=True)
+        for name, column_type in self.column_types:
+            if column_type == 'str':
+                # Variable length UTF-8 strings
+                column_type = h5py.special_dtype(vlen=str)
+            self._file.create_dataset(name, shape=(0,), maxshape=(None,),
+                                      dtype=column_type, chunks=True)
+
+    def write(self, table):
+        for name, values in self._columns(table):
+            if values.dtype.kind == 'U':
+                values = values.astype(object)
+            dataset = self._file[name]
+            n = dataset.shape[0]
+            dataset.resize((n + len(values),))
+            dataset[n:] = values
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter(_ColumnWriter):
+    """Write the columns to a Parquet file, one row group per table"""
+
+    def __init__(self, *args):
+        super(ParquetWriter, self).__init__(*args)
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._schema = pyarrow.schema(
+            [(name, pyarrow.string() if column_type == 'str'
+                    else pyarrow.from_numpy_dtype(np.dtype(column_type)))
+             for name, column_type in self.column_types])
+        self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+
+    def write(self, table):
+        pa = self._pa
+        arrays = []
+        for (_, values), field in zip(self._columns(table), self._schema):
+            if values.dtype.kind == 'U':
+                values = values.astype(object)
+            arrays.append(pa.array(values, type=field.type))
+        self._writer.write_table(pa.Table.from_arrays(arrays,
+                                                      schema=self._schema))
+
+    def close(self):
+        self._writer.close()
@@ -10,11 +10,13 @@
 from __future__ import division
 
 import os
+import shutil
 import numpy as np
 
-from subprocess import call
+from subprocess import Popen, PIPE
 
-from opensauce.helpers import round_half_away_from_zero, convert_boolean_for_praat
+from opensauce.helpers import round_half_away_from_zero, convert_boolean_for_praat, nearest_time_indices, make_scratch_dir
+from opensauce.profiling import stage, count_subprocess
 
 # Methods for performing Praat pitch analysis
 # 'ac' is autocorrelation method
@@ -24,12 +26,6 @@ valid_praat_f0_methods = ['ac', 'cc']
 # Directory containing Praat scripts
 praat_script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'praat-scripts')
 
-# Praat will sometimes set numerical values to the string '--undefined--'
-# But NumPy can't have a string in a float array, so we convert the
-# '--undefined--' values to NaN
-# Python 3 reads the undefined strings as byte literals, so we also have to
-# check for the byte literal b'--undefined--'
-undef = lambda x: np.nan if x =='--undefined--' or x == b'--undefined--' else x
 
 def praat_pitch(wav_fn, data_len, praat_path, frame_shift=1, method='cc',
                 frame_precision=1, min_pitch=40, max_pitch=500,
@@ -107,6 +103,21 @@ def praat_pitch(wav_fn, data_len, praat_path, frame_shift=1, method='cc',
                                     kill_octave_jumps, interpolate, smooth,
                                     smooth_bandwidth)
 
+    return praat_pitch_from_raw(t_raw, F0_raw, data_len, frame_shift,
+                                frame_precision)
+
+def praat_pitch_from_raw(t_raw, F0_raw, data_len, frame_shift=1,
+                         frame_precision=1):
+    """Return F0 vector of length data_len from raw Praat F0 estimates
+
+    Args:
+        t_raw, F0_raw - raw Praat F0 estimates, as returned by
+                        praat_raw_pitch() [NumPy vectors]
+        See praat_pitch() documentation for the other arguments.
+
+    Returns:
+        F0 - F0 estimates (NumPy vector)
+    """
     # Initialize F0 measurement vector with NaN
     F0 = np.full(data_len, np.nan)
     # Convert time from seconds to nearest whole millisecond
@@ -123,18 +134,16 @@ def praat_pitch(wav_fn, data_len, praat_path, frame_shift=1, method='cc',
         stop = t_raw_ms[-1] + frame_shift
     else:
         stop = t_raw_ms[-1]
-    # Iterate through timepoints corresponding to each frame in time range
-    for idx_f, t_f in enumerate(range(start, stop, frame_shift)):
-        # Find closest time point among calculated Praat values
-        min_idx = np.argmin(np.abs(t_raw_ms - t_f))
-
-        # If closest time point is too far away, skip
-        if np.abs(t_raw_ms[min_idx] - t_f) > frame_precision * frame_shift:
-             continue
+    # Find closest time point among calculated Praat values for the
+    # timepoints corresponding to each frame in time range
+    t_f = np.arange(start, stop, frame_shift)
+    min_idx, valid = nearest_time_indices(t_raw_ms, t_f,
+                                          frame_precision * frame_shift)
 
-        # If index is in range, set value of F0
-        if (idx_f >= 0) and (idx_f < data_len): # pragma: no branch
-            F0[idx_f] = F0_raw[min_idx]
+    # If closest time point is too far away, skip
+    # If index is in range, set value of F0
+    idx_f = np.nonzero(valid[:data_len])[0]
+    F0[idx_f] = F0_raw[min_idx[idx_f]]
 
     return F0
 
@@ -155,12 +164,7 @@ def praat_raw_pitch(wav_fn, praat_path, frame_shift=1, method='cc',
         t_raw  - times corresponding to raw F0 [NumPy Vector]
         F0_raw - raw F0 estimates [NumPy vector]
     """
-    # Determine extension of Praat output file
-    if method == 'ac':
-        ext = '.praatac'
-    elif method == 'cc':
-        ext = '.praatcc'
-    else: # pragma: no cover
+    if method not in valid_praat_f0_methods: # pragma: no cover
         raise ValueError('Invalid Praat F0 method. Choices are {}'.format(valid_praat_f0_methods))
 
     # Convert Boolean variables to Praat values
@@ -171,7 +175,7 @@ def praat_raw_pitch(wav_fn, praat_path, frame_shift=1, method='cc',
     # Setup command to call Praat F0 script
     praat_cmd = [praat_path, '--run']
     praat_cmd.append(os.path.join(praat_script_dir, 'praatF0.praat'))
-    praat_cmd.extend([os.path.abspath(wav_fn), os.path.splitext(wav_fn)[1]])
+    praat_cmd.append(os.path.abspath(wav_fn))
     praat_cmd.extend([str(frame_shift / 1000), str(min_pitch), str(max_pitch)])
     praat_cmd.extend([str(silence_threshold), str(voice_threshold)])
     praat_cmd.extend([str(octave_cost), str(octave_jumpcost)])
@@ -179,25 +183,13 @@ def praat_raw_pitch(wav_fn, praat_path, frame_shift=1, method='cc',
     praat_cmd.extend([smooth, str(smooth_bandwidth)])
     praat_cmd.extend([interpolate, str(method)])
 
-    # Run Praat F0 script
-    return_code = call(praat_cmd)
-
-    if return_code != 0: # pragma: no cover
-        raise OSError('Praat error')
-
-    # Path for Praat F0 output file corresponding to wav_fn
-    f0_fn = wav_fn.split('.')[0] + ext
-    # Load data from f0 file
-    if os.path.isfile(f0_fn):
-        # Check if file is empty
-        if os.stat(f0_fn).st_size == 0:
-            os.remove(f0_fn)
-            raise OSError('Praat error -- pitch calculation failed, check input parameters')
-        t_raw, F0_raw = np.loadtxt(f0_fn, unpack=True, converters={0: undef, 1: undef})
-        # Cleanup and remove f0 file
-        os.remove(f0_fn)
-    else: # pragma: no cover
-        raise OSError('Praat error -- unable to locate {} file'.format(ext))
+    # Run Praat F0 script, which writes the pitch track to stdout
+    data_raw = parse_praat_table(_run_praat(praat_cmd), 2)
+    # No output means that no pitch values were found
+    if len(data_raw) == 0:
+        raise OSError('Praat error -- pitch calculation failed, check input parameters')
+    t_raw = data_raw[:, 0]
+    F0_raw = data_raw[:, 1]
 
     return t_raw, F0_raw
 
@@ -245,6 +237,21 @@ def praat_formants(wav_fn, data_len, praat_path, frame_shift=1, window_size=25,
                                        window_size, num_formants,
                                        max_formant_freq)
 
+    return praat_formants_from_raw(estimates_raw, data_len, frame_shift,
+                                   frame_precision)
+
+def praat_formants_from_raw(estimates_raw, data_len, frame_shift=1,
+                            frame_precision=1):
+    """Return formant vectors of length data_len from raw Praat estimates
+
+    Args:
+        estimates_raw - raw Praat formant estimates, as returned by
+                        praat_raw_formants() [dictionary of NumPy vectors]
+        See praat_formants() documentation for the other arguments.
+
+    Returns:
+        estimates - Formant and bandwidth vectors [dictionary of NumPy vectors]
+    """
     # Initialize measurement vectors with NaN
     estimates = {}
     for k in estimates_raw:
@@ -265,20 +272,18 @@ def praat_formants(wav_fn, data_len, praat_path, frame_shift=1, window_size=25,
         stop = t_raw_ms[-1] + frame_shift
     else:
         stop = t_raw_ms[-1]
-    # Iterate through timepoints corresponding to each frame in time range
-    for idx_f, t_f in enumerate(range(start, stop, frame_shift)):
-        # Find closest time point among calculated Praat values
-        min_idx = np.argmin(np.abs(t_raw_ms - t_f))
-
-        # If closest time point is too far away, skip
-        if np.abs(t_raw_ms[min_idx] - t_f) > frame_precision * frame_shift:
-             continue
-
-        # If index is in range, set measurement value
-        if (idx_f >= 0) and (idx_f < data_len): # pragma: no branch
-            for k in estimates_raw:
-                if k != 'ptFormants':
-                    estimates[k][idx_f] = estimates_raw[k][min_idx]
+    # Find closest time point among calculated Praat values for the
+    # timepoints corresponding to each frame in time range
+    t_f = np.arange(start, stop, frame_shift)
+    min_idx, valid = nearest_time_indices(t_raw_ms, t_f,
+                                          frame_precision * frame_shift)
+
+    # If closest time point is too far away, skip
+    # If index is in range, set measurement value
+    idx_f = np.nonzero(valid[:data_len])[0]
+    for k in estimates_raw:
+        if k != 'ptFormants':
+            estimates[k][idx_f] = estimates_raw[k][min_idx[idx_f]]
 
     return estimates
 
@@ -302,35 +307,200 @@ def praat_raw_formants(wav_fn, praat_path, frame_shift=1, window_size=25, num_fo
     is always a key 'ptFormants' which corresponds to the vector of time
     points matching the estimated formant and bandwidth vectors.
     """
-    # Setup command to call Praat F0 script
+    # Setup command to call Praat formants script
     praat_cmd = [praat_path, '--run']
     praat_cmd.append(os.path.join(praat_script_dir, 'praatformants.praat'))
-    praat_cmd.extend([os.path.abspath(wav_fn), os.path.splitext(wav_fn)[1]])
+    praat_cmd.append(os.path.abspath(wav_fn))
     praat_cmd.extend([str(frame_shift / 1000), str(window_size / 1000)])
     praat_cmd.extend([str(num_formants), str(max_formant_freq)])
 
-    # Run Praat F0 script
-    return_code = call(praat_cmd)
+    # Run Praat formants script, which writes the formant table to stdout
+    data_raw = parse_praat_table(_run_praat(praat_cmd),
+                                 _num_formant_cols(num_formants))
+    estimates_raw = _formants_from_table(data_raw, num_formants)
 
-    if return_code != 0: # pragma: no cover
+    return estimates_raw
+
+def praat_pitch_and_formants(wav_fn, data_len, praat_path, frame_shift=1,
+                             window_size=25, method='cc', frame_precision=1,
+                             min_pitch=40, max_pitch=500,
+                             silence_threshold=0.03, voice_threshold=0.45,
+                             octave_cost=0.01, octave_jumpcost=0.35,
+                             voiced_unvoiced_cost=0.14, kill_octave_jumps=False,
+                             interpolate=False, smooth=False,
+                             smooth_bandwidth=5, num_formants=4,
+                             max_formant_freq=6000):
+    """Estimate F0, formants and bandwidths with a single Praat invocation
+
+    The sound file is read once by Praat for both analyses.  The results are
+    the same as those of praat_pitch() and praat_formants() called with the
+    same parameters.
+
+    Args:
+        See praat_pitch() and praat_formants() documentation.
+
+    Returns:
+        F0        - F0 estimates (NumPy vector)
+        estimates - Formant and bandwidth vectors [dictionary of NumPy vectors]
+    """
+    pitch_raw, formants_raw = praat_raw_batch(
+        [wav_fn], praat_path, frame_shift=frame_shift, window_size=window_size,
+        method=method, min_pitch=min_pitch, max_pitch=max_pitch,
+        silence_threshold=silence_threshold, voice_threshold=voice_threshold,
+        octave_cost=octave_cost, octave_jumpcost=octave_jumpcost,
+        voiced_unvoiced_cost=voiced_unvoiced_cost,
+        kill_octave_jumps=kill_octave_jumps, interpolate=interpolate,
+        smooth=smooth, smooth_bandwidth=smooth_bandwidth,
+        num_formants=num_formants, max_formant_freq=max_formant_freq)[0]
+
+    if pitch_raw is None:
+        raise OSError('Praat error -- pitch calculation failed, check input parameters')
+    t_raw, F0_raw = pitch_raw
+    F0 = praat_pitch_from_raw(t_raw, F0_raw, data_len, frame_shift,
+                              frame_precision)
+    estimates = praat_formants_from_raw(formants_raw, data_len, frame_shift,
+                                        frame_precision)
+
+    return F0, estimates
+
+def praat_raw_batch(wav_fns, praat_path, measure_pitch=True,
+                    measure_formants=True, frame_shift=1, window_size=25,
+                    method='cc', min_pitch=40, max_pitch=500,
+                    silence_threshold=0.03, voice_threshold=0.45,
+                    octave_cost=0.01, octave_jumpcost=0.35,
+                    voiced_unvoiced_cost=0.14, kill_octave_jumps=False,
+                    interpolate=False, smooth=False, smooth_bandwidth=5,
+                    num_formants=4, max_formant_freq=6000):
+    """Return raw Praat F0 and formant estimates for a list of WAV files
+
+    All of the files are analyzed by a single Praat process, and each file
+    is read only once for both the pitch and the formant analysis.
+
+    Args:
+                     wav_fns - WAV files to be processed [list of strings]
+               measure_pitch - Whether to compute F0 estimates [Boolean]
+                               (default = True)
+            measure_formants - Whether to compute formant estimates [Boolean]
+                               (default = True)
+        See praat_pitch() and praat_formants() documentation for the other
+        arguments.
+
+    Returns:
+        results - list with a (pitch_raw, formants_raw) tuple for each file
+                  in wav_fns.  pitch_raw is the (t_raw, F0_raw) tuple
+                  returned by praat_raw_pitch() and formants_raw is the
+                  dictionary returned by praat_raw_formants().  Estimates
+                  that were not requested are None, as is pitch_raw if the
+                  pitch calculation failed for the file.
+
+    Raises OSError if Praat fails; in that case no results are available
+    for any of the files, and the caller may fall back to praat_raw_pitch()
+    and praat_raw_formants() to find out which file caused the problem.
+    """
+    if method not in valid_praat_f0_methods: # pragma: no cover
+        raise ValueError('Invalid Praat F0 method. Choices are {}'.format(valid_praat_f0_methods))
+
+    list_dir = make_scratch_dir()
+    try:
+        # Praat reads the paths of the files to process from a text file
+        list_fn = os.path.join(list_dir, 'files.txt')
+        with open(list_fn, 'w') as f:
+            for wav_fn in wav_fns:
+                f.write(os.path.abspath(wav_fn) + '\n')
+
+        # Setup command to call Praat batch script
+        praat_cmd = [praat_path, '--run']
+        praat_cmd.append(os.path.join(praat_script_dir, 'praatbatch.praat'))
+        praat_cmd.append(list_fn)
+        praat_cmd.append(convert_boolean_for_praat(measure_pitch))
+        praat_cmd.extend([str(frame_shift / 1000), str(min_pitch), str(max_pitch)])
+        praat_cmd.extend([str(silence_threshold), str(voice_threshold)])
+        praat_cmd.extend([str(octave_cost), str(octave_jumpcost)])
+        praat_cmd.append(str(voiced_unvoiced_cost))
+        praat_cmd.append(convert_boolean_for_praat(kill_octave_jumps))
+        praat_cmd.append(convert_boolean_for_praat(smooth))
+        praat_cmd.append(str(smooth_bandwidth))
+        praat_cmd.append(convert_boolean_for_praat(interpolate))
+        praat_cmd.append(str(method))
+        praat_cmd.append(convert_boolean_for_praat(measure_formants))
+        praat_cmd.extend([str(window_size / 1000), str(num_formants)])
+        praat_cmd.append(str(max_formant_freq))
+
+        # Run Praat batch script, which writes all tables to stdout
+        out = _run_praat(praat_cmd)
+    finally:
+        shutil.rmtree(list_dir, ignore_errors=True)
+
+    tables = _praat_batch_tables(out)
+    results = []
+    for wav_fn in wav_fns:
+        pitch_raw = None
+        formants_raw = None
+        if measure_pitch:
+            data_raw = parse_praat_table(next(tables), 2)
+            # An empty table means that the pitch calculation failed
+            if len(data_raw) > 0:
+                pitch_raw = (data_raw[:, 0], data_raw[:, 1])
+        if measure_formants:
+            data_raw = parse_praat_table(next(tables),
+                                         _num_formant_cols(num_formants))
+            formants_raw = _formants_from_table(data_raw, num_formants)
+        results.append((pitch_raw, formants_raw))
+
+    return results
+
+def parse_praat_table(text, num_cols):
+    """Return the numbers in a table of whitespace separated values
+
+    Args:
+            text - table listed by Praat, a header line with the column
+                   labels followed by the rows [bytes]
+        num_cols - number of columns in the table [integer]
+
+    Returns:
+        data - table values [NumPy array with num_cols columns]
+
+    Praat writes the string '--undefined--' for undefined values.  These are
+    converted to NaN by a single substitution on the whole text, so that all
+    of the values can be converted to floats by NumPy in one step.
+    """
+    with stage('parse'):
+        rows = text.partition(b'\n')[2]
+        values = np.array(rows.replace(b'--undefined--', b'nan').split(),
+                          dtype=float)
+    return values.reshape(-1, num_cols)
+
+def _praat_batch_tables(out):
+    """Generate the tables written to stdout by the Praat batch script"""
+    # Each table is preceded by a line with its name and number of rows,
+    # and starts with a header line
+    lines = out.splitlines()
+    pos = 0
+    while pos < len(lines):
+        num_lines = 1 + int(lines[pos].split()[1])
+        yield b'\n'.join(lines[pos+1:pos+1+num_lines])
+        pos += 1 + num_lines
+
+def _run_praat(praat_cmd):
+    """Run Praat command praat_cmd and return what it writes to stdout"""
+    with stage('subprocess'):
+        count_subprocess()
+        proc = Popen(praat_cmd, stdout=PIPE)
+        out, _ = proc.communicate()
+
+    if proc.returncode != 0: # pragma: no cover
         raise OSError('Praat error')
 
-    # Path for Praat output file corresponding to wav_fn
-    fmt_fn = wav_fn.split('.')[0] + '.pfmt'
-    # Load results from Praat file
-    if os.path.isfile(fmt_fn):
-        # Praat allows half integer values for num_formants
-        # So we round up to get total number of formant columns
-        num_cols = 2 + round_half_away_from_zero(num_formants) * 2
-        # Define dictionary that uses undef for all columns
-        undef_dict = {i: undef for i in range(num_cols)}
-        data_raw = np.loadtxt(fmt_fn, dtype=float, skiprows=1, converters=undef_dict)
-        # Cleanup and remove Praat file
-        os.remove(fmt_fn)
-    else: # pragma: no cover
-        raise OSError('Praat error -- unable to locate .pfmt file')
-
-    # Put results into dictionary
+    return out
+
+def _num_formant_cols(num_formants):
+    """Return number of columns in a Praat formant table"""
+    # Praat allows half integer values for num_formants
+    # So we round up to get total number of formant columns
+    return 2 + round_half_away_from_zero(num_formants) * 2
+
+def _formants_from_table(data_raw, num_formants):
+    """Return estimates_raw dictionary from a Praat formant table"""
     estimates_raw = {}
     estimates_raw['ptFormants'] = data_raw[:, 0]
     for i in range(1, round_half_away_from_zero(num_formants) + 1):
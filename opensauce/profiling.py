@@ -0,0 +1,329 @@
+"""Timing and resource use of the stages of an OpenSauce run (--profile)
+
+The code that does the work marks its stages with
+
+    with stage('name', filename):
+        ...
+
+which records, for the sound file filename, the wall time and CPU time
+spent in the stage, the CPU time of the subprocesses that finished during
+it, the number of subprocesses it started (see count_subprocess), and the
+peak memory use of the process at its end.  Stages can be nested; a nested
+stage is recorded under the path of the stages it is in, e.g.
+'praatF0/subprocess', and inherits their filename.  Stages are recorded
+per thread, so stages that run concurrently in several threads are each
+timed on their own.  The CPU time of a stage is the CPU time of its thread
+where Python can measure that, and the CPU time of the process otherwise.
+
+Nothing is recorded unless a Profiler is enabled, and stage() then returns
+a shared do-nothing context manager, so the stage markers cost next to
+nothing in a normal run.
+
+"""
+
+# Licensed under Apache v2 (see LICENSE)
+
+from __future__ import division
+
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError: # pragma: no cover
+    # Not available on Windows
+    resource = None
+
+# Clocks for the wall time and the CPU time of the current thread (or of
+# the process, on Python versions without a thread clock)
+if hasattr(time, 'perf_counter'):
+    _wall_time = time.perf_counter
+else: # pragma: no cover
+    _wall_time = time.time
+if hasattr(time, 'thread_time'):
+    _cpu_time = time.thread_time
+elif hasattr(time, 'process_time'): # pragma: no cover
+    _cpu_time = time.process_time
+else: # pragma: no cover
+    _cpu_time = time.clock
+
+# Columns of a profile report, after the file and stage columns
+report_fields = ['calls', 'wall_time', 'cpu_time', 'child_cpu_time',
+                 'subprocesses', 'peak_rss']
+
+# The enabled Profiler, if any
+_profiler = None
+
+
+def _child_cpu_time():
+    """Return the CPU time used by the finished subprocesses"""
+    t = os.times()
+    return t[2] + t[3]
+
+
+def _peak_rss():
+    """Return the peak resident set size of the process in bytes, or None
+    if it isn't known"""
+    if resource is None: # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': # pragma: no cover
+        # Bytes on macOS, kilobytes elsewhere
+        return peak
+    return peak * 1024
+
+
+class _NullStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_null_stage = _NullStage()
+
+
+class _Stage(object):
+
+    def __init__(self, profiler, name, filename):
+        self.profiler = profiler
+        self.name = name
+        self.filename = filename
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        if stack:
+            parent = stack[-1]
+            self.path = parent.path + '/' + self.name
+            if self.filename is None:
+                self.filename = parent.filename
+        else:
+            self.path = self.name
+        self.subprocesses = 0
+        stack.append(self)
+        self.child_cpu = _child_cpu_time()
+        self.cpu = _cpu_time()
+        self.wall = _wall_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = _wall_time() - self.wall
+        cpu = _cpu_time() - self.cpu
+        child_cpu = _child_cpu_time() - self.child_cpu
+        self.profiler._stack().pop()
+        self.profiler._add(self.filename, self.path,
+                           [1, wall, cpu, child_cpu, self.subprocesses,
+                            _peak_rss()])
+
+
+class Profiler(object):
+
+    def __init__(self):
+        """Collect the stage records of this process
+
+        Records are kept by sound file and stage: the values of all calls
+        of a stage for the same file are added up, except peak_rss, which
+        is the largest of them.
+        """
+        self._records = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.start_wall = _wall_time()
+        self.start_cpu = os.times()
+
+    def _stack(self):
+        # The stages the current thread is in
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _add(self, filename, path, values):
+        with self._lock:
+            record = self._records.get((filename, path))
+            if record is None:
+                self._records[(filename, path)] = values
+            else:
+                self._records[(filename, path)] = _combine(record, values)
+
+    def count_subprocess(self):
+        for s in self._stack():
+            s.subprocesses += 1
+
+    def records(self):
+        """Return a list of (filename, stage, values) for the stages so far
+
+        values is a list with the value of each of report_fields.
+        """
+        with self._lock:
+            return [(filename, path, list(values))
+                    for (filename, path), values in self._records.items()]
+
+    def merge(self, records):
+        """Add records returned by records() in another process"""
+        for filename, path, values in records:
+            self._add(filename, path, values)
+
+    def report(self):
+        """Return the profile report as a dictionary
+
+        'run' has the totals for the whole run since the Profiler was
+        created: the wall time, the CPU time of the process and of its
+        finished subprocesses (including --jobs workers), the number of
+        subprocesses started by the stages, and the peak memory use of the
+        process.  'stages' has the values of
+        each stage for all sound files together, and 'files' the values of
+        each stage for each sound file.  Stages that don't belong to a
+        single sound file, like batch analyses, are listed under 'stages'
+        only.
+        """
+        records = sorted(self.records(), key=_sort_key)
+        now = os.times()
+        run = _rounded({
+            'calls': 1,
+            'wall_time': _wall_time() - self.start_wall,
+            'cpu_time': (now[0] + now[1]) -
+                        (self.start_cpu[0] + self.start_cpu[1]),
+            'child_cpu_time': (now[2] + now[3]) -
+                              (self.start_cpu[2] + self.start_cpu[3]),
+            # Each subprocess is counted by one of the outermost stages
+            'subprocesses': sum(values[4] for _, path, values in records
+                                if '/' not in path),
+            'peak_rss': _peak_rss(),
+            })
+        totals = {}
+        files = {}
+        for filename, path, values in records:
+            if path in totals:
+                totals[path] = _combine(totals[path], values)
+            else:
+                totals[path] = values
+            if filename is not None:
+                files.setdefault(filename, []).append(
+                    _stage_dict(path, values))
+        return {
+            'run': run,
+            'stages': [_stage_dict(path, values)
+                       for path, values in sorted(totals.items())],
+            'files': [{'file': filename, 'stages': stages}
+                      for filename, stages in sorted(files.items())],
+            }
+
+    def write_report(self, path):
+        """Write the report to path, as CSV if path ends with '.csv', and
+        as JSON otherwise
+
+        The CSV file has a row for each stage of each sound file, followed
+        by rows with an empty file column for the total of each stage, and
+        for the whole run (stage 'run').
+        """
+        report = self.report()
+        if path.lower().endswith('.csv'):
+            if sys.version_info[0] < 3: # pragma: no cover
+                f = open(path, 'wb')
+            else:
+                f = io.open(path, 'w', newline='')
+            with f:
+                writer = csv.writer(f)
+                writer.writerow(['file', 'stage'] + report_fields)
+                for entry in report['files']:
+                    for s in entry['stages']:
+                        writer.writerow([entry['file'], s['stage']] +
+                                        [s[k] for k in report_fields])
+                for s in report['stages'] + [dict(report['run'], stage='run')]:
+                    writer.writerow(['', s['stage']] +
+                                    [s[k] for k in report_fields])
+        else:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write('\n')
+
+
+def _combine(record, values):
+    """Return the record for the calls of record and values together"""
+    peak = [v for v in (record[5], values[5]) if v is not None]
+    return [a + b for a, b in zip(record[:5], values[:5])] + [
+        max(peak) if peak else None]
+
+
+def _sort_key(record):
+    filename, path, _ = record
+    return ('' if filename is None else filename, path)
+
+
+def _stage_dict(path, values):
+    d = _rounded(dict(zip(report_fields, values)))
+    d['stage'] = path
+    return d
+
+
+def _rounded(d):
+    """Return d with the times rounded to microseconds"""
+    for k in ('wall_time', 'cpu_time', 'child_cpu_time'):
+        d[k] = round(d[k], 6)
+    return d
+
+
+def enable():
+    """Start recording stages in a new Profiler, and return it"""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable():
+    """Stop recording stages, and return the Profiler that recorded them"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def enabled():
+    return _profiler is not None
+
+
+def stage(name, filename=None):
+    """Return a context manager that records stage name for filename
+
+    filename defaults to the filename of the enclosing stage.
+    """
+    profiler = _profiler
+    if profiler is None:
+        return _null_stage
+    return _Stage(profiler, name, filename)
+
+
+def count_subprocess():
+    """Count a subprocess started in the current stages"""
+    profiler = _profiler
+    if profiler is not None:
+        profiler.count_subprocess()
+
+
+def merge(records):
+    """Add records from take_records() in another process to the enabled
+    Profiler"""
+    profiler = _profiler
+    if profiler is not None:
+        profiler.merge(records)
+
+
+def take_records():
+    """Return the records of the enabled Profiler, and clear them
+
+    Used to send the records of a worker process to the main process.
+    """
+    profiler = _profiler
+    if profiler is None:
+        return []
+    with profiler._lock:
+        records = [(filename, path, values) for (filename, path), values
+                   in profiler._records.items()]
+        profiler._records = {}
+    return records
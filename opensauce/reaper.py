@@ -6,9 +6,13 @@
 from __future__ import division
 
 import os
+import shutil
 import subprocess
 import numpy as np
 
+from opensauce.helpers import make_scratch_dir
+from opensauce.profiling import stage, count_subprocess
+
 
 def reaper_pitch(soundfile, data_len, use_pyreaper=True,
                  reaper_path='not-specified', frame_shift=1, max_pitch=500,
@@ -36,23 +40,26 @@ def reaper_pitch(soundfile, data_len, use_pyreaper=True,
     Returns:
         F0                - F0 estimates [NumPy vector]
     """
-    if soundfile.fs_rs is None:
-        # Use values from original WAV file
-        fs = soundfile.fs
-        wavpath = soundfile.wavpath
-        wavdata_int = soundfile.wavdata_int
-    else:
-        # Use values from resampled WAV file
-        fs = soundfile.fs_rs
-        wavpath = soundfile.wavpath_rs
-        wavdata_int = soundfile.wavdata_rs_int
-
     if use_pyreaper:
+        if soundfile.fs_rs is None:
+            # Use values from original WAV file
+            fs = soundfile.fs
+            wavdata_int = soundfile.wavdata_int
+        else:
+            # Use resampled data, which pyreaper takes directly from memory
+            fs = soundfile.fs_rs
+            wavdata_int = soundfile.wavdata_rs_int
         # Try running reaper from pyreaper package
         t_raw, F0_raw = pyreaper_pitch(wavdata_int, fs, frame_shift, max_pitch,
                                        min_pitch, high_pass, hilbert_transform,
                                        inter_mark)
     else:
+        if soundfile.fs_rs is None:
+            wavpath = soundfile.wavpath
+        else:
+            # REAPER reads from a file, so the resampled data is written
+            # to a wav file here
+            wavpath = soundfile.wavpath_rs
         # Run original Google REAPER as system call
         t_raw, F0_raw = creaper_pitch(wavpath, reaper_path,
                                       frame_shift, max_pitch, min_pitch,
@@ -124,13 +131,15 @@ def creaper_pitch(wav_fn, reaper_path, frame_shift, max_pitch, min_pitch,
         F0_times          - Times corresponding to F0 estimates [NumPy vector]
         F0                - F0 estimates [NumPy vector]
     """
-    # Output file names
-    wav_dir = os.path.dirname(wav_fn)
-    reaper_f0_fn = os.path.join(wav_dir, 'reaper-f0.txt')
+    # Output files go to a private scratch directory, so that parallel
+    # OpenSauce processes working in the same directory don't overwrite each
+    # other's output, and nothing is written next to the sound file
+    scratch_dir = make_scratch_dir()
+    reaper_f0_fn = os.path.join(scratch_dir, 'reaper-f0.txt')
     # XXX: We aren't using the output of these files for now
     #      But they may be useful in the future
-    reaper_pitchmarks_fn = os.path.join(wav_dir, 'reaper-pitchmarks.txt')
-    reaper_corr_fn = os.path.join(wav_dir, 'reaper-corr.txt')
+    reaper_pitchmarks_fn = os.path.join(scratch_dir, 'reaper-pitchmarks.txt')
+    reaper_corr_fn = os.path.join(scratch_dir, 'reaper-corr.txt')
 
     # Run REAPER command
     cmd = [reaper_path, '-i', wav_fn]
@@ -148,22 +157,26 @@ def creaper_pitch(wav_fn, reaper_path, frame_shift, max_pitch, min_pitch,
     cmd.extend(['-a'])
 
     try:
-        return_code = subprocess.call(cmd, stdout=subprocess.PIPE)
-    except OSError:
-        raise OSError('Error while attempting to call REAPER.  Is REAPER path {} correct?'.format(reaper_path))
-    else:
-        if return_code != 0: # pragma: no cover
-            raise OSError('Error when trying to call REAPER')
-
-    # XXX: I think flag is 1 when the measurement is in a voiced region,
-    #      and flag is 0 when the measurement is an unvoiced region
-    F0_times, flag, F0 = np.loadtxt(reaper_f0_fn, skiprows=7, unpack=True)
+        try:
+            with stage('subprocess'):
+                count_subprocess()
+                return_code = subprocess.call(cmd, stdout=subprocess.PIPE)
+        except OSError:
+            raise OSError('Error while attempting to call REAPER.  Is REAPER path {} correct?'.format(reaper_path))
+        else:
+            if return_code != 0: # pragma: no cover
+                raise OSError('Error when trying to call REAPER')
+
+        # XXX: I think flag is 1 when the measurement is in a voiced region,
+        #      and flag is 0 when the measurement is an unvoiced region
+        with stage('parse'):
+            F0_times, flag, F0 = np.loadtxt(reaper_f0_fn, skiprows=7,
+                                            unpack=True)
+    finally:
+        # Cleanup, also if REAPER failed
+        shutil.rmtree(scratch_dir, ignore_errors=True)
 
     # Replace invalid measurements with NaN
     F0[F0 < 0] = np.nan
 
-    os.remove(reaper_f0_fn)
-    os.remove(reaper_pitchmarks_fn)
-    os.remove(reaper_corr_fn)
-
     return F0_times, F0
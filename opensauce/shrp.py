@@ -8,13 +8,26 @@ Ratio.
 from __future__ import division
 
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 from scipy.fftpack import fft
 from scipy.interpolate import interp1d
 
-from opensauce.helpers import round_half_away_from_zero
+from opensauce.helpers import round_half_away_from_zero, nearest_time_indices
 
 # Comments in quotes are copied from the matlab source.
 
+# Default upper limit, in bytes, for the memory used by shrp to analyze a
+# block of frames
+default_max_block_bytes = 32 * 2**20
+
+
+def _float_type(x):
+    """Return the float type to compute with for data x: float32 if x is
+    float32, and float64 otherwise."""
+    if np.asarray(x).dtype == np.float32:
+        return np.float32
+    return np.float64
+
 
 # ---- func_GetSHRP ----
 
@@ -26,7 +39,9 @@ def shr_pitch(wav_data, fps, window_length=None, frame_shift=None,
               frame_precision=None, datalen=None):
     """Return a list of Subharmonic ratios and F0 values computed from wav_data.
 
-    wav_data        a vector of data read from a wav file
+    wav_data        a vector of data read from a wav file; the analysis is
+                        done in single precision if it is float32, and
+                        in double precision otherwise
     fps             frames rate of the wav file
     windows_length  width of analysis window
     frame_shift     distance to move window for each analysis iteration
@@ -85,19 +100,15 @@ def shr_pitch(wav_data, fps, window_length=None, frame_shift=None,
     start = 0
     finish = t[-1]
     increment = frame_shift
-    for k in np.arange(start, finish, increment):
-        # "try to find the closest value"
-        dabs = np.abs(t - k)
-        inx = dabs.argmin()
-        if dabs[inx] > frame_precision * frame_shift:
-            # "no valid value found"
-            continue
-        n = int(round(k / frame_shift)) + 1
-        if n < 0 or n >= datalen:
-            continue
-        F0[n] = f0_value[inx]
-        SHR[n] = shr_value[inx]
-        # "I eventually would like to get candidates as well"
+    k = np.arange(start, finish, increment)
+    # "try to find the closest value"
+    inx, valid = nearest_time_indices(t, k, frame_precision * frame_shift)
+    # Values with no valid time found are skipped
+    n = np.round(k / frame_shift).astype(int) + 1
+    valid &= (n >= 0) & (n < datalen)
+    F0[n[valid]] = f0_value[inx[valid]]
+    SHR[n[valid]] = shr_value[inx[valid]]
+    # "I eventually would like to get candidates as well"
     return SHR, F0
 
 
@@ -134,12 +145,14 @@ def shr_pitch(wav_data, fps, window_length=None, frame_shift=None,
 # ---- shrp -----
 
 def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
-         SHR_Threshold=0.4, ceiling=1250, med_smooth=0, CHECK_VOICING=0):
+         SHR_Threshold=0.4, ceiling=1250, med_smooth=0, CHECK_VOICING=0,
+         max_block_bytes=None):
     """Return pitches for list of samples using subharmonic-to-harmonic ratio.
 
     Given:
 
-        Y               input data
+        Y               input data; if it is float32, the frames and
+                            spectra are computed in single precision
         Fs              sampling frequency (e.g.: 16000 Hz)
         F0MinMax        tuple [minf0 maxf0]; default: [50 550]
                             quick solutions:
@@ -158,6 +171,12 @@ def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
         med_smooth      the order of the median smoothing (default: 0 - no
                             smoothing)
         CHECK_VOICING   NOT IMPLEMENTED
+        max_block_bytes approximate upper limit for the memory used for
+                            analyzing a block of frames (default:
+                            default_max_block_bytes).  The frames are
+                            extracted from Y and analyzed one block at a
+                            time, so memory use doesn't grow with the length
+                            of Y beyond the result vectors.
 
     Return:
 
@@ -178,6 +197,8 @@ def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
     minf0, maxf0 = F0MinMax
     segmentduration = frame_length
 
+    dtype = _float_type(Y)
+    Y = np.asarray(Y, dtype=dtype)
     # "--- pre-processing input signal ---"
     # "remove DC component"
     Y = Y - np.mean(Y)
@@ -257,9 +278,7 @@ def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
     # "--- segmentation of speech ---"
     # "position for each frame in terms of index, not time"
     curpos = np.around(f0_time / 1000 * Fs).astype(int) - 1
-    frames = toframes(Y, curpos, segmentlen, 'hamm')
-    nf, framelen = frames.shape
-    del Y
+    nf = len(curpos)
     # "--- initialize vectors for f0 time, f0 values, and SHR ---"
     f0_value = np.zeros(nf)
     SHR = np.zeros(nf)
@@ -270,66 +289,50 @@ def shrp(Y, Fs, F0MinMax=[50, 500], frame_length=40, timestep=10,
         raise NotImplementedError
         #NoiseFloor=sum(frames(1,:).^2);
         #voicing=vda(frames,segmentduration/1000,NoiseFloor);
-    else:
-        voicing = np.ones(nf)
     # "--- the main loop ---"
-    curf0 = 0
-    cur_SHR = 0
-    cur_cand1 = 0
-    cur_cand2 = 0
-    for n in range(nf):
-        segment = frames[n, :]
-        if voicing[n] == 0:
-            curf0 = 0
-            cur_SHR = 0
-        else:
-            log_spectrum = get_log_spectrum(
-                segment,
-                fftlen,
-                limit,
-                logf,
-                interp_logf)
-            peak_index, cur_SHR, shshift, all_peak_indices = compute_shr(
-                log_spectrum,
-                min_bin,
-                startpos,
-                endpos,
-                lowerbound,
-                upperbound,
-                N,
-                shift_units,
-                SHR_Threshold)
-            # "-1 indicates a possibly unvoiced frame, if CHECK_VOICING, set f0
-            # to 0, otherwise uses previous value"
-            if peak_index == -1:
-                if CHECK_VOICING: # pragma: no cover
-                    curf0 = 0
-                    cur_cand1 = 0
-                    cur_cand2 = 0
-            else:
-                curf0 = newfre[peak_index] * 2
-                if curf0 > maxf0:
-                    curf0 = curf0 / 2
-                if len(all_peak_indices) == 1:
-                    cur_cand1 = 0
-                    cur_cand2 = newfre[all_peak_indices[0]] * 2
-                else:
-                    cur_cand1 = newfre[all_peak_indices[0]] * 2
-                    cur_cand2 = newfre[all_peak_indices[1]] * 2
-                if cur_cand1 > maxf0:
-                    cur_cand1 = cur_cand1 / 2
-                if cur_cand2 > maxf0:
-                    cur_cand2 = cur_cand2 / 2
-                if CHECK_VOICING: # pragma: no cover
-                    raise NotImplementedError
-                    #voicing(n)=postvda(segment,curf0,Fs);
-                    #if (voicing(n)==0)
-                    #    curf0=0;
-                    #end
-        f0_value[n] = curf0
-        SHR[n] = cur_SHR
-        f0_candidates[n, 0] = cur_cand1
-        f0_candidates[n, 1] = cur_cand2
+    # The frames are analyzed a block at a time, and each step of the
+    # analysis is done for all the frames of a block at once.  The results
+    # for each frame are the same as those of get_log_spectrum and
+    # compute_shr.
+    if max_block_bytes is None:
+        max_block_bytes = default_max_block_bytes
+    # Approximate memory used per frame: the windowed frame, its FFT, and a
+    # few arrays the size of the interpolated spectrum
+    frame_bytes = (np.dtype(dtype).itemsize *
+                   (segmentlen + 2 * fftlen + 8 * interp_len))
+    frames_per_block = max(1, int(max_block_bytes // frame_bytes))
+    lo, hi, dx, offset = linear_interp_weights(logf, interp_logf)
+    interp_weights = lo, hi, dx.astype(dtype), offset.astype(dtype)
+    # f0 and the two f0 candidates of the previous frame
+    prev_values = np.zeros(3)
+    for b, frames in iter_frame_blocks(Y, curpos, segmentlen, 'hamm',
+                                       frames_per_block):
+        block = slice(b, b + len(frames))
+        log_spectra = get_log_spectra(frames, fftlen, limit, interp_weights)
+        peak_index, SHR[block], cand_index = compute_shr_block(
+            log_spectra,
+            min_bin,
+            startpos,
+            endpos,
+            lowerbound,
+            upperbound,
+            N,
+            shift_units,
+            SHR_Threshold)
+        values = newfre[np.column_stack((peak_index, cand_index))] * 2
+        # A single candidate is reported as the higher one
+        values[cand_index[:, 0] == -1, 1] = 0
+        values[values > maxf0] /= 2
+        # "-1 indicates a possibly unvoiced frame, if CHECK_VOICING, set f0
+        # to 0, otherwise uses previous value"
+        voiced = peak_index != -1
+        last_voiced = np.maximum.accumulate(
+            np.where(voiced, np.arange(len(voiced)), -1))
+        values = np.where((last_voiced >= 0)[:, np.newaxis],
+                          values[last_voiced], prev_values)
+        f0_value[block] = values[:, 0]
+        f0_candidates[block] = values[:, 1:]
+        prev_values = values[-1]
     # "--- post-processing ---"
     if med_smooth > 0:
         raise NotImplementedError
@@ -351,33 +354,60 @@ def get_log_spectrum(segment, fftlen, limit, logf, interp_logf):
     return interp_amplitude
 
 
+def linear_interp_weights(x, x_new):
+    """Return the weights for linear interpolation from x onto x_new.
+
+    The result can be passed to get_log_spectra, to interpolate any number
+    of spectra from x onto x_new, the same way interp1d(x, y)(x_new) does,
+    without repeating the search for the positions of x_new in x.
+    """
+    x = np.asarray(x)
+    x_new = np.asarray(x_new)
+    # Index of the left end of the interval containing each x_new value
+    lo = np.searchsorted(x, x_new, side='right') - 1
+    lo = lo.clip(0, len(x) - 2)
+    hi = lo + 1
+    return lo, hi, x[hi] - x[lo], x_new - x[lo]
+
+
+def get_log_spectra(segments, fftlen, limit, interp_weights):
+    """Return get_log_spectrum for each row of segments, as rows of an array.
+
+    interp_weights is the result of linear_interp_weights(logf, interp_logf).
+    """
+    spectra = fft(segments, fftlen, axis=1)
+    # "ignore the zero frequency component"
+    amplitude = np.abs(spectra[:, 1:limit+2])
+    lo, hi, dx, offset = interp_weights
+    y_lo = amplitude[:, lo]
+    slope = (amplitude[:, hi] - y_lo) / dx
+    interp_amplitude = slope * offset + y_lo
+    interp_amplitude -= interp_amplitude.min(axis=1)[:, np.newaxis]
+    return interp_amplitude
+
+
 # ---- ComputeSHR -----
 
 def compute_shr(log_spectrum, min_bin, startpos, endpos, lowerbound, upperbound,
-                n, shift_units, shr_threshold):
+                n, shift_units, shr_threshold, return_shshift=False):
     """ "compute subharmonic-to-harmonic ratio for a short-term signal"
 
        returns peak_index = -1 if frame appears to be unvoiced.
+
+       The sums of the rows of the subharmonic shift matrix are computed
+       directly from log_spectrum, without building the matrix.  The matrix
+       itself (shshift) is only returned if return_shshift is True,
+       otherwise None is returned in its place.
     """
-    len_spectrum = len(log_spectrum)
-    total_len = shift_units + len_spectrum
-    # "initialize the subharmonic shift matrix; each row corresponds to a shift
-    # version"
-    shshift = np.zeros((n, total_len))
-    # "place the spectrum at the right end of the first row"
-    shshift[0, total_len-len_spectrum:total_len] = log_spectrum
-    # "note that here startpos and endpos has n-1 rows, so we start from 2"
-    # "the first row in shshift is the original log spectrum"
-    # Actually we start from 1 since python is zero-origined.
-    for i in range(1, n):
-        # "store each shifted sequence"
-        shshift[i, startpos[i-1]:endpos[i-1]+1] = (
-            log_spectrum[:endpos[i-1]-startpos[i-1]+1])
-    # "we don't need the stuff smaller than shift_units"
-    shshift = shshift[:, shift_units:total_len]
+    log_spectrum = np.asarray(log_spectrum)
+    spans = _shift_spans(len(log_spectrum), startpos, endpos, n, shift_units)
+    if return_shshift:
+        shshift = _shift_matrix(log_spectrum, spans)
+    else:
+        shshift = None
     # odd and even are reversed from matlab due to different origin
-    shseven = sum(shshift[0:n:2, :], 0)
-    shsodd = sum(shshift[1:n-1:2, :], 0)
+    shseven = _shifted_sum(log_spectrum, spans[0:n:2])
+    shsodd = _shifted_sum(log_spectrum, spans[1:n-1:2])
     difference = shsodd - shseven
     # "peak picking process"
     shr = 0
@@ -406,6 +436,121 @@ def compute_shr(log_spectrum, min_bin, startpos, endpos, lowerbound, upperbound,
     return peak_index, shr, shshift, index
 
 
+def compute_shr_block(log_spectra, min_bin, startpos, endpos, lowerbound,
+                      upperbound, n, shift_units, shr_threshold):
+    """Return compute_shr for each row of log_spectra.
+
+    Returns arrays peak_index and shr, with an entry for each row, and an
+    array with a row of the two f0 candidate indices for each row of
+    log_spectra.  As in compute_shr, peak_index is -1 if a frame appears to
+    be unvoiced.  When there is only one candidate, the first candidate
+    index is -1.
+
+    Like compute_shr, the shifted spectra are summed without building the
+    subharmonic shift matrix.
+    """
+    num_frames, len_spectrum = log_spectra.shape
+    spans = _shift_spans(len_spectrum, startpos, endpos, n, shift_units)
+    # odd and even are reversed from matlab due to different origin
+    shseven = _shifted_sum(log_spectra, spans[0:n:2])
+    shsodd = _shifted_sum(log_spectra, spans[1:n-1:2])
+    difference = shsodd - shseven
+    # "peak picking process"
+    # Same as two_max, for all rows at once
+    max_index = min(upperbound, len_spectrum-1)
+    mag1 = difference[:, lowerbound:upperbound+1].max(axis=1)
+    is_max = difference == mag1[:, np.newaxis]
+    index1 = is_max.argmax(axis=1)
+    harmonics = 2
+    limit = 0.0625  # "1/8 octave"
+    start_offset = int(round(np.log2(harmonics-limit)/min_bin))
+    end_offset = int(round(np.log2(harmonics+limit)/min_bin))
+    startpos2 = index1 + start_offset
+    endpos2 = np.minimum(max_index, index1 + end_offset)
+    has_second = (mag1 >= 0) & (startpos2 <= max_index)
+    # Search region for the second maximum, padded to the same length for
+    # all rows
+    cols = startpos2[:, np.newaxis] + np.arange(end_offset - start_offset + 1)
+    in_region = cols <= endpos2[:, np.newaxis]
+    region = np.where(in_region,
+                      difference[np.arange(num_frames)[:, np.newaxis],
+                                 np.minimum(cols, len_spectrum-1)],
+                      -np.inf)
+    mag2 = region.max(axis=1)
+    index2 = startpos2 + (region == mag2[:, np.newaxis]).argmax(axis=1)
+    two_peaks = has_second & (mag2 > 0)
+    # "first mag is always the maximum, the second, if there is, is the second
+    # max"
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shr = np.where(two_peaks, (mag1-mag2) / (mag1+mag2), 0)
+    # "subharmonic is weak, so favor the harmonic", otherwise "subharmonic is
+    # strong, so favor the subharmonic as F0"
+    peak_index = np.where(two_peaks & (shr <= shr_threshold), index2, index1)
+    # "this must be an unvoiced frame"
+    peak_index[~two_peaks & (mag1 <= 0)] = -1
+    cand_index = np.where(two_peaks[:, np.newaxis],
+                          np.column_stack((index1, index2)),
+                          np.column_stack((np.full(num_frames, -1), index1)))
+    # When the maximum occurs more than once, two_max returns all of its
+    # indices, so fall back on compute_shr for those (rare) frames.
+    for i in np.nonzero(is_max.sum(axis=1) > 1)[0]:
+        frame_peak_index, shr[i], _, index = compute_shr(
+            log_spectra[i], min_bin, startpos, endpos, lowerbound,
+            upperbound, n, shift_units, shr_threshold)
+        # For a single candidate, compute_shr returns all the indices of
+        # the maximum as the peak index
+        peak_index[i] = np.ravel(frame_peak_index)[0]
+        cand_index[i] = (-1, index[0]) if len(index) == 1 else index[:2]
+    return peak_index, shr, cand_index
+
+
+def _shift_spans(len_spectrum, startpos, endpos, n, shift_units):
+    """Return the positions of the spectrum in each row of the subharmonic
+    shift matrix.
+
+    The shift matrix has n rows of len_spectrum columns (after dropping the
+    first shift_units columns, as compute_shr does).  Row i holds the
+    values log_spectrum[src_start:src_stop] starting at column dst_start,
+    and zeros elsewhere.  Returns an array with a row (src_start, src_stop,
+    dst_start) for each row of the shift matrix.
+    """
+    # "the first row in shshift is the original log spectrum"
+    # "note that here startpos and endpos has n-1 rows, so we start from 2"
+    # Actually we start from 1 since python is zero-origined.
+    startpos = np.asarray(startpos[:n-1])
+    endpos = np.asarray(endpos[:n-1])
+    first = np.maximum(startpos, shift_units)
+    spans = np.column_stack((first - startpos,
+                             endpos - startpos + 1,
+                             first - shift_units))
+    return np.vstack(([0, len_spectrum, 0], spans))
+
+
+def _shift_matrix(log_spectrum, spans):
+    """Return the subharmonic shift matrix; each row corresponds to a shift
+    version of log_spectrum."""
+    shshift = np.zeros((len(spans), len(log_spectrum)))
+    for row, (src_start, src_stop, dst_start) in zip(shshift, spans):
+        if src_stop > src_start:
+            row[dst_start:dst_start+src_stop-src_start] = (
+                log_spectrum[src_start:src_stop])
+    return shshift
+
+
+def _shifted_sum(spectra, spans):
+    """Return the sum of the rows of the shift matrix for spectra given by
+    spans (see _shift_spans), adding the rows in order.
+
+    spectra may be a single spectrum or an array with a spectrum per row.
+    """
+    total = np.zeros(np.shape(spectra), dtype=_float_type(spectra))
+    for src_start, src_stop, dst_start in spans:
+        if src_stop > src_start:
+            total[..., dst_start:dst_start+src_stop-src_start] += (
+                spectra[..., src_start:src_stop])
+    return total
+
+
 # ---- twomax -----
 
 def two_max(x, lowerbound, upperbound, unit_len):
@@ -462,20 +607,54 @@ def ethreshold(frames):
 # ---- toframes ----
 
 def toframes(samples, curpos, segmentlen, window_type):
-    last_index = len(samples) - 1
-    num_frames = len(curpos)
-    start = curpos - int(round(segmentlen/2))
+    start = _frame_starts(len(samples), curpos, segmentlen)
+    offset = np.arange(segmentlen)
+    frames = np.asarray(samples)[start[:, np.newaxis] + offset]
+    window_vector = window(segmentlen, window_type).astype(
+        _float_type(samples))
+    return np.multiply(frames, window_vector)
+
+
+def iter_frame_blocks(samples, curpos, segmentlen, window_type,
+                      frames_per_block):
+    """Generate the frames of toframes a block of frames at a time.
+
+    Yields tuples of the index of the first frame in the block, and an
+    array with the frames of the block as rows.  Only one block of frames is
+    held in memory at a time.  When the frames of a block are equally
+    spaced, they are taken from samples as a strided view, without
+    building an index array.  The frames are float32 if samples is, and
+    float64 otherwise.
+    """
+    dtype = _float_type(samples)
+    samples = np.asarray(samples, dtype=dtype)
+    start = _frame_starts(len(samples), curpos, segmentlen)
     offset = np.arange(segmentlen)
+    window_vector = window(segmentlen, window_type).astype(dtype)
+    stride = samples.strides[0]
+    for b in range(0, len(start), frames_per_block):
+        block_start = start[b:b+frames_per_block]
+        steps = np.diff(block_start)
+        if len(steps) == 0 or np.all(steps == steps[0]):
+            step = steps[0] if len(steps) else 0
+            frames = as_strided(samples[block_start[0]:],
+                                shape=(len(block_start), segmentlen),
+                                strides=(step * stride, stride))
+        else:
+            frames = samples[block_start[:, np.newaxis] + offset]
+        yield b, frames * window_vector
+
+
+def _frame_starts(num_samples, curpos, segmentlen):
+    """Return the index of the first sample of each frame."""
+    last_index = num_samples - 1
+    start = curpos - int(round(segmentlen/2))
     index_start = np.nonzero(start < 1)[0]
     start[index_start] = 0
     endpos = start + segmentlen - 1
     index = np.nonzero(endpos > last_index)[0]
-    endpos[index] = last_index
     start[index] = last_index + 1 - segmentlen
-    frames = samples[(np.tile(np.expand_dims(start, 1),
-                     (1, segmentlen)) + np.tile(offset, (num_frames, 1)))]
-    window_vector = np.tile(window(segmentlen, window_type), (num_frames, 1))
-    return np.multiply(frames, window_vector)
+    return start
 
 
 # ---- voicing ----
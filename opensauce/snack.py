@@ -15,11 +15,15 @@ Snack can be called in several ways:
 from __future__ import division
 
 from sys import platform
-from subprocess import call
+from subprocess import call, Popen, PIPE
 
 from conf.userconf import user_snack_lib_path
 
+from opensauce.helpers import make_scratch_dir
+from opensauce.profiling import stage, count_subprocess
+
 import os
+import shutil
 import sys
 import inspect
 import numpy as np
@@ -32,9 +36,146 @@ sformant_names = ['sF1', 'sF2', 'sF3', 'sF4', 'sB1', 'sB2', 'sB3', 'sB4']
 
 valid_snack_methods = ['exe', 'python', 'tcl']
 
+class SnackSession(object):
+    """Snack Sound Toolkit loaded once in a Tcl interpreter via tkinter
+
+    Creating the interpreter and loading the Snack package takes longer
+    than analyzing a short sound file, so a session is meant to be reused
+    for many files.  It keeps a single snack::sound object, and the last
+    file read stays loaded, so that pitch and formants for the same file
+    are computed from one read.  Call clear() if a file may have changed
+    on disk since it was read.
+
+    Note this can only be used if the user's machine is setup, so that
+    Tcl/Tk can be accessed through Python's tkinter library.
+    """
+
+    def __init__(self):
+        try:
+            import tkinter
+        except ImportError:
+            try:
+                import Tkinter as tkinter
+            except ImportError: # pragma: no cover
+                print("Need Python library tkinter. Is it installed?")
+
+        self.tcl = tkinter.Tcl()
+        try:
+            # XXX This will trigger a message 'cannot open /dev/mixer' on the
+            # console if you don't have a /dev/mixer.  You don't *need* a
+            # mixer to snack the way we are using it, but there's no
+            # practical way to suppress the message without modifying the
+            # snack source.  Fortunately most people running opensauce will
+            # in fact have a /dev/mixer.
+            self.tcl.eval('package require snack')
+        except tkinter.TclError as err: # pragma: no cover
+            log.critical('Cannot load snack (is it installed?): %s', err)
+            raise OSError('Cannot load snack (is it installed?): {}'.format(err))
+        self.tcl.eval('snack::sound s')
+        # File currently loaded in the sound object
+        self.wav_fn = None
+
+    def read(self, wav_fn):
+        """Load wav_fn into the sound object, unless it is already loaded"""
+        if wav_fn == self.wav_fn:
+            return
+        in_file = wav_fn
+        # HACK: Need to replace single backslash with two backslashes,
+        #       so that the Tcl shell reads the file path correctly on Windows
+        if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
+            in_file = in_file.replace('\\', '\\\\')
+        self.tcl.eval('s read {}'.format(in_file))
+        self.wav_fn = wav_fn
+
+    def clear(self):
+        """Forget the loaded file, so that it is read again when needed"""
+        self.wav_fn = None
+
+    def raw_pitch(self, wav_fn, frame_shift, window_size, max_pitch, min_pitch):
+        """Return raw F0 and voicing vectors, see snack_raw_pitch()"""
+        self.read(wav_fn)
+        # XXX I'm assuming Hz for pitch; the docs don't actually say that.
+        # http://www.speech.kth.se/snack/man/snack2.2/tcl-man.html#spitch
+        cmd = ['s pitch -method esps']
+        cmd.extend(['-framelength {}'.format(frame_shift / 1000)])
+        cmd.extend(['-windowlength {}'.format(window_size / 1000)])
+        cmd.extend(['-maxpitch {}'.format(max_pitch)])
+        cmd.extend(['-minpitch {}'.format(min_pitch)])
+        # Run Snack pitch command.  join flattens the list of frames, so
+        # that all of the results are transferred as a single string.
+        data = self.tcl.eval('join [{}]'.format(' '.join(cmd)))
+        # XXX check for errors here and log and abort if there is one.  Result
+        # string will start with ERROR:.
+        # snack returns four values per frame, we only care about the first two.
+        values = _snack_values(data, 4)
+        F0_raw = values[:, 0]
+        V_raw = values[:, 1]
+
+        return F0_raw, V_raw
+
+    def raw_formants(self, wav_fn, frame_shift, window_size, pre_emphasis,
+                     lpc_order):
+        """Return raw formant and bandwidth vectors, see snack_raw_formants()"""
+        self.read(wav_fn)
+        cmd = ['s formant']
+        cmd.extend(['-windowlength {}'.format(window_size / 1000)])
+        cmd.extend(['-framelength {}'.format(frame_shift / 1000)])
+        cmd.extend(['-windowtype Hamming'])
+        cmd.extend(['-lpctype 0'])
+        cmd.extend(['-preemphasisfactor {}'.format(pre_emphasis)])
+        cmd.extend(['-ds_freq 10000'])
+        cmd.extend(['-lpcorder {}'.format(lpc_order)])
+        # Run Snack formant command.  join flattens the list of frames, so
+        # that all of the results are transferred as a single string.
+        data = self.tcl.eval('join [{}]'.format(' '.join(cmd)))
+        # XXX check for errors here and log and abort if there is one.  Result
+        # string will start with ERROR:.
+        # Collect results in dictionary
+        num_cols = len(sformant_names)
+        values = _snack_values(data, num_cols)
+        estimates_raw = {}
+        for j in range(num_cols):
+            estimates_raw[sformant_names[j]] = values[:, j]
+
+        return estimates_raw
+
+def _tcl_script_header(tcl_shell_cmd):
+    """Return start of a Tcl script that loads Snack"""
+    script = "#!/usr/bin/env bash\n"
+    script += '# the next line restarts with tclsh \\\n'
+    script += 'exec {} "$0" "$@"\n\n'.format(tcl_shell_cmd)
+    # HACK: The variable user_snack_lib_path is a hack we use in continous
+    #       integration testing. The reason is that we may not have the
+    #       permissions to copy the Snack library to the standard Tcl library
+    #       location. This is a workaround to load the Snack library from a
+    #       different location, where the location is given by
+    #       user_snack_lib_path.
+    if user_snack_lib_path is not None:
+        script += 'pkg_mkIndex {} snack.tcl libsnack.dylib libsound.dylib\n'.format(user_snack_lib_path)
+        script += 'lappend auto_path {}\n\n'.format(user_snack_lib_path)
+    script += 'package require snack\n\n'
+    return script
+
+def _snack_values(data, num_cols):
+    """Return Snack results in string data as array with num_cols columns"""
+    # All of the values are converted by NumPy in one step
+    with stage('parse'):
+        return np.array(data.split(), dtype=float).reshape(-1, num_cols)
+
+def _loadtxt(fn, **kwargs):
+    """Return the table of values in a file written by Snack"""
+    with stage('parse'):
+        return np.loadtxt(fn, **kwargs)
+
+def _call(cmd):
+    """Run command cmd, and return its exit code"""
+    with stage('subprocess'):
+        count_subprocess()
+        return call(cmd)
+
 def snack_pitch(wav_fn, method, data_len, frame_shift=1,
                 window_size=25, max_pitch=500, min_pitch=40,
-                tcl_shell_cmd=None):
+                tcl_shell_cmd=None, snack_session=None):
     """Return F0 and voicing vectors estimated by Snack Sound Toolkit
 
     Use Snack ESPS method to estimate the pitch (F0) and voicing values for
@@ -56,6 +197,8 @@ def snack_pitch(wav_fn, method, data_len, frame_shift=1,
                         (default = 40)
         tcl_shell_cmd - Command to run Tcl shell [string]
                         (default = None)
+        snack_session - Snack session to reuse [SnackSession]
+                        (default = None)
 
     Returns:
         F0 - F0 estimates [NumPy vector]
@@ -76,12 +219,29 @@ def snack_pitch(wav_fn, method, data_len, frame_shift=1,
     tcl_shell_cmd is the name of the command to invoke the Tcl shell.  This
     argument is only used if method = 'tcl'.
 
+    snack_session is only used if method = 'python'.  If it is None, Snack
+    is loaded into a new Tcl interpreter for this call.
+
     For more details about the Snack pitch calculation, see the manual:
     http://www.speech.kth.se/snack/man/snack2.2/tcl-man.html#spitch
     """
     # Get raw Snack F0 and V vectors
-    F0_raw, V_raw = snack_raw_pitch(wav_fn, method, frame_shift, window_size, max_pitch, min_pitch, tcl_shell_cmd)
+    F0_raw, V_raw = snack_raw_pitch(wav_fn, method, frame_shift, window_size, max_pitch, min_pitch, tcl_shell_cmd, snack_session)
 
+    return snack_pitch_from_raw(F0_raw, V_raw, data_len, frame_shift, window_size)
+
+def snack_pitch_from_raw(F0_raw, V_raw, data_len, frame_shift=1, window_size=25):
+    """Return F0 and voicing vectors of length data_len from raw Snack output
+
+    Args:
+        F0_raw, V_raw - raw Snack F0 and voicing, as returned by
+                        snack_raw_pitch() [NumPy vectors]
+        See snack_pitch() documentation for the other arguments.
+
+    Returns:
+        F0 - F0 estimates [NumPy vector]
+        V  - Voicing [NumPy vector]
+    """
     # Pad F0 and V with NaN
     # First half frame is NaN
     pad_head_F0 = np.full(np.int_(np.floor(window_size / frame_shift / 2)), np.nan)
@@ -98,7 +258,8 @@ def snack_pitch(wav_fn, method, data_len, frame_shift=1,
     return F0_out, V_out
 
 def snack_raw_pitch(wav_fn, method, frame_shift=1, window_size=25,
-                    max_pitch=500, min_pitch=40, tcl_shell_cmd=None):
+                    max_pitch=500, min_pitch=40, tcl_shell_cmd=None,
+                    snack_session=None):
     """Return raw F0 and voicing vectors estimated by Snack Sound Toolkit
 
     Args:
@@ -116,7 +277,7 @@ def snack_raw_pitch(wav_fn, method, frame_shift=1, window_size=25,
         if method == 'exe': # pragma: no cover
             F0_raw, V_raw = snack_raw_pitch_exe(wav_fn, frame_shift, window_size, max_pitch, min_pitch)
         elif method == 'python':
-            F0_raw, V_raw = snack_raw_pitch_python(wav_fn, frame_shift, window_size, max_pitch, min_pitch)
+            F0_raw, V_raw = snack_raw_pitch_python(wav_fn, frame_shift, window_size, max_pitch, min_pitch, snack_session)
         elif method == 'tcl': # pragma: no branch
             F0_raw, V_raw = snack_raw_pitch_tcl(wav_fn, frame_shift, window_size, max_pitch, min_pitch, tcl_shell_cmd)
     else: # pragma: no cover
@@ -143,7 +304,7 @@ def snack_raw_pitch_exe(wav_fn, frame_shift, window_size, max_pitch, min_pitch):
     snack_cmd.extend(['-windowlength', str(window_size / 1000)])
     snack_cmd.extend(['-maxpitch', str(max_pitch)])
     snack_cmd.extend(['-minpitch', str(min_pitch)])
-    return_code = call(snack_cmd)
+    return_code = _call(snack_cmd)
 
     if return_code != 0:
         raise OSError('snack.exe error')
@@ -152,7 +313,7 @@ def snack_raw_pitch_exe(wav_fn, frame_shift, window_size, max_pitch, min_pitch):
     f0_fn = wav_fn.split('.')[0] + '.f0'
     # Load data from f0 file
     if os.path.isfile(f0_fn):
-        F0_raw, V_raw = np.loadtxt(f0_fn, dtype=float, usecols=(0,1), unpack=True)
+        F0_raw, V_raw = _loadtxt(f0_fn, dtype=float, usecols=(0,1), unpack=True)
         # Cleanup and remove f0 file
         os.remove(f0_fn)
     else:
@@ -160,64 +321,23 @@ def snack_raw_pitch_exe(wav_fn, frame_shift, window_size, max_pitch, min_pitch):
 
     return F0_raw, V_raw
 
-def snack_raw_pitch_python(wav_fn, frame_shift, window_size, max_pitch, min_pitch):
+def snack_raw_pitch_python(wav_fn, frame_shift, window_size, max_pitch, min_pitch, snack_session=None):
     """Implement snack_raw_pitch() by calling Snack through Python's tkinter
        library
 
     Note this method can only be used if the user's machine is setup, so that
     Tcl/Tk can be accessed through Python's tkinter library.
 
+    snack_session is a SnackSession to reuse; if it is None, a new session
+    is created for this call.
+
     The vectors returned here are the raw Snack output, without padding.
     For more info, see documentation for snack_raw_pitch().
     """
-    try:
-        import tkinter
-    except ImportError:
-        try:
-            import Tkinter as tkinter
-        except ImportError: # pragma: no cover
-            print("Need Python library tkinter. Is it installed?")
-
-    # HACK: Need to replace single backslash with two backslashes,
-    #       so that the Tcl shell reads the file path correctly on Windows
-    if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
-        wav_fn = wav_fn.replace('\\', '\\\\')
-
-    # XXX I'm assuming Hz for pitch; the docs don't actually say that.
-    # http://www.speech.kth.se/snack/man/snack2.2/tcl-man.html#spitch
-    tcl = tkinter.Tcl()
-    try:
-        # XXX This will trigger a message 'cannot open /dev/mixer' on the
-        # console if you don't have a /dev/mixer.  You don't *need* a mixer to
-        # snack the way we are using it, but there's no practical way to
-        # suppress the message without modifying the snack source.  Fortunately
-        # most people running opensauce will in fact have a /dev/mixer.
-        tcl.eval('package require snack')
-    except tkinter.TclError as err: # pragma: no cover
-        log.critical('Cannot load snack (is it installed?): %s', err)
-        return
-    tcl.eval('snack::sound s')
-    tcl.eval('s read {}'.format(wav_fn))
-    cmd = ['s pitch -method esps']
-    cmd.extend(['-framelength {}'.format(frame_shift / 1000)])
-    cmd.extend(['-windowlength {}'.format(window_size / 1000)])
-    cmd.extend(['-maxpitch {}'.format(max_pitch)])
-    cmd.extend(['-minpitch {}'.format(min_pitch)])
-    # Run Snack pitch command
-    tcl.eval('set data [{}]'.format(' '.join(cmd)))
-    # XXX check for errors here and log and abort if there is one.  Result
-    # string will start with ERROR:.
-    # Collect results and save in return variables
-    num_frames = int(tcl.eval('llength $data'))
-    F0_raw = np.empty(num_frames)
-    V_raw = np.empty(num_frames)
-    # snack returns four values per frame, we only care about the first two.
-    for i in range(num_frames):
-        values = tcl.eval('lindex $data ' + str(i)).split()
-        F0_raw[i] = np.float_(values[0])
-        V_raw[i] = np.float_(values[1])
+    if snack_session is None:
+        snack_session = SnackSession()
 
-    return F0_raw, V_raw
+    return snack_session.raw_pitch(wav_fn, frame_shift, window_size, max_pitch, min_pitch)
 
 def snack_raw_pitch_tcl(wav_fn, frame_shift, window_size, max_pitch, min_pitch, tcl_shell_cmd):
     """Implement snack_raw_pitch() by calling Snack through Tcl shell
@@ -239,64 +359,53 @@ def snack_raw_pitch_tcl(wav_fn, frame_shift, window_size, max_pitch, min_pitch,
     if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
         in_file = in_file.replace('\\', '\\\\')
 
-    # Name of the file containing the Tcl script
-    tcl_file = os.path.join(os.path.dirname(wav_fn), 'tclforsnackpitch.tcl')
+    # The Tcl script and its output go to a private scratch directory, so
+    # that parallel OpenSauce processes working in the same directory don't
+    # overwrite each other's files, and nothing is written next to wav_fn
+    scratch_dir = make_scratch_dir()
+    tcl_file = os.path.join(scratch_dir, 'tclforsnackpitch.tcl')
+    f0_file = os.path.join(scratch_dir, 'snack.f0')
 
     # Write Tcl script which will call Snack pitch calculation
-    f = open(tcl_file, 'w')
-    script = "#!/usr/bin/env bash\n"
-    script += '# the next line restarts with tclsh \\\n'
-    script += 'exec {} "$0" "$@"\n\n'.format(tcl_shell_cmd)
-    # HACK: The variable user_snack_lib_path is a hack we use in continous
-    #       integration testing. The reason is that we may not have the
-    #       permissions to copy the Snack library to the standard Tcl library
-    #       location. This is a workaround to load the Snack library from a
-    #       different location, where the location is given by
-    #       user_snack_lib_path.
-    if user_snack_lib_path is not None:
-        script += 'pkg_mkIndex {} snack.tcl libsnack.dylib libsound.dylib\n'.format(user_snack_lib_path)
-        script += 'lappend auto_path {}\n\n'.format(user_snack_lib_path)
-    script += 'package require snack\n\n'
+    # The output path is braced, so that Tcl reads it verbatim
+    script = _tcl_script_header(tcl_shell_cmd)
     script += 'snack::sound s\n\n'
     script += 's read {}\n\n'.format(in_file)
-    script += 'set fd [open [file rootname {}].f0 w]\n'.format(in_file)
+    script += 'set fd [open {{{}}} w]\n'.format(f0_file)
     script += 'puts $fd [join [s pitch -method esps -framelength {} -windowlength {} -maxpitch {} -minpitch {}]\n\n]\n'.format(frame_shift / 1000, window_size / 1000, max_pitch, min_pitch)
     script += 'close $fd\n\n'
     script += 'exit'
-    f.write(script)
-    f.close()
 
-    # Run the Tcl script
     try:
-        return_code = call([tcl_shell_cmd, tcl_file])
-    except OSError:
-        os.remove(tcl_file)
-        raise OSError('Error while attempting to call Snack via Tcl shell.  Is Tcl shell command {} correct?'.format(tcl_shell_cmd))
-    else:
-        if return_code != 0: # pragma: no cover
-            os.remove(tcl_file)
-            raise OSError('Error when trying to call Snack via Tcl shell script.')
-
-    # Load results from the f0 file output by the Tcl script
-    # And save into return variables
-    f0_file = os.path.splitext(wav_fn)[0] + '.f0'
-    if os.path.isfile(f0_file):
-        data = np.loadtxt(f0_file, dtype=float).reshape((-1,4))
-        F0_raw = data[:, 0]
-        V_raw = data[:, 1]
-        # Cleanup and remove f0 file
-        os.remove(f0_file)
-    else: # pragma: no cover
-        raise OSError('Snack Tcl shell error -- unable to locate .f0 file')
+        with open(tcl_file, 'w') as f:
+            f.write(script)
 
-    # Cleanup and remove Tcl script file
-    os.remove(tcl_file)
+        # Run the Tcl script
+        try:
+            return_code = _call([tcl_shell_cmd, tcl_file])
+        except OSError:
+            raise OSError('Error while attempting to call Snack via Tcl shell.  Is Tcl shell command {} correct?'.format(tcl_shell_cmd))
+        else:
+            if return_code != 0: # pragma: no cover
+                raise OSError('Error when trying to call Snack via Tcl shell script.')
+
+        # Load results from the f0 file output by the Tcl script
+        # And save into return variables
+        if os.path.isfile(f0_file):
+            data = _loadtxt(f0_file, dtype=float).reshape((-1,4))
+            F0_raw = data[:, 0]
+            V_raw = data[:, 1]
+        else: # pragma: no cover
+            raise OSError('Snack Tcl shell error -- unable to locate .f0 file')
+    finally:
+        # Cleanup and remove Tcl script and f0 file, also after errors
+        shutil.rmtree(scratch_dir, ignore_errors=True)
 
     return F0_raw, V_raw
 
 def snack_formants(wav_fn, method, data_len, frame_shift=1,
                    window_size=25, pre_emphasis=0.96, lpc_order=12,
-                   tcl_shell_cmd=None):
+                   tcl_shell_cmd=None, snack_session=None):
     """Return formant and bandwidth vectors estimated by Snack Sound Toolkit
 
     Use Snack to estimate first four formants and bandwidths for each frame.
@@ -318,6 +427,8 @@ def snack_formants(wav_fn, method, data_len, frame_shift=1,
                         (default = 12)
         tcl_shell_cmd - Command to run Tcl shell [string]
                         (default = None)
+        snack_session - Snack session to reuse [SnackSession]
+                        (default = None)
 
     Returns:
         estimates - Formant and bandwidth vectors [dictionary of NumPy vectors]
@@ -343,6 +454,9 @@ def snack_formants(wav_fn, method, data_len, frame_shift=1,
     tcl_shell_cmd is the name of the command to invoke the Tcl shell.  This
     argument is only used if method = 'tcl'
 
+    snack_session is only used if method = 'python'.  If it is None, Snack
+    is loaded into a new Tcl interpreter for this call.
+
     The estimates dictionary uses keys:
     'sF1', 'sF2', 'sF3', 'sF4', 'sB1', 'sB2', 'sB3', 'sB4'
     ('sF1' is the first Snack Formant, 'sB2' is the second Snack bandwidth
@@ -352,8 +466,22 @@ def snack_formants(wav_fn, method, data_len, frame_shift=1,
     http://www.speech.kth.se/snack/man/snack2.2/tcl-man.html#sformant
     """
     # Compute raw formant and bandwidth estimates using Snack
-    estimates_raw = snack_raw_formants(wav_fn, method, frame_shift, window_size, pre_emphasis, lpc_order, tcl_shell_cmd)
+    estimates_raw = snack_raw_formants(wav_fn, method, frame_shift, window_size, pre_emphasis, lpc_order, tcl_shell_cmd, snack_session)
+
+    return snack_formants_from_raw(estimates_raw, data_len, frame_shift, window_size)
 
+def snack_formants_from_raw(estimates_raw, data_len, frame_shift=1, window_size=25):
+    """Return formant and bandwidth vectors of length data_len from raw Snack
+       output
+
+    Args:
+        estimates_raw - raw Snack formant and bandwidth vectors, as returned
+                        by snack_raw_formants() [dictionary of NumPy vectors]
+        See snack_formants() documentation for the other arguments.
+
+    Returns:
+        estimates - Formant and bandwidth vectors [dictionary of NumPy vectors]
+    """
     # Pad estimates with NaN
     estimates = {}
     for n in sformant_names:
@@ -366,7 +494,8 @@ def snack_formants(wav_fn, method, data_len, frame_shift=1,
     return estimates
 
 def snack_raw_formants(wav_fn, method, frame_shift=1, window_size=25,
-                       pre_emphasis=0.96, lpc_order=12, tcl_shell_cmd=None):
+                       pre_emphasis=0.96, lpc_order=12, tcl_shell_cmd=None,
+                       snack_session=None):
     """Return raw formant and bandwidth vectors estimated by Snack Sound Toolkit
 
     Args:
@@ -383,7 +512,7 @@ def snack_raw_formants(wav_fn, method, frame_shift=1, window_size=25,
         if method == 'exe': # pragma: no cover
             estimates_raw = snack_raw_formants_exe(wav_fn, frame_shift, window_size, pre_emphasis, lpc_order)
         elif method == 'python':
-            estimates_raw = snack_raw_formants_python(wav_fn, frame_shift, window_size, pre_emphasis, lpc_order)
+            estimates_raw = snack_raw_formants_python(wav_fn, frame_shift, window_size, pre_emphasis, lpc_order, snack_session)
         elif method == 'tcl': # pragma: no branch
             estimates_raw = snack_raw_formants_tcl(wav_fn, frame_shift, window_size, pre_emphasis, lpc_order, tcl_shell_cmd)
     else: # pragma: no cover
@@ -413,7 +542,7 @@ def snack_raw_formants_exe(wav_fn, frame_shift, window_size, pre_emphasis, lpc_o
     snack_cmd.extend(['-preemphasisfactor', str(pre_emphasis)])
     snack_cmd.extend(['-ds_freq', '10000'])
     snack_cmd.extend(['-lpcorder', str(lpc_order)])
-    return_code = call(snack_cmd)
+    return_code = _call(snack_cmd)
 
     if return_code != 0:
         raise OSError('snack.exe error')
@@ -422,7 +551,7 @@ def snack_raw_formants_exe(wav_fn, frame_shift, window_size, pre_emphasis, lpc_o
     frm_fn = wav_fn.split('.')[0] + '.frm'
     # Load data from frm file
     if os.path.isfile(frm_fn):
-        frm_results = np.loadtxt(frm_fn, dtype=float)
+        frm_results = _loadtxt(frm_fn, dtype=float)
         # Cleanup and remove frm file
         os.remove(frm_fn)
     else:
@@ -436,68 +565,23 @@ def snack_raw_formants_exe(wav_fn, frame_shift, window_size, pre_emphasis, lpc_o
 
     return estimates_raw
 
-def snack_raw_formants_python(wav_fn, frame_shift, window_size, pre_emphasis, lpc_order):
+def snack_raw_formants_python(wav_fn, frame_shift, window_size, pre_emphasis, lpc_order, snack_session=None):
     """Implement snack_raw_formants() by calling Snack through Python's tkinter
        library
 
     Note this method can only be used if the user's machine is setup,
     so that Tcl/Tk can be accessed through Python's tkinter library.
 
+    snack_session is a SnackSession to reuse; if it is None, a new session
+    is created for this call.
+
     The vectors returned here are the raw Snack output, without padding.
     For more info, see documentation for snack_raw_formants().
     """
-    try:
-        import tkinter
-    except ImportError:
-        try:
-            import Tkinter as tkinter
-        except ImportError: # pragma: no cover
-            print("Need Python library tkinter. Is it installed?")
-
-    # HACK: Need to replace single backslash with two backslashes,
-    #       so that the Tcl shell reads the file path correctly on Windows
-    if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
-        wav_fn = wav_fn.replace('\\', '\\\\')
+    if snack_session is None:
+        snack_session = SnackSession()
 
-    # XXX I'm assuming Hz for pitch; the docs don't actually say that.
-    # http://www.speech.kth.se/snack/man/snack2.2/tcl-man.html#spitch
-    tcl = tkinter.Tcl()
-    try:
-        # XXX This will trigger a message 'cannot open /dev/mixer' on the
-        # console if you don't have a /dev/mixer.  You don't *need* a mixer to
-        # snack the way we are using it, but there's no practical way to
-        # suppress the message without modifying the snack source.  Fortunately
-        # most people running opensauce will in fact have a /dev/mixer.
-        tcl.eval('package require snack')
-    except tkinter.TclError as err: # pragma: no cover
-        log.critical('Cannot load snack (is it installed?): %s', err)
-        return
-    tcl.eval('snack::sound s')
-    tcl.eval('s read {}'.format(wav_fn))
-    cmd = ['s formant']
-    cmd.extend(['-windowlength {}'.format(window_size / 1000)])
-    cmd.extend(['-framelength {}'.format(frame_shift / 1000)])
-    cmd.extend(['-windowtype Hamming'])
-    cmd.extend(['-lpctype 0'])
-    cmd.extend(['-preemphasisfactor {}'.format(pre_emphasis)])
-    cmd.extend(['-ds_freq 10000'])
-    cmd.extend(['-lpcorder {}'.format(lpc_order)])
-    # Run Snack formant command
-    tcl.eval('set data [{}]'.format(' '.join(cmd)))
-    # XXX check for errors here and log and abort if there is one.  Result
-    # string will start with ERROR:.
-    # Collect results in dictionary
-    num_frames = int(tcl.eval('llength $data'))
-    num_cols = len(sformant_names)
-    estimates_raw = {}
-    for n in sformant_names:
-        estimates_raw[n] = np.empty(num_frames)
-    for i in range(num_frames):
-        values = tcl.eval('lindex $data ' + str(i)).split()
-        for j in range(num_cols):
-            estimates_raw[sformant_names[j]][i] = np.float_(values[j])
-
-    return estimates_raw
+    return snack_session.raw_formants(wav_fn, frame_shift, window_size, pre_emphasis, lpc_order)
 
 def snack_raw_formants_tcl(wav_fn, frame_shift, window_size, pre_emphasis, lpc_order, tcl_shell_cmd):
     """Implement snack_formants() by calling Snack through Tcl shell
@@ -520,57 +604,142 @@ def snack_raw_formants_tcl(wav_fn, frame_shift, window_size, pre_emphasis, lpc_o
     if sys.platform == 'win32' or sys.platform == 'cygwin': # pragma: no cover
         in_file = in_file.replace('\\', '\\\\')
 
-    tcl_file = os.path.join(os.path.dirname(wav_fn), 'tclforsnackformant.tcl')
+    # The Tcl script and its output go to a private scratch directory, so
+    # that parallel OpenSauce processes working in the same directory don't
+    # overwrite each other's files, and nothing is written next to wav_fn
+    scratch_dir = make_scratch_dir()
+    tcl_file = os.path.join(scratch_dir, 'tclforsnackformant.tcl')
+    frm_file = os.path.join(scratch_dir, 'snack.frm')
 
     # Write Tcl script to compute Snack formants
-    f = open(tcl_file, 'w')
-    script = "#!/usr/bin/env bash\n"
-    script += '# the next line restarts with tclsh \\\n'
-    script += 'exec {} "$0" "$@"\n\n'.format(tcl_shell_cmd)
-    # HACK: The variable user_snack_lib_path is a hack we use in continous
-    #       integration testing. The reason is that we may not have the
-    #       permissions to copy the Snack library to the standard Tcl library
-    #       location. This is a workaround to load the Snack library from a
-    #       different location, where the location is given by
-    #       user_snack_lib_path.
-    if user_snack_lib_path is not None:
-        script += 'pkg_mkIndex {} snack.tcl libsnack.dylib libsound.dylib\n'.format(user_snack_lib_path)
-        script += 'lappend auto_path {}\n\n'.format(user_snack_lib_path)
-    script += 'package require snack\n\n'
+    # The output path is braced, so that Tcl reads it verbatim
+    script = _tcl_script_header(tcl_shell_cmd)
     script += 'snack::sound s\n\n'
     script += 's read {}\n\n'.format(in_file)
-    script += 'set fd [open [file rootname {}].frm w]\n'.format(in_file)
+    script += 'set fd [open {{{}}} w]\n'.format(frm_file)
     script += 'puts $fd [join [s formant -windowlength {} -framelength {} -windowtype Hamming -lpctype 0 -preemphasisfactor {} -ds_freq 10000 -lpcorder {}]\n\n]\n'.format(window_size / 1000, frame_shift / 1000, pre_emphasis, lpc_order)
     script += 'close $fd\n\n'
     script += 'exit'
-    f.write(script)
-    f.close()
 
-    # Run Tcl script
     try:
-        return_code = call([tcl_shell_cmd, tcl_file])
-    except OSError: # pragma: no cover
-        os.remove(tcl_file)
-        raise OSError('Error while attempting to call Snack via Tcl shell.  Is Tcl shell command {} correct?'.format(tcl_shell_cmd))
-    else:
-        if return_code != 0: # pragma: no cover
-            os.remove(tcl_file)
-            raise OSError('Error when trying to call Snack via Tcl shell script.')
+        with open(tcl_file, 'w') as f:
+            f.write(script)
 
-    # Load results from f0 file and save into return variables
-    frm_file = os.path.splitext(wav_fn)[0] + '.frm'
-    num_cols = len(sformant_names)
-    if os.path.isfile(frm_file):
-        frm_results = np.loadtxt(frm_file, dtype=float).reshape((-1, num_cols))
-        estimates_raw = {}
-        for i in range(num_cols):
-            estimates_raw[sformant_names[i]] = frm_results[:, i]
-        # Cleanup and remove f0 file
-        os.remove(frm_file)
-    else: # pragma: no cover
-        raise OSError('Snack Tcl shell error -- unable to locate .frm file')
-
-    # Cleanup and remove Tcl script file
-    os.remove(tcl_file)
+        # Run Tcl script
+        try:
+            return_code = _call([tcl_shell_cmd, tcl_file])
+        except OSError: # pragma: no cover
+            raise OSError('Error while attempting to call Snack via Tcl shell.  Is Tcl shell command {} correct?'.format(tcl_shell_cmd))
+        else:
+            if return_code != 0: # pragma: no cover
+                raise OSError('Error when trying to call Snack via Tcl shell script.')
+
+        # Load results from frm file and save into return variables
+        num_cols = len(sformant_names)
+        if os.path.isfile(frm_file):
+            frm_results = _loadtxt(frm_file, dtype=float).reshape((-1, num_cols))
+            estimates_raw = {}
+            for i in range(num_cols):
+                estimates_raw[sformant_names[i]] = frm_results[:, i]
+        else: # pragma: no cover
+            raise OSError('Snack Tcl shell error -- unable to locate .frm file')
+    finally:
+        # Cleanup and remove Tcl script and frm file, also after errors
+        shutil.rmtree(scratch_dir, ignore_errors=True)
 
     return estimates_raw
+
+def snack_raw_batch_tcl(wav_fns, tcl_shell_cmd, measure_pitch=True,
+                        measure_formants=True, frame_shift=1, window_size=25,
+                        max_pitch=500, min_pitch=40, pre_emphasis=0.96,
+                        lpc_order=12):
+    """Return raw Snack F0 and formant estimates for a list of WAV files
+
+    All of the files are analyzed by a single Tcl shell process, which loads
+    Snack once, reads each file once for both analyses, and writes the
+    results to stdout.
+
+    Args:
+                     wav_fns - WAV files to be processed [list of strings]
+               tcl_shell_cmd - Command to run Tcl shell [string]
+               measure_pitch - Whether to compute F0 and voicing [Boolean]
+                               (default = True)
+            measure_formants - Whether to compute formants and bandwidths
+                               [Boolean]
+                               (default = True)
+        See snack_pitch() and snack_formants() documentation for the other
+        arguments.
+
+    Returns:
+        results - list with a (pitch_raw, formants_raw) tuple for each file
+                  in wav_fns.  pitch_raw is the (F0_raw, V_raw) tuple
+                  returned by snack_raw_pitch() and formants_raw is the
+                  dictionary returned by snack_raw_formants().  Estimates
+                  that were not requested are None.
+
+    Raises OSError if the Tcl script fails; in that case no results are
+    available for any of the files.
+    """
+    pitch_cmd = 's pitch -method esps -framelength {} -windowlength {} -maxpitch {} -minpitch {}'.format(frame_shift / 1000, window_size / 1000, max_pitch, min_pitch)
+    formant_cmd = 's formant -windowlength {} -framelength {} -windowtype Hamming -lpctype 0 -preemphasisfactor {} -ds_freq 10000 -lpcorder {}'.format(window_size / 1000, frame_shift / 1000, pre_emphasis, lpc_order)
+
+    # Write Tcl script which analyzes the files given on its command line.
+    # Each result is written as a line naming the analysis, followed by a
+    # line with the values for all of the frames.
+    script = _tcl_script_header(tcl_shell_cmd)
+    script += 'snack::sound s\n\n'
+    script += 'foreach f $argv {\n'
+    script += '    s read $f\n'
+    if measure_pitch:
+        script += '    puts pitch\n'
+        script += '    puts [join [{}]]\n'.format(pitch_cmd)
+    if measure_formants:
+        script += '    puts formants\n'
+        script += '    puts [join [{}]]\n'.format(formant_cmd)
+    script += '}\n\n'
+    script += 'exit'
+
+    script_dir = make_scratch_dir()
+    try:
+        tcl_file = os.path.join(script_dir, 'tclforsnackbatch.tcl')
+        with open(tcl_file, 'w') as f:
+            f.write(script)
+
+        # Run the Tcl script
+        try:
+            with stage('subprocess'):
+                count_subprocess()
+                proc = Popen([tcl_shell_cmd, tcl_file] + list(wav_fns), stdout=PIPE)
+                out, _ = proc.communicate()
+        except OSError:
+            raise OSError('Error while attempting to call Snack via Tcl shell.  Is Tcl shell command {} correct?'.format(tcl_shell_cmd))
+        if proc.returncode != 0:
+            raise OSError('Error when trying to call Snack via Tcl shell script.')
+    finally:
+        shutil.rmtree(script_dir, ignore_errors=True)
+
+    lines = iter(out.splitlines())
+    results = []
+    for wav_fn in wav_fns:
+        pitch_raw = None
+        formants_raw = None
+        if measure_pitch:
+            values = _next_batch_values(lines, b'pitch', 4)
+            pitch_raw = (values[:, 0], values[:, 1])
+        if measure_formants:
+            num_cols = len(sformant_names)
+            values = _next_batch_values(lines, b'formants', num_cols)
+            formants_raw = {}
+            for j in range(num_cols):
+                formants_raw[sformant_names[j]] = values[:, j]
+        results.append((pitch_raw, formants_raw))
+
+    return results
+
+def _next_batch_values(lines, name, num_cols):
+    """Return the next result called name from the batch script output"""
+    header = next(lines, None)
+    data = next(lines, None)
+    if header is None or header.strip() != name or data is None: # pragma: no cover
+        raise OSError('Snack Tcl shell error -- unexpected output from batch script')
+    return _snack_values(data, num_cols)
@@ -11,25 +11,51 @@ from __future__ import division
 
 import math
 import os
+import shutil
 import numpy as np
 
 from scipy.signal import resample
 from scipy.io import wavfile
 
-from opensauce.helpers import wavread
+from opensauce.helpers import (wavread_int, pcm_to_float, make_scratch_dir,
+                               resample_polyphase, round_half_away_from_zero)
 from opensauce.textgrid import TextGrid, IntervalTier
+from opensauce.profiling import stage
+
+valid_resample_methods = ['fft', 'polyphase']
+valid_precisions = ['float64', 'float32']
 
 
 class SoundFile(object):
 
-    def __init__(self, wavpath, tgdir=None, tgfn=None, resample_freq=None):
+    def __init__(self, wavpath, tgdir=None, tgfn=None, resample_freq=None,
+                 resample_method='fft', precision='float64'):
         """Load sound data from wavpath and TextGrid from tgdir+tgfn.  If
         resample_freq is specified, then also resample the sound data and
-        save the resampled data, in addition to the original data.
+        keep the resampled data in memory, in addition to the original data.
 
         Assume that input wav files are 16-bit PCM (integers between -32767
-        and 32767).  Output resampled wav files are also written as 16-bit
-        PCM.
+        and 32767).  The samples are memory-mapped from the file when they
+        are first accessed, and kept as one 16-bit integer array, which all
+        measurements share.  The float samples are only computed when
+        wavdata is accessed, and then kept as well; wavdata_block() converts
+        a range of samples without computing the whole float array.  The
+        resampled data is only written to a wav file when
+        wavpath_rs is accessed, e.g. for an external program that reads
+        its input from a file.  That file is written as 16-bit PCM to a
+        private scratch directory, and is removed by the cleanup() method,
+        or on leaving a with block using the SoundFile.
+
+        resample_method selects the resampling algorithm: 'fft' resamples
+        the whole signal with an FFT (scipy.signal.resample), 'polyphase'
+        uses a polyphase filter for the rational ratio of the sampling
+        rates, computed block by block (see helpers.resample_polyphase).
+        The polyphase method is much faster for long recordings.
+
+        precision is the float type of wavdata and wavdata_rs, 'float64' or
+        'float32'.  The NumPy based algorithms compute in the precision of
+        the data they are given, so 'float32' halves the memory they use,
+        at some cost in accuracy.
 
         If tgdir is not specified look for the TextGrid in the same directory
         as the sound file.  if tgfn is not specified, look for a file with
@@ -41,11 +67,13 @@ class SoundFile(object):
                                     constructor.
             wavfn                   The filename component of wavpath.
             wavdata                 An ndarray of wavfile samples (float)
-            wavdata_int             An ndarray of wavfile sample (16-bit int)
+            wavdata_int             An ndarray of wavfile sample (16-bit int),
+                                    memory-mapped from wavpath (read-only)
             fs                      The number of samples per second
             ns                      Total number of samples
             wavpath_rs              Path for wav file corresponding to
-                                    resampled data
+                                    resampled data, written on first
+                                    access (None if resample_freq = None)
             wavdata_rs              An ndarray of wavfile float samples after
                                     resampling (None if resample_freq = None)
             wavdata_rs_int          An ndarray of wavfile 16-bit int samples after
@@ -85,69 +113,159 @@ class SoundFile(object):
                 raise ValueError('Resample frequency must be an integer')
             if resample_freq <= 0:
                 raise ValueError('Resample frequency must be positive')
+        if resample_method not in valid_resample_methods:
+            raise ValueError('Invalid resample method. Choices are {}'.format(valid_resample_methods))
+        if precision not in valid_precisions:
+            raise ValueError('Invalid precision. Choices are {}'.format(valid_precisions))
         self.fs_rs = resample_freq
+        self.resample_method = resample_method
+        self.dtype = np.dtype(precision)
+        # The samples, loaded on first access by _load_wavdata()
+        self._wavdata_int = None
+        self._fs = None
+        self._wavdata = None
+        # Cache for the results of _wavdata_rs(), so that the resampling
+        # only happens once
+        self._wavdata_rs_cache = None
+        # The resampled wav file, and the scratch directory containing it,
+        # are only created when wavpath_rs is first accessed
+        self._wavpath_rs = None
+        self._scratch_dir = None
 
     @property
     def wavdata(self):
-        return self._wavdata()[0]
+        if self._wavdata is None:
+            wavdata_int = self.wavdata_int
+            with stage('decode', self.wavfn):
+                data = pcm_to_float(wavdata_int, dtype=self.dtype)
+            # Shared by all measurements, so make sure none changes it
+            data.flags.writeable = False
+            self._wavdata = data
+        return self._wavdata
 
     @property
     def wavdata_int(self):
-        return self._wavdata()[1]
+        if self._wavdata_int is None:
+            self._load_wavdata()
+        return self._wavdata_int
 
     @property
     def fs(self):
-        return self._wavdata()[2]
+        if self._fs is None:
+            self._load_wavdata()
+        return self._fs
 
     @property
     def ns(self):
-        return len(self.wavdata)
+        return len(self.wavdata_int)
+
+    def _load_wavdata(self):
+        # Several threads may get here at once; they all map the same data
+        with stage('read', self.wavfn):
+            data_int, fs = wavread_int(self.wavpath, mmap=True)
+        self._wavdata_int, self._fs = data_int, fs
 
-    def _wavdata(self):
-        data, data_int, fs = wavread(self.wavpath)
-        self.__dict__['wavdata'], self.__dict__['fs'] = data, fs
-        return data, data_int, fs
+    def wavdata_block(self, start, stop):
+        """Return the float samples from index start up to stop"""
+        if self._wavdata is not None:
+            return self._wavdata[start:stop]
+        return pcm_to_float(self.wavdata_int, start, stop, self.dtype)
 
     @property
     def wavpath_rs(self):
-        return self._wavdata_rs()[0]
+        if self.fs_rs is None:
+            return None
+        if self._wavpath_rs is None:
+            self._wavpath_rs = self._write_wavdata_rs()
+        return self._wavpath_rs
 
     @property
     def wavdata_rs(self):
-        return self._wavdata_rs()[1]
+        return self._wavdata_rs()[0]
 
     @property
     def wavdata_rs_int(self):
-        return self._wavdata_rs()[2]
+        return self._wavdata_rs()[1]
 
     @property
     def ns_rs(self):
-        return self._wavdata_rs()[3]
+        return self._wavdata_rs()[2]
 
     def _wavdata_rs(self):
+        if self._wavdata_rs_cache is None:
+            with stage('resample', self.wavfn):
+                self._wavdata_rs_cache = self._resample()
+        return self._wavdata_rs_cache
+
+    def _resample(self):
         if self.fs_rs is not None:
             # Number of points in resample
             ns_rs = np.int_(np.ceil(self.ns * self.fs_rs / self.fs))
             # Do resample
-            # XXX: Tried using a Hamming window as a low pass filter, but it
-            #      didn't seem to make a big difference, so it's not used
-            #      here.
-            data_rs = resample(self.wavdata, ns_rs)
-            wavpath_rs = self.wavpath.split('.')[0] + '-resample-' + str(self.fs_rs) + 'Hz.wav'
-            # Write resampled data to wav file
+            if self.resample_method == 'polyphase':
+                # The filter is applied block by block, so it can work on
+                # the integer samples directly.  Scaling by a power of 2
+                # commutes exactly with the filter, so the result is the
+                # same as resampling wavdata.
+                data_rs = pcm_to_float(
+                    resample_polyphase(self.wavdata_int, self.fs_rs, self.fs),
+                    dtype=self.dtype)
+            else:
+                # XXX: Tried using a Hamming window as a low pass filter, but
+                #      it didn't seem to make a big difference, so it's not
+                #      used here.
+                data_rs = resample(self.wavdata, ns_rs).astype(self.dtype,
+                                                              copy=False)
             # Convert data from 32-bit floating point to 16-bit PCM
             data_rs_int = np.int16(data_rs * 32768)
-            wavfile.write(wavpath_rs, self.fs_rs, data_rs_int)
-            # XXX: Was worried that Python might continue executing code
-            #      before the file write is finished, but it seems like it's
-            #      not an issue.
-            return wavpath_rs, data_rs, data_rs_int, ns_rs
+            return data_rs, data_rs_int, ns_rs
         else:
-            return None, None, None, None
+            return None, None, None
+
+    def _write_wavdata_rs(self):
+        # The resampled data is only written to disk for programs that need
+        # to read it from a file.  It goes into a private scratch directory
+        # (instead of next to the original wav file, which may not be
+        # writable), and is removed by cleanup().
+        if self._scratch_dir is None:
+            self._scratch_dir = make_scratch_dir()
+        wavfn_rs = os.path.splitext(self.wavfn)[0] + '-resample-' + str(self.fs_rs) + 'Hz.wav'
+        wavpath_rs = os.path.join(self._scratch_dir, wavfn_rs)
+        # Write resampled data to wav file as 16-bit PCM
+        wavdata_rs_int = self.wavdata_rs_int
+        with stage('write wav', self.wavfn):
+            wavfile.write(wavpath_rs, self.fs_rs, wavdata_rs_int)
+        return wavpath_rs
+
+    def segment(self, start, stop):
+        """Return a SoundSegment for the sound from start to stop seconds"""
+        return SoundSegment(self, start, stop)
+
+    def cleanup(self):
+        """Remove any files written for this sound file, i.e. the wav file
+        for the resampled data.
+
+        The resampled data stays available in memory.
+        """
+        if self._scratch_dir is not None:
+            shutil.rmtree(self._scratch_dir, ignore_errors=True)
+            self._scratch_dir = None
+            self._wavpath_rs = None
+
+    def __del__(self):
+        # The constructor may have failed before setting _scratch_dir
+        if getattr(self, '_scratch_dir', None) is not None:
+            self.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
 
     @property
     def ms_len(self):
-        ms_len = int(math.floor(len(self.wavdata) / self.fs * 1000))
+        ms_len = int(math.floor(self.ns / self.fs * 1000))
         self.__dict__['ms_len'] = ms_len
         return ms_len
 
@@ -172,3 +290,120 @@ class SoundFile(object):
                 res.append((i.mark, float(i.minTime), float(i.maxTime)))
         self.__dict__['textgrid_intervals'] = res
         return res
+
+
+class SoundSegment(object):
+
+    def __init__(self, soundfile, start, stop):
+        """The part of soundfile from start to stop seconds, which can be
+        analyzed like a SoundFile
+
+        The segment starts at the sample nearest to start, and ends at the
+        sample nearest to stop, or at the end of the sound file.  It has
+        the same sound data attributes as a SoundFile (wavdata, wavdata_int,
+        fs, ns and their resampled counterparts), which are views of the
+        data of soundfile, with the float samples only computed for the
+        segment.  For programs that read their input from a file, the
+        segment is written to a 16-bit PCM wav file in a private scratch
+        directory when wavpath or wavpath_rs is first accessed; those files
+        are removed by the cleanup() method, or on leaving a with block.
+        """
+        self.soundfile = soundfile
+        self.start = start
+        self.stop = stop
+        self.wavfn = soundfile.wavfn
+        self.fs_rs = soundfile.fs_rs
+        self._wavpath = None
+        self._wavpath_rs = None
+        self._scratch_dir = None
+
+    def _range(self, fs, ns):
+        # Sample indices of the segment for sampling rate fs
+        start = min(ns, int(round_half_away_from_zero(self.start * fs)))
+        stop = min(ns, int(round_half_away_from_zero(self.stop * fs)))
+        return start, max(start, stop)
+
+    @property
+    def fs(self):
+        return self.soundfile.fs
+
+    @property
+    def wavdata_int(self):
+        start, stop = self._range(self.fs, self.soundfile.ns)
+        return self.soundfile.wavdata_int[start:stop]
+
+    @property
+    def wavdata(self):
+        start, stop = self._range(self.fs, self.soundfile.ns)
+        return self.soundfile.wavdata_block(start, stop)
+
+    @property
+    def ns(self):
+        start, stop = self._range(self.fs, self.soundfile.ns)
+        return stop - start
+
+    @property
+    def wavdata_rs(self):
+        if self.fs_rs is None:
+            return None
+        start, stop = self._range(self.fs_rs, self.soundfile.ns_rs)
+        return self.soundfile.wavdata_rs[start:stop]
+
+    @property
+    def wavdata_rs_int(self):
+        if self.fs_rs is None:
+            return None
+        start, stop = self._range(self.fs_rs, self.soundfile.ns_rs)
+        return self.soundfile.wavdata_rs_int[start:stop]
+
+    @property
+    def ns_rs(self):
+        if self.fs_rs is None:
+            return None
+        start, stop = self._range(self.fs_rs, self.soundfile.ns_rs)
+        return stop - start
+
+    @property
+    def wavpath(self):
+        if self._wavpath is None:
+            self._wavpath = self._write(self.fs, self.wavdata_int)
+        return self._wavpath
+
+    @property
+    def wavpath_rs(self):
+        if self.fs_rs is None:
+            return None
+        if self._wavpath_rs is None:
+            self._wavpath_rs = self._write(self.fs_rs, self.wavdata_rs_int,
+                                           '-resample-{}Hz'.format(self.fs_rs))
+        return self._wavpath_rs
+
+    def _write(self, fs, data_int, suffix=''):
+        if self._scratch_dir is None:
+            self._scratch_dir = make_scratch_dir()
+        fn = '{}-{}-{}ms{}.wav'.format(
+            os.path.splitext(self.wavfn)[0],
+            int(round_half_away_from_zero(self.start * 1000)),
+            int(round_half_away_from_zero(self.stop * 1000)), suffix)
+        path = os.path.join(self._scratch_dir, fn)
+        with stage('write wav', self.wavfn):
+            wavfile.write(path, fs, data_int)
+        return path
+
+    def cleanup(self):
+        """Remove the wav files written for this segment"""
+        if self._scratch_dir is not None:
+            shutil.rmtree(self._scratch_dir, ignore_errors=True)
+            self._scratch_dir = None
+            self._wavpath = None
+            self._wavpath_rs = None
+
+    def __del__(self):
+        if getattr(self, '_scratch_dir', None) is not None:
+            self.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
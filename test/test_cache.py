@@ -0,0 +1,97 @@
+import os
+import shutil
+import numpy as np
+
+from opensauce.cache import MeasurementCache, file_digest
+
+from test.support import TestCase, sound_file_path
+
+
+class TestMeasurementCache(TestCase):
+
+    def setUp(self):
+        self.cache_dir = os.path.join(self.tmpdir(), 'cache')
+        self.wav_fn = sound_file_path('beijing_f3_50_a.wav')
+
+    def test_creates_cache_dir(self):
+        MeasurementCache(self.cache_dir, 1024)
+        self.assertTrue(os.path.isdir(self.cache_dir))
+
+    def test_put_get(self):
+        cache = MeasurementCache(self.cache_dir, 1024 * 1024)
+        key = cache.key(self.wav_fn, 'shrF0', [('frame_shift', 1)])
+        self.assertNotIn(key, cache)
+        self.assertIsNone(cache.get(key))
+        F0 = np.array([np.nan, 100.5, 101.25])
+        cache.put(key, F0)
+        self.assertIn(key, cache)
+        self.assertAllClose(cache.get(key), F0, equal_nan=True)
+        # Entries are visible to other processes using the directory
+        other = MeasurementCache(self.cache_dir, 1024 * 1024)
+        self.assertAllClose(other.get(key), F0, equal_nan=True)
+
+    def test_put_get_dict(self):
+        cache = MeasurementCache(self.cache_dir, 1024 * 1024)
+        key = cache.key(self.wav_fn, 'snackFormants', [])
+        estimates = {'sF1': np.arange(3.0), 'sB1': np.arange(4.0)}
+        cache.put(key, estimates)
+        result = cache.get(key)
+        self.assertEqual(sorted(result), ['sB1', 'sF1'])
+        for k in estimates:
+            self.assertAllClose(result[k], estimates[k])
+
+    def test_key(self):
+        cache = MeasurementCache(self.cache_dir, 1024)
+        key = cache.key(self.wav_fn, 'shrF0', [('frame_shift', 1),
+                                               ('window_size', 25)])
+        # Parameter order doesn't matter
+        self.assertEqual(key, cache.key(self.wav_fn, 'shrF0',
+                                        [('window_size', 25),
+                                         ('frame_shift', 1)]))
+        # Measurement name and parameter values do
+        self.assertNotEqual(key, cache.key(self.wav_fn, 'SHR',
+                                           [('frame_shift', 1),
+                                            ('window_size', 25)]))
+        self.assertNotEqual(key, cache.key(self.wav_fn, 'shrF0',
+                                           [('frame_shift', 2),
+                                            ('window_size', 25)]))
+        # The key depends on the contents of the sound file, not its path
+        copy_fn = os.path.join(self.tmpdir(), 'copy.wav')
+        shutil.copy(self.wav_fn, copy_fn)
+        self.assertEqual(key, cache.key(copy_fn, 'shrF0',
+                                        [('frame_shift', 1),
+                                         ('window_size', 25)]))
+        other_fn = sound_file_path('beijing_m5_17_c.wav')
+        self.assertNotEqual(key, cache.key(other_fn, 'shrF0',
+                                           [('frame_shift', 1),
+                                            ('window_size', 25)]))
+
+    def test_file_digest(self):
+        self.assertEqual(file_digest(self.wav_fn),
+                         file_digest(self.wav_fn, block_size=1000))
+
+    def test_lru_eviction(self):
+        values = np.zeros(1000)
+        cache = MeasurementCache(self.cache_dir, 1024 * 1024)
+        cache.put('aa01', values)
+        entry_size = cache.size()
+        cache = MeasurementCache(self.cache_dir, 2 * entry_size)
+        cache.put('bb02', values)
+        # Make the first entry the most recently used one
+        t = os.path.getmtime(cache._entry_path('bb02'))
+        os.utime(cache._entry_path('bb02'), (t - 20, t - 20))
+        os.utime(cache._entry_path('aa01'), (t - 10, t - 10))
+        cache.put('cc03', values)
+        self.assertIn('aa01', cache)
+        self.assertNotIn('bb02', cache)
+        self.assertIn('cc03', cache)
+        self.assertEqual(cache.size(), 2 * entry_size)
+        # Opening the cache with a smaller size evicts entries right away
+        cache = MeasurementCache(self.cache_dir, entry_size)
+        self.assertNotIn('aa01', cache)
+        self.assertIn('cc03', cache)
+        # Reading an entry marks it as used
+        os.utime(cache._entry_path('cc03'), (t - 30, t - 30))
+        cache.get('cc03')
+        self.assertGreaterEqual(os.path.getmtime(cache._entry_path('cc03')),
+                                t)
@@ -1,4 +1,6 @@
 import contextlib
+import csv
+import json
 import os
 import sys
 import textwrap
@@ -6,7 +8,7 @@ import re
 import unittest
 import numpy as np
 from sys import platform
-from shutil import copytree
+from shutil import copy, copytree
 from subprocess import Popen, PIPE
 
 from opensauce.__main__ import CLI
@@ -220,6 +222,432 @@ class TestCommandIO(TestCase):
         self.assertEqual(len([x for x in lines
                               if 'hmong_f4_24_d.wav' in x]), 2092)
 
+    def test_jobs(self):
+        args = [
+            '--measurements', 'snackF0', 'shrF0',
+            '--include-empty-labels',
+            '--no-output-settings',
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('beijing_m5_17_c.wav'),
+            sound_file_path('hmong_f4_24_d.wav'),
+            ]
+        lines_serial = CLI_output(self, '\t', args)
+        lines_parallel = CLI_output(self, '\t', args + ['--jobs', '2'])
+        self.assertEqual(len(lines_parallel), 6100)
+        self.assertEqual(lines_parallel, lines_serial)
+
+    def test_jobs_no_textgrid_message(self):
+        lines = CLI_output(self, '\t', [
+            data_file_path(os.path.join('cli', 'beijing_f3_50_a.wav')),
+            sound_file_path('beijing_f3_50_a.wav'),
+            '--measurements', 'snackF0',
+            '--jobs', '2',
+            '--no-output-settings',
+            ])
+        self.assertEqual(len(lines), 2342 + 584)
+        self.assertIn('Found no TextGrid for', lines[1][0])
+        self.assertEqual(len([x for x in lines if 'C1' in x]), 100)
+
+    def test_batch_size_praat(self):
+        args = [
+            '--measurements', 'praatF0', 'praatFormants',
+            '--include-empty-labels',
+            '--no-output-settings',
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('beijing_m5_17_c.wav'),
+            sound_file_path('hmong_f4_24_d.wav'),
+            ]
+        lines_batch = CLI_output(self, '\t', args)
+        lines_single = CLI_output(self, '\t', args + ['--batch-size', '1'])
+        self.assertEqual(len(lines_batch), 6100)
+        self.assertEqual(lines_batch, lines_single)
+
+    def test_batch_size_snack(self):
+        args = [
+            '--measurements', 'snackF0', 'snackFormants',
+            '--snack-method', 'tcl',
+            '--include-empty-labels',
+            '--no-output-settings',
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('beijing_m5_17_c.wav'),
+            sound_file_path('hmong_f4_24_d.wav'),
+            ]
+        lines_batch = CLI_output(self, '\t', args)
+        lines_single = CLI_output(self, '\t', args + ['--batch-size', '1'])
+        self.assertEqual(len(lines_batch), 6100)
+        self.assertEqual(lines_batch, lines_single)
+
+    def test_praat_pitch_and_formants_resample(self):
+        args = [
+            sound_file_path('beijing_f3_50_a.wav'),
+            '--measurements', 'praatF0', 'praatFormants',
+            '--resample-freq', '16000',
+            '--no-output-settings',
+            ]
+        lines = CLI_output(self, '\t', args)
+        self.assertEqual(len(lines), 585)
+        self.assertEqual(lines[0][-9:], ['praatF0', 'pF1', 'pF2', 'pF3',
+                                         'pF4', 'pB1', 'pB2', 'pB3', 'pB4'])
+        lines_f0 = CLI_output(self, '\t', args[:3] + args[4:])
+        self.assertEqual([x[:6] for x in lines], lines_f0)
+
+    def test_praat_batch_pitch_failure(self):
+        err_msg = 'Praat error -- pitch calculation failed, check input parameters'
+        with self.assertRaisesRegex(OSError, err_msg):
+            CLI_output(self, '\t', [
+                sound_file_path('beijing_f3_50_a.wav'),
+                sound_file_path('beijing_m5_17_c.wav'),
+                '--measurements', 'praatF0',
+                '--praat-min-f0', '400',
+                '--no-output-settings',
+                ])
+
+    def test_cache_dir(self):
+        cache_dir = os.path.join(self.tmpdir(), 'cache')
+        args = [
+            '--measurements', 'praatF0', 'praatFormants', 'SHR',
+            '--include-empty-labels',
+            '--no-output-settings',
+            '--cache-dir', cache_dir,
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('beijing_m5_17_c.wav'),
+            ]
+        lines = CLI_output(self, '\t', args)
+        self.assertEqual(len(lines), 4008)
+        # All results come from the cache, so Praat and Snack aren't needed
+        lines_cached = CLI_output(self, '\t', args + [
+            '--praat-path', 'nonexistent-praat',
+            '--tcl-cmd', 'nonexistent-tclsh',
+            '--snack-method', 'tcl',
+            ])
+        self.assertEqual(lines_cached, lines)
+        # Changing a parameter of an algorithm recomputes its measurements
+        with self.assertRaises(OSError):
+            CLI_output(self, '\t', args + [
+                '--praat-path', 'nonexistent-praat',
+                '--praat-max-f0', '400',
+                ])
+
+    def test_profile(self):
+        args = [
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('beijing_m5_17_c.wav'),
+            '--measurements', 'praatF0', 'SHR',
+            '--no-output-settings',
+            ]
+        report_path = os.path.join(self.tmpdir(), 'profile.json')
+        lines = CLI_output(self, '\t', args + ['--profile', report_path])
+        self.assertEqual(lines, CLI_output(self, '\t', args))
+        from opensauce import profiling
+        self.assertFalse(profiling.enabled())
+        with open(report_path) as f:
+            report = json.load(f)
+        stages = dict((s['stage'], s) for s in report['stages'])
+        # Both files are analyzed by one Praat process
+        self.assertEqual(stages['praat batch']['subprocesses'], 1)
+        self.assertEqual(stages['praat batch/subprocess']['calls'], 1)
+        self.assertEqual(report['run']['subprocesses'], 1)
+        self.assertEqual(stages['read']['calls'], 2)
+        self.assertEqual(stages['SHR']['calls'], 2)
+        self.assertEqual(stages['write']['calls'], 2)
+        self.assertEqual([f['file'] for f in report['files']],
+                         ['beijing_f3_50_a.wav', 'beijing_m5_17_c.wav'])
+        for f in report['files']:
+            self.assertEqual([s['stage'] for s in f['stages']],
+                             ['SHR', 'SHR/decode', 'praatF0', 'read', 'write'])
+
+    def test_profile_jobs(self):
+        report_path = os.path.join(self.tmpdir(), 'profile.csv')
+        CLI_output(self, '\t', [
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('beijing_m5_17_c.wav'),
+            '--measurements', 'shrF0',
+            '--no-output-settings',
+            '--jobs', '2',
+            '--profile', report_path,
+            ])
+        with open(report_path) as f:
+            rows = list(csv.DictReader(f))
+        # The stages of the worker processes are in the report
+        files = set(row['file'] for row in rows if row['stage'] == 'shrF0')
+        self.assertEqual(files, set(['', 'beijing_f3_50_a.wav',
+                                     'beijing_m5_17_c.wav']))
+        self.assertEqual(rows[-1]['stage'], 'run')
+
+    def test_unneeded_default_f0_and_formants_skipped(self):
+        # Neither the default F0 (Snack) nor the default formants (Praat)
+        # are used by SHR, so the programs aren't needed
+        lines = CLI_output(self, '\t', [
+            '--measurements', 'SHR',
+            '--snack-method', 'tcl',
+            '--tcl-cmd', 'nonexistent-tclsh',
+            '--praat-path', 'nonexistent-praat',
+            '--no-output-settings',
+            sound_file_path('beijing_f3_50_a.wav'),
+            ])
+        self.assertEqual(len(lines), 585)
+        self.assertEqual(lines[0][-1], 'SHR')
+
+    def test_shr_computed_once(self):
+        import opensauce.shrp
+        calls = []
+        shr_pitch = opensauce.shrp.shr_pitch
+        def counting_shr_pitch(*args, **kwargs):
+            calls.append(args)
+            return shr_pitch(*args, **kwargs)
+        opensauce.shrp.shr_pitch = counting_shr_pitch
+        self.addCleanup(setattr, opensauce.shrp, 'shr_pitch', shr_pitch)
+        CLI_output(self, '\t', [
+            '--measurements', 'shrF0', 'SHR', 'praatF0',
+            '--no-output-settings',
+            sound_file_path('beijing_f3_50_a.wav'),
+            ])
+        self.assertEqual(len(calls), 1)
+
+    def test_measurement_dependencies(self):
+        cli = CLI(['--measurements', 'SHR', 'praatF0',
+                   '--f0', 'reaperF0',
+                   sound_file_path('beijing_f3_50_a.wav')])
+        self.assertEqual(cli._required_measurements(['SHR', 'praatF0']),
+                         ['SHR', 'praatF0'])
+        # 'F0' and 'formants' are resolved to the --f0 and --formants
+        # algorithms
+        cli.measurement_inputs = dict(cli.measurement_inputs,
+                                      SHR=['wavdata', 'F0', 'formants'])
+        self.assertEqual(cli._required_measurements(['SHR', 'praatF0']),
+                         ['reaperF0', 'praatFormants', 'SHR', 'praatF0'])
+        # The inputs of available measurements aren't needed
+        self.assertEqual(cli._required_measurements(['SHR', 'praatF0'],
+                                                    lambda m: m == 'SHR'),
+                         ['SHR', 'praatF0'])
+        cli.measurement_inputs['reaperF0'] = ['SHR']
+        with self.assertRaisesRegex(ValueError, 'Circular dependency'):
+            cli._required_measurements(['SHR'])
+
+    def test_threads(self):
+        args = [
+            '--measurements', 'snackF0', 'praatF0', 'shrF0', 'SHR',
+            'praatFormants', 'snackFormants',
+            '--snack-method', 'tcl',
+            '--batch-size', '1',
+            '--include-empty-labels',
+            '--no-output-settings',
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('beijing_m5_17_c.wav'),
+            ]
+        lines = CLI_output(self, '\t', args)
+        lines_threads = CLI_output(self, '\t', args + ['--threads', '4'])
+        self.assertEqual(len(lines), 4008)
+        self.assertEqual(lines_threads, lines)
+
+    def test_threads_resample(self):
+        args = [
+            '--measurements', 'praatF0', 'shrF0', 'reaperF0',
+            '--use-pyreaper',
+            '--resample-freq', '16000',
+            '--no-output-settings',
+            sound_file_path('beijing_f3_50_a.wav'),
+            ]
+        lines = CLI_output(self, '\t', args)
+        lines_threads = CLI_output(self, '\t', args + ['--threads', '3'])
+        self.assertEqual(lines_threads, lines)
+
+    def test_output_format_npz(self):
+        tmp = self.tmpdir()
+        outfile = os.path.join(tmp, 'output.npz')
+        args = [
+            '--measurements', 'praatFormants', 'SHR',
+            '--include-empty-labels',
+            '--include-interval-endpoint',
+            '--output-settings',
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('beijing_m5_17_c.wav'),
+            ]
+        lines = CLI_output(self, '\t', args + ['--no-output-settings'])
+        CLI(args + ['--output-format', 'npz', '-o', outfile]).process()
+        with np.load(outfile) as columns:
+            self.assertEqual(columns.files, lines[0])
+            self.assertEqual(len(columns['t_ms']), len(lines) - 1)
+            for i, name in enumerate(lines[0]):
+                values = columns[name]
+                if values.dtype.kind == 'U':
+                    text = list(values)
+                elif values.dtype.kind == 'i':
+                    text = [format(x, 'd') for x in values]
+                else:
+                    self.assertEqual(values.dtype, np.float64)
+                    text = ['NaN' if np.isnan(x) else format(x, '.3f')
+                            for x in values]
+                self.assertEqual(text, [line[i] for line in lines[1:]])
+        with open(outfile.split('.')[0] + '.settings') as f:
+            slines = f.read().splitlines()
+        self.assertIn('--output-format npz', slines)
+        self.assertIn('--output-dtype float64', slines)
+
+    def test_output_dtype_float32(self):
+        outfile = os.path.join(self.tmpdir(), 'output.npz')
+        CLI(['--measurements', 'SHR',
+             '--output-format', 'npz',
+             '--output-dtype', 'float32',
+             '--no-output-settings',
+             '-o', outfile,
+             sound_file_path('beijing_f3_50_a.wav'),
+             ]).process()
+        with np.load(outfile) as columns:
+            self.assertEqual(columns['SHR'].dtype, np.float32)
+            self.assertEqual(columns['t_ms'].dtype, np.int64)
+
+    def test_precision_float32(self):
+        outfile = os.path.join(self.tmpdir(), 'output.txt')
+        args = [
+            '--measurements', 'shrF0', 'SHR',
+            '--include-empty-labels',
+            sound_file_path('beijing_f3_50_a.wav'),
+            ]
+        lines = CLI_output(self, '\t', args + ['--no-output-settings'])
+        CLI(args + ['--precision', 'float32', '-o', outfile]).process()
+        with open(outfile) as f:
+            lines32 = [line.split('\t') for line in f.read().splitlines()]
+        self.assertEqual(len(lines32), len(lines))
+        self.assertEqual(lines32[0], lines[0])
+        shr_col = lines[0].index('SHR')
+        for line32, line in zip(lines32[1:], lines[1:]):
+            # F0 and the other columns are the same, SHR may differ in the
+            # last decimal
+            self.assertEqual(line32[:shr_col], line[:shr_col])
+            if line[shr_col] == 'NaN':
+                self.assertEqual(line32[shr_col], 'NaN')
+            else:
+                self.assertAlmostEqual(float(line32[shr_col]),
+                                       float(line[shr_col]), delta=0.0015)
+        with open(outfile.split('.')[0] + '.settings') as f:
+            slines = f.read().splitlines()
+        self.assertIn('--precision float32', slines)
+
+    def test_binary_output_format_requires_output_file(self):
+        with self.assertArgparseError(['--output-format npz requires an output file']):
+            CLI(['--measurements', 'SHR',
+                 '--output-format', 'npz',
+                 sound_file_path('beijing_f3_50_a.wav'),
+                 ])
+
+    def test_binary_output_format_requires_library(self):
+        try:
+            import h5py
+        except ImportError:
+            pass
+        else:
+            self.skipTest('h5py is installed')
+        with self.assertArgparseError(['--output-format hdf5 requires the Python library h5py']):
+            CLI(['--measurements', 'SHR',
+                 '--output-format', 'hdf5',
+                 '-o', os.path.join(self.tmpdir(), 'output.h5'),
+                 sound_file_path('beijing_f3_50_a.wav'),
+                 ])
+
+    def test_analyze_intervals(self):
+        args = [
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('hmong_f4_24_d.wav'),
+            '--measurements', 'shrF0', 'SHR',
+            ]
+        lines = CLI_output(self, '\t', args + ['--no-output-settings'])
+        # Record the number of samples analyzed
+        analyzed = []
+        compute_measurements = CLI._compute_measurements
+        def record(cli, soundfile, *args, **kwargs):
+            analyzed.append(soundfile.ns)
+            return compute_measurements(cli, soundfile, *args, **kwargs)
+        self.addCleanup(setattr, CLI, '_compute_measurements',
+                        compute_measurements)
+        CLI._compute_measurements = record
+        outfile = os.path.join(self.tmpdir(), 'output.txt')
+        CLI(args + ['--analyze-intervals', '-o', outfile]).process()
+        with open(outfile) as f:
+            lines_intervals = [line.split('\t')
+                               for line in f.read().splitlines()]
+        # Only the labeled intervals, with padding, are analyzed
+        self.assertLess(sum(analyzed), 0.75 * (51597 + 53760))
+        # The measurements are the same as for the whole sound file, except
+        # for small differences in SHR due to removing the mean of the
+        # analyzed part
+        self.assertEqual(len(lines_intervals), len(lines))
+        self.assertEqual(lines_intervals[0], lines[0])
+        for line_intervals, line in zip(lines_intervals[1:], lines[1:]):
+            self.assertEqual(line_intervals[:-1], line[:-1])
+            self.assertAlmostEqual(float(line_intervals[-1]), float(line[-1]),
+                                   delta=0.01)
+        with open(outfile.split('.')[0] + '.settings') as f:
+            slines = f.read().splitlines()
+        self.assertIn('--analyze-intervals', slines)
+        self.assertIn('--interval-padding 100', slines)
+
+    def test_analyze_intervals_praat(self):
+        args = [
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('hmong_f4_24_d.wav'),
+            '--measurements', 'praatF0', 'praatFormants', 'shrF0',
+            '--no-output-settings',
+            ]
+        lines = CLI_output(self, '\t', args)
+        # Record the number of samples analyzed for each measurement
+        analyzed = []
+        compute_measurements = CLI._compute_measurements
+        def record(cli, soundfile, measurements=None, results=None):
+            analyzed.append((soundfile.ns, measurements))
+            return compute_measurements(cli, soundfile, measurements, results)
+        self.addCleanup(setattr, CLI, '_compute_measurements',
+                        compute_measurements)
+        CLI._compute_measurements = record
+        lines_intervals = CLI_output(self, '\t', args + ['--analyze-intervals'])
+        # Praat analyzes the whole sound files, and SHR only the segments
+        whole = [(ns, m) for ns, m in analyzed if m is not None]
+        self.assertEqual(whole, [(51597, ['praatF0', 'praatFormants']),
+                                 (46129, ['praatF0', 'praatFormants'])])
+        self.assertLess(sum(ns for ns, m in analyzed if m is None),
+                        0.75 * (51597 + 46129))
+        # So the Praat measurements in the intervals are those of the whole
+        # sound files, even though Praat centers its frames in the sound
+        self.assertEqual(lines_intervals, lines)
+
+    def test_analyze_intervals_no_intervals(self):
+        # Nothing is output for a sound file whose intervals are all ignored
+        lines = CLI_output(self, '\t', [
+            sound_file_path('beijing_f3_50_a.wav'),
+            '--measurements', 'praatF0',
+            '--ignore-label', 'C1', '--ignore-label', 'V1',
+            '--ignore-label', 'C2', '--ignore-label', 'V2',
+            '--analyze-intervals',
+            '--no-output-settings',
+            ])
+        self.assertEqual(lines, [['Filename', 'Label', 'seg_Start', 'seg_End',
+                                  't_ms', 'praatF0']])
+
+    def test_analyze_intervals_without_textgrid(self):
+        # The whole sound file is analyzed
+        tmp = self.tmpdir()
+        wavpath = os.path.join(tmp, 'beijing_f3_50_a.wav')
+        copy(sound_file_path('beijing_f3_50_a.wav'), wavpath)
+        args = [wavpath, '--measurements', 'shrF0', '--no-output-settings']
+        lines = CLI_output(self, '\t', args)
+        self.assertEqual(CLI_output(self, '\t', args + ['--analyze-intervals']),
+                         lines)
+
+    def test_interval_padding_negative_integer(self):
+        with self.assertArgparseError(['error: argument --interval-padding: -5 is an invalid non-negative integer value']):
+            CLI([sound_file_path('beijing_f3_50_a.wav'),
+                 '--measurements', 'shrF0',
+                 '--analyze-intervals',
+                 '--interval-padding', '-5',
+                 ])
+
+    def test_jobs_negative_integer(self):
+        with self.assertArgparseError(['error: argument -j/--jobs: -2 is an invalid positive integer value']):
+            CLI([sound_file_path('beijing_f3_50_a.wav'),
+                 '--measurements', 'snackF0',
+                 '--jobs', '-2',
+                 ])
+
     def test_at_least_one_input_file_required(self):
         with self.assertArgparseError(['too few arguments'], ['required', 'wavfile']):
             CLI([])
@@ -841,6 +1269,32 @@ class TestCommandIO(TestCase):
         self.assertEqual(len(lines[1]), 6)
         self.assertFalse(os.path.exists(spath.split('.')[0] + '-resample-16000Hz.wav'))
 
+    def test_resample_method_polyphase(self):
+        tmp = self.tmpdir()
+        settings_path = os.path.join(tmp, 'output.settings')
+        lines = CLI_output(self, '\t', [
+            sound_file_path('beijing_f3_50_a.wav'),
+            '--measurements', 'shrF0',
+            '--include-empty-labels',
+            '--resample-freq', '16000',
+            '--resample-method', 'polyphase',
+            '--output-settings-path', settings_path,
+            ])
+        self.assertEqual(len(lines), 2341)
+        self.assertEqual(lines[0][-1], 'shrF0')
+        self.assertEqual(len(lines[1]), 6)
+        with open(settings_path) as f:
+            slines = f.readlines()
+        self.assertIn('--resample-method polyphase\n', slines)
+
+    def test_resample_method_invalid(self):
+        with self.assertArgparseError(['--resample-method', 'invalid choice', 'foo']):
+            CLI([sound_file_path('beijing_f3_50_a.wav'),
+                 '--measurements', 'snackF0',
+                 '--resample-freq', '16000',
+                 '--resample-method', 'foo',
+                ])
+
 
 @parameterize
 class TestCommandF0(TestCase):
@@ -909,6 +1363,19 @@ class TestCommandF0(TestCase):
         self.assertEqual(len([x for x in lines if 'C2' in x]), 118)
         self.assertEqual(len([x for x in lines if 'V2' in x]), 158)
 
+    @unittest.skipIf((platform == 'darwin') or using_conda,
+                     'Method to call Snack through Tkinter not supported')
+    def test_snack_method_python_multiple_files(self):
+        args = [
+            sound_file_path('beijing_f3_50_a.wav'),
+            sound_file_path('hmong_f4_24_d.wav'),
+            '--measurements', 'snackF0', 'snackFormants',
+            '--no-output-settings',
+            ]
+        lines_python = CLI_output(self, '\t', args + ['--snack-method', 'python'])
+        lines_tcl = CLI_output(self, '\t', args + ['--snack-method', 'tcl'])
+        self.assertEqual(lines_python, lines_tcl)
+
     @unittest.skipUnless(platform == 'win32' or platform == 'cygwin',
                          'Requires Windows operating system')
     def test_snackF0_method_exe(self):
@@ -72,6 +72,14 @@ class TestHarmonicsInternal(TestCase):
             for i in range(num_calcs):
                 self.assertAllClose(os_iseli[i, :], vs_iseli[i, :], rtol=1e-05, atol=1e-08, equal_nan=True)
 
+            # Single precision corrections are within a few thousandths of
+            # a dB
+            for i in range(num_calcs):
+                p1, p2, p3 = [sample[p].astype(np.float32) for p in iseli_param_table[i]]
+                corr = correction_iseli_i(p1, p2, p3, sample['Fs'])
+                self.assertEqual(corr.dtype, np.float32)
+                self.assertAllClose(corr, vs_iseli[i, :], rtol=0, atol=5e-3, equal_nan=True)
+
     def test_hawks_miller_against_voicesauce_data(self):
         # This table contains the names of the parameters used as arguments
         # to the bandwidth_hawks_miller() function.
@@ -1,7 +1,10 @@
 import os
 import shutil
+import numpy as np
 
-from opensauce.helpers import wavread, round_half_away_from_zero, remove_empty_lines_from_file, convert_boolean_for_praat
+from scipy.signal import resample_poly
+
+from opensauce.helpers import wavread, wavread_int, pcm_to_float, make_scratch_dir, resample_polyphase, nearest_time_indices, round_half_away_from_zero, remove_empty_lines_from_file, convert_boolean_for_praat
 
 from test.support import TestCase, data_file_path, sound_file_path, load_json
 
@@ -37,6 +40,81 @@ class TestSupport(TestCase):
             fn = data_file_path(os.path.join('helpers', 'wav-formats', 'pcm-24bit.wav'))
             samples, samples_int, Fs = wavread(fn)
 
+    def test_wavread_int(self):
+        fn = sound_file_path('beijing_f3_50_a.wav')
+        samples, samples_int, Fs = wavread(fn)
+        for mmap in (False, True):
+            y, fs = wavread_int(fn, mmap=mmap)
+            self.assertEqual(fs, Fs)
+            self.assertTrue(y.dtype == 'int16')
+            self.assertTrue(np.array_equal(y, samples_int))
+        self.assertIs(type(y), np.ndarray)
+        self.assertFalse(y.flags.writeable)
+        # Other formats, including those that can't be memory-mapped, give
+        # the same errors as reading the file
+        for fmt in ('pcm-8bit', 'pcm-24bit', 'float-32bit'):
+            fn = data_file_path(os.path.join('helpers', 'wav-formats', fmt + '.wav'))
+            errors = []
+            for mmap in (False, True):
+                try:
+                    wavread_int(fn, mmap=mmap)
+                except (IOError, ValueError) as err:
+                    errors.append((type(err), str(err)))
+            self.assertEqual(len(errors), 2)
+            self.assertEqual(errors[0], errors[1])
+
+    def test_pcm_to_float(self):
+        fn = sound_file_path('beijing_f3_50_a.wav')
+        samples, samples_int, Fs = wavread(fn)
+        self.assertTrue(np.array_equal(pcm_to_float(samples_int), samples))
+        blocks = [pcm_to_float(samples_int, i, i + 1000)
+                  for i in range(0, len(samples_int), 1000)]
+        self.assertTrue(np.array_equal(np.concatenate(blocks), samples))
+
+    def test_make_scratch_dir(self):
+        d1 = make_scratch_dir()
+        d2 = make_scratch_dir()
+        try:
+            self.assertTrue(os.path.isdir(d1))
+            self.assertNotEqual(d1, d2)
+            self.assertEqual(os.listdir(d1), [])
+        finally:
+            shutil.rmtree(d1)
+            shutil.rmtree(d2)
+
+    def test_resample_polyphase(self):
+        fn = sound_file_path('beijing_f3_50_a.wav')
+        samples, samples_int, Fs = wavread(fn)
+        expected = resample_poly(samples, 320, 441)
+        for block_len in (1, 1000, 65536):
+            actual = resample_polyphase(samples, 16000, Fs, block_len=block_len)
+            self.assertEqual(len(actual), 37440)
+            self.assertAllClose(actual, expected, rtol=1e-12, atol=1e-15)
+        # Upsampling and short signals
+        x = np.random.RandomState(0).randn(25)
+        for up, down in ((3, 2), (2, 3), (1, 1)):
+            self.assertAllClose(resample_polyphase(x, up, down, block_len=4),
+                                resample_poly(x, up, down), rtol=1e-12, atol=1e-15)
+
+    def test_nearest_time_indices(self):
+        # Ties go to the first index, as with np.argmin
+        t_raw = np.array([0, 3, 3, 6, 10, 30])
+        t = np.arange(0, 40, 2)
+        index, valid = nearest_time_indices(t_raw, t, 2)
+        for i in range(len(t)):
+            d = np.abs(t_raw - t[i])
+            self.assertEqual(index[i], np.argmin(d))
+            self.assertEqual(valid[i], d[index[i]] <= 2)
+        # Unsorted raw times
+        rng = np.random.RandomState(0)
+        t_raw = rng.randint(0, 100, 50)
+        t = np.arange(-5, 110, 0.5)
+        index, valid = nearest_time_indices(t_raw, t, 1)
+        for i in range(len(t)):
+            d = np.abs(t_raw - t[i])
+            self.assertEqual(index[i], np.argmin(d))
+            self.assertEqual(valid[i], d[index[i]] <= 1)
+
     def test_round_half_away_from_zero(self):
         self.assertEqual(round_half_away_from_zero(3.5), 4)
         self.assertEqual(round_half_away_from_zero(3.2), 3)
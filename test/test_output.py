@@ -0,0 +1,239 @@
+import csv
+import io
+import os
+import sys
+import unittest
+import numpy as np
+
+from opensauce.output import (OutputStream, OutputTable, TextWriter,
+                              native_dialect, output_columns, output_writer)
+
+from test.support import TestCase, py2
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def make_tables():
+    return [
+        OutputTable('a.wav', [('x', 0.0, 2.5, 2), ('', 2.5, 4.0, 1)],
+                    np.array([0, 1, 2]),
+                    [np.array([1.5, np.nan, 2.25]), np.array([1.0, 2.0, 3.0])]),
+        OutputTable('bb.wav', [('yy', 1.0, 2.0, 1)],
+                    np.array([1]),
+                    [np.array([4.0]), np.array([np.nan])]),
+        ]
+
+
+class TestOutputTable(TestCase):
+
+    def test_columns(self):
+        table = make_tables()[0]
+        columns = list(table.columns(['F0', 'SHR'], True, dtype='float32'))
+        self.assertEqual([name for name, _ in columns],
+                         ['Filename', 'Label', 'seg_Start', 'seg_End', 't_ms',
+                          'F0', 'SHR'])
+        columns = dict(columns)
+        self.assertEqual(list(columns['Filename']), ['a.wav'] * 3)
+        self.assertEqual(list(columns['Label']), ['x', 'x', ''])
+        self.assertAllClose(columns['seg_Start'], np.array([0.0, 0.0, 2.5]))
+        self.assertAllClose(columns['seg_End'], np.array([2.5, 2.5, 4.0]))
+        self.assertEqual(columns['t_ms'].dtype, np.int64)
+        self.assertEqual(columns['F0'].dtype, np.float32)
+        self.assertAllClose(columns['F0'], np.array([1.5, np.nan, 2.25]),
+                            equal_nan=True)
+
+    def test_columns_without_labels(self):
+        table = make_tables()[0]
+        names = [name for name, _ in table.columns(['F0', 'SHR'], False)]
+        self.assertEqual(names, ['Filename', 't_ms', 'F0', 'SHR'])
+        self.assertEqual(names, [name for name, _ in
+                                 output_columns(['F0', 'SHR'], False)])
+
+
+class TestTextWriter(TestCase):
+
+    def csv_output(self, tables, dialect, include_labels, NaN):
+        # Reference output written cell by cell with a csv.writer
+        f = io.StringIO()
+        writer = csv.writer(f, dialect=dialect)
+        for table in tables:
+            i = 0
+            for label, start, stop, nrows in table.intervals:
+                for j in range(i, i + nrows):
+                    row = [table.filename]
+                    if include_labels:
+                        row += [label, format(start, '.3f'),
+                                format(stop, '.3f')]
+                    row.append(format(table.t_ms[j], 'd'))
+                    row += [NaN if np.isnan(v[j]) else format(v[j], '.3f')
+                            for v in table.data]
+                    writer.writerow(row)
+                i += nrows
+        return f.getvalue()
+
+    def text_output(self, tables, dialect, include_labels, NaN, rstrip=False):
+        f = io.StringIO()
+        writer = TextWriter(f, dialect, include_labels, NaN, rstrip)
+        for table in tables:
+            writer.write(table)
+        return f.getvalue()
+
+    def test_same_as_csv_writer(self):
+        tables = make_tables() + [
+            OutputTable('banana, "nan".wav',
+                        [('a,b', 0.0005, 1.0015, 3), ('q"\tx', 2.0, 3.0, 0),
+                         ('nan', 3.0, 5.0, 2)],
+                        np.array([0, 1, 2, 3, 4]),
+                        [np.array([0.0005, -1.2345, np.inf, -np.inf, 1e20]),
+                         np.array([np.nan, 2.0015, -0.0004, 123456.789, 7.0])]),
+            ]
+        for dialect in (csv.excel, csv.excel_tab):
+            for include_labels in (True, False):
+                for NaN in ('NaN', '', 'x,y', 'a\tb', '"'):
+                    self.assertEqual(
+                        self.text_output(tables, dialect, include_labels, NaN),
+                        self.csv_output(tables, dialect, include_labels, NaN))
+
+    def test_rstrip(self):
+        tables = make_tables()
+        for dialect in (csv.excel, csv.excel_tab):
+            for NaN in ('NaN', '', ' '):
+                expected = ''.join(
+                    line.rstrip() + '\r\n' for line in
+                    self.csv_output(tables, dialect, True, NaN).splitlines())
+                self.assertEqual(
+                    self.text_output(tables, dialect, True, NaN, rstrip=True),
+                    expected)
+        # The last column of bb.wav is missing
+        self.assertTrue(self.text_output(tables, csv.excel_tab, True, '',
+                                         rstrip=True).endswith('4.000\r\n'))
+
+    def test_native_dialect(self):
+        dialect = native_dialect(csv.excel_tab)
+        self.assertEqual(dialect.lineterminator, '\n')
+        self.assertEqual(dialect.delimiter, '\t')
+        self.assertEqual(csv.excel_tab.lineterminator, '\r\n')
+
+    def test_writerow(self):
+        f = io.StringIO()
+        TextWriter(f, csv.excel, True, 'NaN').writerow(['Filename', 't_ms'])
+        self.assertEqual(f.getvalue(), 'Filename,t_ms\r\n')
+
+
+class TestOutputStream(TestCase):
+
+    def write_tables(self, stream, dialect=csv.excel):
+        writer = TextWriter(stream, dialect, True, 'NaN')
+        writer.writerow(['Filename', 't_ms'])
+        for table in make_tables():
+            writer.write(table)
+
+    def expected(self):
+        f = io.StringIO()
+        self.write_tables(f)
+        return f.getvalue()
+
+    @unittest.skipIf(py2, 'the Python 2 csv module writes bytes')
+    def test_file_line_endings(self):
+        path = os.path.join(self.tmpdir(), 'output.txt')
+        stream = OutputStream(path)
+        self.assertTrue(stream.native_line_endings)
+        self.write_tables(stream, native_dialect(csv.excel))
+        stream.close()
+        with open(path, 'rb') as f:
+            data = f.read()
+        expected = self.expected().replace('\r\n', os.linesep)
+        self.assertEqual(data, expected.encode('ascii'))
+        self.assertEqual(data.count(os.linesep.encode('ascii')), 5)
+        if os.linesep == '\n':
+            self.assertNotIn(b'\r', data)
+
+    @unittest.skipIf(py2, 'sys.stdout has no binary buffer on Python 2')
+    def test_stdout_line_endings(self):
+        buf = io.BytesIO()
+        # Text mode stdout that would translate '\n' to '\r\n'
+        stdout = io.TextIOWrapper(buf, encoding='ascii', newline='\r\n')
+        self.addCleanup(setattr, sys, 'stdout', sys.stdout)
+        sys.stdout = stdout
+        stdout.write('before\n')
+        stream = OutputStream()
+        self.assertFalse(stream.native_line_endings)
+        self.write_tables(stream)
+        stream.close()
+        stdout.write('after\n')
+        stdout.flush()
+        self.assertEqual(buf.getvalue(),
+                         b'before\r\n' + self.expected().encode('ascii') +
+                         b'after\r\n')
+
+    def test_stdout_without_buffer(self):
+        with self.captured_output('stdout') as out:
+            stream = OutputStream()
+            self.write_tables(stream)
+            stream.close()
+        self.assertEqual(out.getvalue(), self.expected())
+
+
+class TestOutputWriters(TestCase):
+
+    def write(self, output_format, tables=None):
+        path = os.path.join(self.tmpdir(), 'output')
+        writer = output_writer(output_format, path, ['F0', 'SHR'], True)
+        for table in make_tables() if tables is None else tables:
+            writer.write(table)
+        writer.close()
+        return path
+
+    def check_columns(self, columns):
+        self.assertEqual(list(columns['Filename']),
+                         ['a.wav', 'a.wav', 'a.wav', 'bb.wav'])
+        self.assertEqual(list(columns['Label']), ['x', 'x', '', 'yy'])
+        self.assertEqual(list(columns['t_ms']), [0, 1, 2, 1])
+        self.assertAllClose(np.asarray(columns['F0']),
+                            np.array([1.5, np.nan, 2.25, 4.0]),
+                            equal_nan=True)
+        self.assertAllClose(np.asarray(columns['SHR']),
+                            np.array([1.0, 2.0, 3.0, np.nan]),
+                            equal_nan=True)
+
+    def test_npz(self):
+        with np.load(self.write('npz')) as columns:
+            self.assertEqual(columns.files,
+                             ['Filename', 'Label', 'seg_Start', 'seg_End',
+                              't_ms', 'F0', 'SHR'])
+            self.check_columns(columns)
+
+    def test_npz_empty(self):
+        with np.load(self.write('npz', tables=[])) as columns:
+            self.assertEqual(len(columns.files), 7)
+            self.assertEqual(len(columns['Filename']), 0)
+
+    @unittest.skipIf(h5py is None, 'Requires Python library h5py')
+    def test_hdf5(self):
+        with h5py.File(self.write('hdf5'), 'r') as f:
+            columns = {name: f[name][()] for name in f}
+        for name in ('Filename', 'Label'):
+            columns[name] = [x.decode('utf-8') if isinstance(x, bytes) else x
+                             for x in columns[name]]
+        self.check_columns(columns)
+
+    @unittest.skipIf(pyarrow is None, 'Requires Python library pyarrow')
+    def test_parquet(self):
+        table = pyarrow.parquet.read_table(self.write('parquet'))
+        self.assertEqual(table.column_names,
+                         ['Filename', 'Label', 'seg_Start', 'seg_End',
+                          't_ms', 'F0', 'SHR'])
+        self.check_columns({name: table.column(name).to_pylist()
+                            for name in table.column_names})
+
+    def test_unknown_format(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown binary output format'):
+            output_writer('text', 'out', [], True)
@@ -1,6 +1,8 @@
 from __future__ import division
 
+import os
 import random
+import shutil
 import numpy as np
 
 from sys import platform
@@ -8,7 +10,7 @@ from sys import platform
 # Import user-defined global configuration variables
 from conf.userconf import user_praat_path
 
-from opensauce.praat import praat_pitch, praat_raw_pitch, praat_formants, praat_raw_formants
+from opensauce.praat import praat_pitch, praat_raw_pitch, praat_formants, praat_raw_formants, praat_pitch_and_formants, praat_raw_batch, parse_praat_table
 
 from opensauce.soundfile import SoundFile
 
@@ -143,3 +145,92 @@ class TestPraatFormants(TestCase):
                 # Check that our estimates and sample_data are "close enough"
                 # for floating precision
                 self.assertTrue((np.isclose(estimates_raw[n], sample_data, rtol=1e-05, atol=1e-08) | (np.isnan(estimates_raw[n]) & np.isnan(sample_data))).all())
+
+
+class TestPraatPitchAndFormants(TestCase):
+
+    def test_matches_separate_analysis(self):
+        for fn in wav_fns[:2]:
+            sound_file = SoundFile(fn)
+            data_len = np.int_(np.floor(sound_file.ns / sound_file.fs * 1000))
+            F0, estimates = praat_pitch_and_formants(fn, data_len,
+                                                     default_praat_path,
+                                                     num_formants=3)
+            self.assertAllClose(F0, praat_pitch(fn, data_len,
+                                                default_praat_path),
+                                equal_nan=True)
+            estimates_sep = praat_formants(fn, data_len, default_praat_path,
+                                           num_formants=3)
+            self.assertEqual(sorted(estimates), sorted(estimates_sep))
+            for k in estimates_sep:
+                self.assertAllClose(estimates[k], estimates_sep[k],
+                                    equal_nan=True)
+
+    def test_pitch_failure(self):
+        fn = wav_fns[0]
+        err_msg = 'Praat error -- pitch calculation failed, check input parameters'
+        with self.assertRaisesRegex(OSError, err_msg):
+            praat_pitch_and_formants(fn, 100, default_praat_path,
+                                     min_pitch=400)
+
+
+class TestPraatBatch(TestCase):
+
+    def test_batch_matches_single_file(self):
+        fns = wav_fns[:3]
+        results = praat_raw_batch(fns, default_praat_path)
+        self.assertEqual(len(results), len(fns))
+        for fn, (pitch_raw, formants_raw) in zip(fns, results):
+            t_raw, F0_raw = praat_raw_pitch(fn, default_praat_path)
+            self.assertAllClose(pitch_raw[0], t_raw)
+            self.assertAllClose(pitch_raw[1], F0_raw, equal_nan=True)
+            estimates_raw = praat_raw_formants(fn, default_praat_path)
+            self.assertEqual(sorted(formants_raw), sorted(estimates_raw))
+            for k in estimates_raw:
+                self.assertAllClose(formants_raw[k], estimates_raw[k],
+                                    equal_nan=True)
+
+    def test_batch_single_measurement(self):
+        fns = wav_fns[:2]
+        results = praat_raw_batch(fns, default_praat_path,
+                                  measure_formants=False)
+        for pitch_raw, formants_raw in results:
+            self.assertEqual(len(pitch_raw), 2)
+            self.assertIsNone(formants_raw)
+        results = praat_raw_batch(fns, default_praat_path,
+                                  measure_pitch=False, num_formants=3)
+        for pitch_raw, formants_raw in results:
+            self.assertIsNone(pitch_raw)
+            self.assertIn('pF3', formants_raw)
+            self.assertNotIn('pF4', formants_raw)
+
+    def test_batch_pitch_failure(self):
+        results = praat_raw_batch(wav_fns[:1], default_praat_path,
+                                  min_pitch=400, measure_formants=False)
+        self.assertEqual(results, [(None, None)])
+
+
+class TestPraatOutput(TestCase):
+
+    def test_parse_praat_table(self):
+        data = parse_praat_table(b'time(s)\tnformants\tF1(Hz)\n'
+                                 b'0.025\t4\t742.894\n'
+                                 b'0.026\t3\t--undefined--\n', 3)
+        self.assertEqual(data.shape, (2, 3))
+        self.assertAllClose(data, np.array([[0.025, 4, 742.894],
+                                            [0.026, 3, np.nan]]),
+                            equal_nan=True)
+
+    def test_parse_praat_table_empty(self):
+        self.assertEqual(parse_praat_table(b'', 2).shape, (0, 2))
+        self.assertEqual(parse_praat_table(b'Time\tF0\n', 2).shape, (0, 2))
+
+    def test_no_files_written_next_to_wav(self):
+        tmp = self.tmpdir()
+        fn = os.path.join(tmp, os.path.basename(wav_fns[0]))
+        shutil.copy(wav_fns[0], fn)
+        praat_raw_pitch(fn, default_praat_path)
+        praat_raw_pitch(fn, default_praat_path, method='ac')
+        praat_raw_formants(fn, default_praat_path)
+        praat_raw_batch([fn], default_praat_path)
+        self.assertEqual(os.listdir(tmp), [os.path.basename(fn)])
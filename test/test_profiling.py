@@ -0,0 +1,132 @@
+import csv
+import json
+import os
+import threading
+
+from opensauce import profiling
+
+from test.support import TestCase
+
+
+class TestProfiling(TestCase):
+
+    def setUp(self):
+        self.addCleanup(profiling.disable)
+
+    def test_disabled(self):
+        self.assertFalse(profiling.enabled())
+        with profiling.stage('read', 'a.wav') as s:
+            profiling.count_subprocess()
+        # The same do-nothing stage every time
+        self.assertIs(profiling.stage('write'), s)
+        self.assertEqual(profiling.take_records(), [])
+
+    def test_nested_stages(self):
+        profiler = profiling.enable()
+        self.assertTrue(profiling.enabled())
+        for _ in range(2):
+            with profiling.stage('praatF0', 'a.wav'):
+                with profiling.stage('subprocess'):
+                    profiling.count_subprocess()
+                with profiling.stage('parse'):
+                    pass
+        with profiling.stage('praat batch'):
+            profiling.count_subprocess()
+        records = dict(((filename, path), values)
+                       for filename, path, values in profiler.records())
+        self.assertEqual(sorted(records, key=str), [
+            ('a.wav', 'praatF0'),
+            ('a.wav', 'praatF0/parse'),
+            ('a.wav', 'praatF0/subprocess'),
+            (None, 'praat batch'),
+            ])
+        calls, wall, cpu, child_cpu, subprocesses, peak_rss = \
+            records[('a.wav', 'praatF0')]
+        self.assertEqual(calls, 2)
+        self.assertEqual(subprocesses, 2)
+        self.assertGreaterEqual(wall, records[('a.wav', 'praatF0/parse')][1])
+        self.assertEqual(records[('a.wav', 'praatF0/parse')][4], 0)
+        self.assertEqual(records[(None, 'praat batch')][4], 1)
+        self.assertIs(profiling.disable(), profiler)
+        self.assertFalse(profiling.enabled())
+
+    def test_threads(self):
+        profiler = profiling.enable()
+        def work(filename):
+            with profiling.stage('shrF0', filename):
+                with profiling.stage('decode'):
+                    pass
+        threads = [threading.Thread(target=work, args=(fn,))
+                   for fn in ('a.wav', 'b.wav')]
+        with profiling.stage('write', 'c.wav'):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        # The stages of each thread are nested only in that thread's stages
+        self.assertEqual(sorted((f, p) for f, p, _ in profiler.records()), [
+            ('a.wav', 'shrF0'), ('a.wav', 'shrF0/decode'),
+            ('b.wav', 'shrF0'), ('b.wav', 'shrF0/decode'),
+            ('c.wav', 'write'),
+            ])
+
+    def test_take_records_and_merge(self):
+        profiling.enable()
+        with profiling.stage('read', 'a.wav'):
+            pass
+        records = profiling.take_records()
+        self.assertEqual([(f, p) for f, p, _ in records], [('a.wav', 'read')])
+        self.assertEqual(profiling.take_records(), [])
+        # Records from a worker process are added up with the others
+        profiler = profiling.enable()
+        with profiling.stage('read', 'a.wav'):
+            pass
+        profiling.merge(records)
+        [(_, _, values)] = profiler.records()
+        self.assertEqual(values[0], 2)
+
+    def test_report(self):
+        profiler = profiling.enable()
+        for fn in ('b.wav', 'a.wav'):
+            with profiling.stage('read', fn):
+                pass
+            with profiling.stage('snackF0', fn):
+                with profiling.stage('subprocess'):
+                    profiling.count_subprocess()
+        with profiling.stage('praat batch'):
+            profiling.count_subprocess()
+        report = profiler.report()
+        self.assertEqual(report['run']['calls'], 1)
+        self.assertEqual(report['run']['subprocesses'], 3)
+        self.assertGreater(report['run']['wall_time'], 0)
+        self.assertEqual([s['stage'] for s in report['stages']],
+                         ['praat batch', 'read', 'snackF0',
+                          'snackF0/subprocess'])
+        self.assertEqual([s['calls'] for s in report['stages']], [1, 2, 2, 2])
+        self.assertEqual([f['file'] for f in report['files']],
+                         ['a.wav', 'b.wav'])
+        self.assertEqual([s['stage'] for s in report['files'][0]['stages']],
+                         ['read', 'snackF0', 'snackF0/subprocess'])
+        for s in report['stages']:
+            self.assertEqual(sorted(s),
+                             sorted(profiling.report_fields + ['stage']))
+
+    def test_write_report(self):
+        profiler = profiling.enable()
+        with profiling.stage('read', 'a.wav'):
+            pass
+        tmp = self.tmpdir()
+        json_path = os.path.join(tmp, 'profile.json')
+        profiler.write_report(json_path)
+        with open(json_path) as f:
+            report = json.load(f)
+        self.assertEqual(sorted(report), ['files', 'run', 'stages'])
+        self.assertEqual(report['files'][0]['file'], 'a.wav')
+        csv_path = os.path.join(tmp, 'profile.csv')
+        profiler.write_report(csv_path)
+        with open(csv_path) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['file', 'stage'] + profiling.report_fields)
+        self.assertEqual([row[:3] for row in rows[1:]],
+                         [['a.wav', 'read', '1'], ['', 'read', '1'],
+                          ['', 'run', '1']])
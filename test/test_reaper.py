@@ -1,5 +1,6 @@
 from __future__ import division
 
+import os
 import random
 import unittest
 import numpy as np
@@ -8,6 +9,7 @@ from sys import platform
 # Import user-defined global configuration variables
 from conf.userconf import user_reaper_path
 
+import opensauce.reaper
 from opensauce.reaper import reaper_pitch, pyreaper_pitch, creaper_pitch
 
 from opensauce.soundfile import SoundFile
@@ -96,6 +98,22 @@ class TestReaperPitch(TestCase):
                                           min_pitch=40, high_pass=True,
                                           hilbert_transform=False, inter_mark=10)
 
+    def test_bad_reaper_path_removes_scratch_dir(self):
+        scratch_dirs = []
+        make_scratch_dir = opensauce.reaper.make_scratch_dir
+        def recording_make_scratch_dir():
+            scratch_dirs.append(make_scratch_dir())
+            return scratch_dirs[-1]
+        opensauce.reaper.make_scratch_dir = recording_make_scratch_dir
+        self.addCleanup(setattr, opensauce.reaper, 'make_scratch_dir',
+                        make_scratch_dir)
+        with self.assertRaises(OSError):
+            creaper_pitch(wav_fns[0], reaper_path='badpath', frame_shift=1,
+                          max_pitch=500, min_pitch=40, high_pass=True,
+                          hilbert_transform=False, inter_mark=10)
+        self.assertEqual(len(scratch_dirs), 1)
+        self.assertFalse(os.path.exists(scratch_dirs[0]))
+
     def test_pitch_raw_using_creaper(self):
         # Test against previously generated data to make sure nothing has
         # broken and that there are no cross platform or REAPER version issues.
@@ -2,8 +2,10 @@ import os
 import numpy as np
 
 from opensauce.shrp import (window, toframes, two_max, compute_shr,
-                            get_log_spectrum, shrp, shr_pitch, vda,
-                            ethreshold, postvda, zcr)
+                            compute_shr_block, get_log_spectrum,
+                            get_log_spectra, iter_frame_blocks,
+                            linear_interp_weights, shrp,
+                            shr_pitch, vda, ethreshold, postvda, zcr)
 from opensauce.helpers import wavread
 
 from test.support import TestCase, parameterize, load_json, sound_file_path
@@ -73,6 +75,26 @@ class TestToframes(TestCase):
         np.testing.assert_array_almost_equal(res, data['frames'])
 
 
+class TestIterFrameBlocks(TestCase):
+
+    def test_same_frames_as_toframes(self):
+        wav_data, wavdata_int, fps = wavread(sound_file_path('beijing_f3_50_a.wav'))
+        segmentlen = 551
+        # Equally spaced frames, except at the start and end of the data
+        curpos = np.arange(0, len(wav_data), 100)
+        # Frames that aren't equally spaced (1 ms frame shift)
+        curpos_irregular = np.around(np.arange(0, 2340) * fps / 1000).astype(int)
+        for pos in (curpos, curpos_irregular):
+            expected = toframes(wav_data, pos, segmentlen, 'hamm')
+            for frames_per_block in (1, 7, len(pos)):
+                blocks = list(iter_frame_blocks(wav_data, pos, segmentlen,
+                                                'hamm', frames_per_block))
+                self.assertEqual([b for b, frames in blocks],
+                                 list(range(0, len(pos), frames_per_block)))
+                np.testing.assert_array_equal(
+                    np.vstack([frames for b, frames in blocks]), expected)
+
+
 @parameterize
 class Test_two_max(TestCase):
 
@@ -118,16 +140,63 @@ class Test_compute_shr(TestCase):
             int(data['upperbound'])-1,
             int(data['N']),
             int(data['shift_units']),
-            data['SHR_Threshold'])
+            data['SHR_Threshold'],
+            return_shshift=True)
         np.testing.assert_array_equal(peak_index, int(data['peak_index'])-1)
         np.testing.assert_array_almost_equal(shr, data['SHR'])
         np.testing.assert_array_almost_equal(shshift, data['shshift'])
         np.testing.assert_array_almost_equal(index, data['index']-1)
 
+    def test_shshift_not_returned_by_default(self):
+        data = load_json(os.path.join('shrp', 'ComputeSHR_data'))
+        peak_index, shr, shshift, index = compute_shr(
+            data['log_spectrum'],
+            data['min_bin'],
+            data['startpos'].astype(int)-1,
+            data['endpos'].astype(int)-1,
+            int(data['lowerbound'])-1,
+            int(data['upperbound'])-1,
+            int(data['N']),
+            int(data['shift_units']),
+            data['SHR_Threshold'])
+        self.assertIsNone(shshift)
+        np.testing.assert_array_equal(peak_index, int(data['peak_index'])-1)
+
     # XXX Need test data that exercises each of the if branches.  The
     # one above has only one peak.  Test_shrp exercises more.
 
 
+class Test_compute_shr_block(TestCase):
+
+    def test_matches_compute_shr(self):
+        data = load_json(os.path.join('shrp', 'ComputeSHR_data'))
+        log_spectrum = data['log_spectrum']
+        # An all zero spectrum has its maximum at every index
+        log_spectra = np.vstack((log_spectrum,
+                                 log_spectrum[::-1],
+                                 np.roll(log_spectrum, 20),
+                                 np.zeros(len(log_spectrum))))
+        args = (data['min_bin'],
+                data['startpos'].astype(int)-1,
+                data['endpos'].astype(int)-1,
+                int(data['lowerbound'])-1,
+                int(data['upperbound'])-1,
+                int(data['N']),
+                int(data['shift_units']),
+                data['SHR_Threshold'])
+        peak_index, shr, cand_index = compute_shr_block(log_spectra, *args)
+        for i in range(len(log_spectra)):
+            exp_peak_index, exp_shr, shshift, index = compute_shr(
+                log_spectra[i], *args)
+            self.assertEqual(peak_index[i], np.ravel(exp_peak_index)[0])
+            self.assertAlmostEqual(shr[i], exp_shr)
+            if exp_peak_index != -1:
+                if len(index) == 1:
+                    self.assertEqual(list(cand_index[i]), [-1, index[0]])
+                else:
+                    self.assertEqual(list(cand_index[i]), list(index[:2]))
+
+
 class Test_get_log_spectrum(TestCase):
 
     def test_with_matlab_data(self):
@@ -142,6 +211,28 @@ class Test_get_log_spectrum(TestCase):
                                              data['interp_amplitude'])
 
 
+class Test_get_log_spectra(TestCase):
+
+    def test_matches_get_log_spectrum(self):
+        data = load_json(os.path.join('shrp', 'GetLogSpectrum_data'))
+        segment = data['segment']
+        segments = np.vstack((segment, segment[::-1], np.roll(segment, 100)))
+        weights = linear_interp_weights(data['logf'], data['interp_logf'])
+        interp_amplitudes = get_log_spectra(segments,
+                                            int(data['fftlen']),
+                                            int(data['limit']) - 1,
+                                            weights)
+        for i in range(len(segments)):
+            np.testing.assert_allclose(
+                interp_amplitudes[i],
+                get_log_spectrum(segments[i],
+                                 int(data['fftlen']),
+                                 int(data['limit']) - 1,
+                                 data['logf'],
+                                 data['interp_logf']),
+                rtol=1e-10, atol=1e-12)
+
+
 class Test_shrp(TestCase):
 
     def test_with_matlab_data(self):
@@ -190,6 +281,34 @@ class Test_shrp(TestCase):
                 med_smooth=5,
                 CHECK_VOICING=False)
 
+    def test_max_block_bytes(self):
+        # Results don't depend on the number of frames analyzed at a time
+        wav_data, wavdata_int, fps = wavread(sound_file_path('beijing_f3_50_a.wav'))
+        expected = shrp(wav_data, fps, [50, 550], 25, 1, 0.4)
+        for max_block_bytes in (1, 100000, 2**40):
+            actual = shrp(wav_data, fps, [50, 550], 25, 1, 0.4,
+                          max_block_bytes=max_block_bytes)
+            for a, e in zip(actual, expected):
+                np.testing.assert_array_equal(a, e)
+
+    def test_float32(self):
+        # float32 data is analyzed in single precision, with almost the
+        # same results
+        wav_data, wavdata_int, fps = wavread(sound_file_path('beijing_f3_50_a.wav'))
+        expected = shrp(wav_data, fps, [50, 550], 25, 1, 0.4)
+        frames = list(iter_frame_blocks(wav_data.astype(np.float32),
+                                        np.array([1000, 2000]), 551, 'hamm',
+                                        2))
+        self.assertEqual(frames[0][1].dtype, np.float32)
+        for max_block_bytes in (100000, None):
+            f0_time, f0_value, shr, f0_candidates = shrp(
+                wav_data.astype(np.float32), fps, [50, 550], 25, 1, 0.4,
+                max_block_bytes=max_block_bytes)
+            np.testing.assert_array_equal(f0_time, expected[0])
+            np.testing.assert_array_equal(f0_value, expected[1])
+            np.testing.assert_allclose(shr, expected[2], rtol=0, atol=1e-4)
+            np.testing.assert_array_equal(f0_candidates, expected[3])
+
 class Test_shr_pitch(TestCase):
 
     def test_with_matlab_data(self):
@@ -199,6 +318,14 @@ class Test_shr_pitch(TestCase):
         np.testing.assert_array_almost_equal(f0, data['F0'])
         np.testing.assert_array_almost_equal(shr, data['SHR'])
 
+    def test_float32_with_matlab_data(self):
+        data = load_json(os.path.join('shrp', 'shr_pitch_data'))
+        wav_data, wavdata_int, fps = wavread(sound_file_path('beijing_f3_50_a.wav'))
+        shr, f0 = shr_pitch(wav_data.astype(np.float32), fps, 25, 1, 50, 550,
+                            0.4, 5, 200)
+        np.testing.assert_array_almost_equal(f0, data['F0'])
+        np.testing.assert_array_almost_equal(shr, data['SHR'], decimal=4)
+
     def test_with_min_max_pitch_not_specified(self):
         data = load_json(os.path.join('shrp', 'shr_pitch_data'))
         wav_data, wavdata_int, fps = wavread(sound_file_path('beijing_f3_50_a.wav'))
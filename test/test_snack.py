@@ -1,6 +1,9 @@
 from __future__ import division
 
+import os
+import re
 import random
+import shutil
 import unittest
 import sys
 import platform
@@ -9,7 +12,8 @@ import numpy as np
 # Import user-defined global configuration variables
 from conf.userconf import user_default_snack_method, user_tcl_shell_cmd
 
-from opensauce.snack import snack_pitch, snack_raw_pitch, snack_formants, snack_raw_formants, valid_snack_methods, sformant_names
+import opensauce.snack
+from opensauce.snack import snack_pitch, snack_raw_pitch, snack_formants, snack_raw_formants, valid_snack_methods, sformant_names, SnackSession, snack_raw_batch_tcl, _snack_values
 
 from opensauce.soundfile import SoundFile
 
@@ -44,6 +48,10 @@ elif sys.platform == "darwin":
 else:
     tcl_cmd = 'tclsh'
 
+# Calling Snack through tkinter is not supported on Mac or with conda
+using_conda = (re.match('.*conda.*', sys.version) is not None) or (re.match('.*Continuum.*', sys.version) is not None)
+tkinter_snack_unsupported = (sys.platform == 'darwin') or using_conda
+
 # Shuffle wav filenames, to make sure testing doesn't depend on order
 random.shuffle(wav_fns)
 
@@ -196,3 +204,126 @@ class TestSnackFormants(TestCase):
                 # Increase rtol from 1e-5 to 1e-3 to account for random seed
                 # used in Snack formants
                 self.assertAllClose(estimates_raw[n], sample_data[n], rtol=1e-03, atol=1e-08)
+
+
+class TestSnackValues(TestCase):
+
+    def test_snack_values(self):
+        values = _snack_values('225.5 1.0 3025.2 0.9 0.0 0.0 1020.3 0.2', 4)
+        self.assertEqual(values.shape, (2, 4))
+        self.assertAllClose(values[:, 0], np.array([225.5, 0.0]))
+        self.assertAllClose(values[:, 1], np.array([1.0, 0.0]))
+
+    def test_snack_values_empty(self):
+        self.assertEqual(_snack_values('', 8).shape, (0, 8))
+
+
+@unittest.skipIf(tkinter_snack_unsupported,
+                 'Method to call Snack through Tkinter not supported')
+class TestSnackSession(TestCase):
+
+    def test_session_matches_single_call(self):
+        session = SnackSession()
+        for fn in wav_fns[:3]:
+            F0_raw, V_raw = session.raw_pitch(fn, 1, 25, 500, 40)
+            F0_single, V_single = snack_raw_pitch(fn, 'python')
+            self.assertAllClose(F0_raw, F0_single)
+            self.assertAllClose(V_raw, V_single)
+            estimates_raw = session.raw_formants(fn, 1, 25, 0.96, 12)
+            estimates_single = snack_raw_formants(fn, 'python')
+            for n in sformant_names:
+                self.assertAllClose(estimates_raw[n], estimates_single[n])
+
+    def test_session_reads_file_once(self):
+        session = SnackSession()
+        fn = wav_fns[0]
+        session.raw_pitch(fn, 1, 25, 500, 40)
+        self.assertEqual(session.wav_fn, fn)
+        # Reading another file into the sound object marks it as loaded
+        session.tcl.eval('s read {}'.format(wav_fns[1]))
+        F0_raw, V_raw = session.raw_pitch(fn, 1, 25, 500, 40)
+        F0_other, V_other = snack_raw_pitch(wav_fns[1], 'python')
+        self.assertAllClose(F0_raw, F0_other)
+        session.clear()
+        self.assertIsNone(session.wav_fn)
+        F0_raw, V_raw = session.raw_pitch(fn, 1, 25, 500, 40)
+        F0_single, V_single = snack_raw_pitch(fn, 'python')
+        self.assertAllClose(F0_raw, F0_single)
+
+    def test_snack_pitch_with_session(self):
+        session = SnackSession()
+        fn = wav_fns[0]
+        sound_file = SoundFile(fn)
+        data_len = np.int_(np.floor(sound_file.ns / sound_file.fs * 1000))
+        F0, V = snack_pitch(fn, 'python', data_len, snack_session=session)
+        F0_single, V_single = snack_pitch(fn, 'python', data_len)
+        self.assertAllClose(F0, F0_single, equal_nan=True)
+        estimates = snack_formants(fn, 'python', data_len,
+                                   snack_session=session)
+        estimates_single = snack_formants(fn, 'python', data_len)
+        for n in sformant_names:
+            self.assertAllClose(estimates[n], estimates_single[n],
+                                equal_nan=True)
+
+
+class TestSnackBatch(TestCase):
+
+    def test_batch_matches_single_file(self):
+        fns = wav_fns[:3]
+        results = snack_raw_batch_tcl(fns, tcl_cmd)
+        self.assertEqual(len(results), len(fns))
+        for fn, (pitch_raw, formants_raw) in zip(fns, results):
+            F0_raw, V_raw = snack_raw_pitch(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+            self.assertAllClose(pitch_raw[0], F0_raw)
+            self.assertAllClose(pitch_raw[1], V_raw)
+            estimates_raw = snack_raw_formants(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+            for n in sformant_names:
+                self.assertAllClose(formants_raw[n], estimates_raw[n])
+
+    def test_batch_single_measurement(self):
+        fns = wav_fns[:2]
+        for pitch_raw, formants_raw in snack_raw_batch_tcl(
+                fns, tcl_cmd, measure_formants=False):
+            self.assertEqual(len(pitch_raw), 2)
+            self.assertIsNone(formants_raw)
+        for pitch_raw, formants_raw in snack_raw_batch_tcl(
+                fns, tcl_cmd, measure_pitch=False):
+            self.assertIsNone(pitch_raw)
+            self.assertEqual(sorted(formants_raw), sorted(sformant_names))
+
+    def test_batch_bad_tcl_cmd(self):
+        with self.assertRaisesRegex(OSError, 'Is Tcl shell command'):
+            snack_raw_batch_tcl(wav_fns[:1], 'nosuchtclsh')
+
+
+class TestSnackScratchFiles(TestCase):
+
+    def _record_scratch_dirs(self):
+        scratch_dirs = []
+        make_scratch_dir = opensauce.snack.make_scratch_dir
+        def recording_make_scratch_dir():
+            scratch_dirs.append(make_scratch_dir())
+            return scratch_dirs[-1]
+        opensauce.snack.make_scratch_dir = recording_make_scratch_dir
+        self.addCleanup(setattr, opensauce.snack, 'make_scratch_dir',
+                        make_scratch_dir)
+        return scratch_dirs
+
+    def test_no_files_written_next_to_wav(self):
+        scratch_dirs = self._record_scratch_dirs()
+        tmp = self.tmpdir()
+        fn = os.path.join(tmp, os.path.basename(wav_fns[0]))
+        shutil.copy(wav_fns[0], fn)
+        snack_raw_pitch(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+        snack_raw_formants(fn, 'tcl', tcl_shell_cmd=tcl_cmd)
+        self.assertEqual(os.listdir(tmp), [os.path.basename(fn)])
+        self.assertEqual(len(scratch_dirs), 2)
+        for d in scratch_dirs:
+            self.assertFalse(os.path.exists(d))
+
+    def test_scratch_dir_removed_after_error(self):
+        scratch_dirs = self._record_scratch_dirs()
+        with self.assertRaisesRegex(OSError, 'Is Tcl shell command'):
+            snack_raw_pitch(wav_fns[0], 'tcl', tcl_shell_cmd='nosuchtclsh')
+        self.assertEqual(len(scratch_dirs), 1)
+        self.assertFalse(os.path.exists(scratch_dirs[0]))
@@ -34,6 +34,43 @@ class TestSoundFile(TestCase):
         self.assertIsNone(s.fs_rs)
         self.assertIsNone(s.ns_rs)
 
+    def test_wavdata_is_shared(self):
+        spath = sound_file_path('beijing_f3_50_a.wav')
+        s = SoundFile(spath)
+        data, data_int, fs = wavread(spath)
+        # The integer samples are read once, and the float samples are only
+        # computed when they are needed
+        data_int_shared = s.wavdata_int
+        self.assertEqual(s.ns, 51597)
+        self.assertIsNone(s._wavdata)
+        self.assertTrue(np.array_equal(s.wavdata_block(100, 2000), data[100:2000]))
+        self.assertIsNone(s._wavdata)
+        data_shared = s.wavdata
+        self.assertIs(s.wavdata_int, data_int_shared)
+        self.assertIs(s.wavdata, data_shared)
+        self.assertTrue(np.array_equal(data_shared, data))
+        self.assertTrue(np.array_equal(s.wavdata_block(100, 2000), data[100:2000]))
+        # Measurements can't change the shared samples
+        self.assertFalse(s.wavdata.flags.writeable)
+        self.assertFalse(s.wavdata_int.flags.writeable)
+
+    def test_precision(self):
+        spath = sound_file_path('beijing_f3_50_a.wav')
+        data, data_int, fs = wavread(spath)
+        s = SoundFile(spath, precision='float32')
+        self.assertEqual(s.wavdata.dtype, np.float32)
+        self.assertEqual(s.wavdata_block(100, 2000).dtype, np.float32)
+        # 16-bit samples are exact in single precision
+        self.assertTrue(np.array_equal(s.wavdata, data))
+        for method in ('fft', 'polyphase'):
+            s32 = SoundFile(spath, resample_freq=16000,
+                            resample_method=method, precision='float32')
+            s64 = SoundFile(spath, resample_freq=16000, resample_method=method)
+            self.assertEqual(s32.wavdata_rs.dtype, np.float32)
+            self.assertAllClose(s32.wavdata_rs, s64.wavdata_rs, rtol=0, atol=1e-6)
+        with self.assertRaisesRegex(ValueError, 'Invalid precision'):
+            SoundFile(spath, precision='float16')
+
     def test_resample_invalid_value(self):
         with self.assertRaisesRegex(ValueError, 'Resample frequency must be an integer'):
             spath = sound_file_path('beijing_f3_50_a.wav')
@@ -50,6 +87,7 @@ class TestSoundFile(TestCase):
         tmp_path = os.path.join(t, fn)
         shutil.copy(sound_file_path(fn), tmp_path)
         s = SoundFile(tmp_path, resample_freq=16000)
+        self.addCleanup(s.cleanup)
         self.assertEqual(s.fs, 22050)
         self.assertEqual(s.ns, 51597)
         self.assertEqual(s.ms_len, 2340)
@@ -61,6 +99,91 @@ class TestSoundFile(TestCase):
         self.assertEqual(len(y_rs), s.ns_rs)
         self.assertAllClose(y_rs * 32768, np.int16(s.wavdata_rs * 32768))
 
+    def test_segment(self):
+        spath = sound_file_path('beijing_f3_50_a.wav')
+        s = SoundFile(spath, resample_freq=16000)
+        self.addCleanup(s.cleanup)
+        with s.segment(0.5, 1.25) as seg:
+            self.assertEqual(seg.fs, 22050)
+            self.assertEqual(seg.ns, 16538)
+            self.assertTrue(np.array_equal(seg.wavdata_int,
+                                           s.wavdata_int[11025:27563]))
+            self.assertTrue(np.array_equal(seg.wavdata, s.wavdata[11025:27563]))
+            self.assertEqual(seg.fs_rs, 16000)
+            self.assertEqual(seg.ns_rs, 12000)
+            self.assertTrue(np.array_equal(seg.wavdata_rs,
+                                           s.wavdata_rs[8000:20000]))
+            self.assertTrue(np.array_equal(seg.wavdata_rs_int,
+                                           s.wavdata_rs_int[8000:20000]))
+            # The segment is written to wav files for external programs
+            data, data_int, fs = wavread(seg.wavpath)
+            self.assertEqual(fs, 22050)
+            self.assertTrue(np.array_equal(data_int, seg.wavdata_int))
+            data, data_int, fs = wavread(seg.wavpath_rs)
+            self.assertEqual(fs, 16000)
+            self.assertTrue(np.array_equal(data_int, seg.wavdata_rs_int))
+            wavpath = seg.wavpath
+        self.assertFalse(os.path.exists(wavpath))
+        # Segments end at the end of the sound file
+        seg = s.segment(2, 3)
+        self.assertEqual(seg.ns, 51597 - 44100)
+        self.assertIsNone(SoundFile(spath).segment(0, 1).wavdata_rs)
+
+    def test_resample_is_cached(self):
+        fn = 'beijing_f3_50_a.wav'
+        t = self.tmpdir()
+        tmp_path = os.path.join(t, fn)
+        shutil.copy(sound_file_path(fn), tmp_path)
+        s = SoundFile(tmp_path, resample_freq=16000)
+        self.addCleanup(s.cleanup)
+        data_rs = s.wavdata_rs
+        data_rs_int = s.wavdata_rs_int
+        os.remove(s.wavpath_rs)
+        # Repeated accesses return the same data and don't resample or
+        # rewrite the resampled wav file
+        self.assertIs(s.wavdata_rs, data_rs)
+        self.assertIs(s.wavdata_rs_int, data_rs_int)
+        self.assertEqual(s.ns_rs, 37440)
+        self.assertFalse(os.path.exists(s.wavpath_rs))
+
+    def test_resample_wav_written_on_demand(self):
+        fn = 'beijing_f3_50_a.wav'
+        t = self.tmpdir()
+        tmp_path = os.path.join(t, fn)
+        shutil.copy(sound_file_path(fn), tmp_path)
+        with SoundFile(tmp_path, resample_freq=16000) as s:
+            # Resampled data is available without writing any file
+            self.assertEqual(len(s.wavdata_rs), 37440)
+            self.assertIsNone(s._scratch_dir)
+            wavpath_rs = s.wavpath_rs
+            self.assertTrue(os.path.isfile(wavpath_rs))
+            # The resampled wav file isn't written next to the original
+            self.assertNotEqual(os.path.dirname(wavpath_rs), t)
+            self.assertEqual(os.listdir(t), [fn])
+        self.assertFalse(os.path.exists(wavpath_rs))
+        self.assertFalse(os.path.exists(os.path.dirname(wavpath_rs)))
+        # Data is still available after cleanup
+        self.assertEqual(s.ns_rs, 37440)
+
+    def test_resample_invalid_method(self):
+        with self.assertRaisesRegex(ValueError, 'Invalid resample method'):
+            spath = sound_file_path('beijing_f3_50_a.wav')
+            s = SoundFile(spath, resample_freq=16000, resample_method='foo')
+
+    def test_resample_polyphase(self):
+        for fn in wav_fns:
+            s_fft = SoundFile(fn, resample_freq=16000)
+            s_poly = SoundFile(fn, resample_freq=16000, resample_method='polyphase')
+            self.assertEqual(s_poly.ns_rs, s_fft.ns_rs)
+            self.assertEqual(len(s_poly.wavdata_rs), s_poly.ns_rs)
+            self.assertTrue(s_poly.wavdata_rs_int.dtype == 'int16')
+            # The FFT method stretches the signal to exactly ns_rs samples,
+            # so its time axis drifts slightly from the polyphase one over
+            # the length of the file.  Compare near the start, away from
+            # the edge.
+            err = s_poly.wavdata_rs[100:2000] - s_fft.wavdata_rs[100:2000]
+            self.assertLess(np.max(np.abs(err)), 0.002)
+
     def test_raw_resample_data(self):
         for fn in wav_fns:
             t = self.tmpdir()
@@ -80,6 +203,7 @@ class TestSoundFile(TestCase):
             tmp_path = os.path.join(t, os.path.basename(fn))
             shutil.copy(fn, tmp_path)
             s = SoundFile(tmp_path, resample_freq=16000)
+            self.addCleanup(s.cleanup)
             data, data_int, fs = wavread(s.wavpath_rs)
             resample_fn = os.path.splitext(os.path.basename(fn))[0] + '-resample-16kHz.wav'
             data_test, data_test_int, fs_test = wavread(data_file_path(os.path.join('soundfile', 'resample', resample_fn)))
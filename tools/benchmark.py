@@ -0,0 +1,406 @@
+# Benchmarks for the time critical parts of OpenSauce
+#
+# Times the SHR pitch analysis (shrp, shr_pitch), the alignment of raw Praat
+# estimates to the output frames (praat_pitch_from_raw,
+# praat_formants_from_raw), reading TextGrids, loading and resampling sound
+# files, and writing the text output, on the sound files in
+# test/data/wav-files and on a synthetic long recording.  The results are
+# saved to a JSON file, and can be compared with those of an earlier run.
+#
+# Usage (from the top level directory of the repository):
+#   PYTHONPATH=. python tools/benchmark.py [options]
+#
+# Options:
+#   -o FILE           save the results to FILE (default benchmark.json)
+#   --compare FILE    compare the results with an earlier results file
+#   --repeat N        time each benchmark N times (default 5)
+#   --duration S      length of the synthetic recording in seconds
+#                     (default 60)
+#   -k TEXT           only run the benchmarks whose name contains TEXT
+#                     (can be given several times)
+#   --list            list the benchmarks and exit
+#
+# Each benchmark is run once before it is timed, so that files are in the
+# operating system's cache and modules are imported.  The synthetic
+# recording is generated from a fixed random seed, so all runs with the
+# same --duration analyze the same sound.  The results file records the
+# median, minimum, mean and standard deviation of the times, along with the
+# versions of Python, NumPy and SciPy, the platform, and the git commit.
+
+# Licensed under Apache v2 (see LICENSE)
+
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import csv
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import scipy
+
+from scipy.io import wavfile
+
+from opensauce.__main__ import CLI
+from opensauce.output import OutputTable, TextWriter
+from opensauce.praat import praat_pitch_from_raw, praat_formants_from_raw
+from opensauce.shrp import shrp, shr_pitch
+from opensauce.soundfile import SoundFile
+from opensauce.textgrid import TextGrid, IntervalTier
+
+if hasattr(time, 'perf_counter'):
+    timer = time.perf_counter
+else: # pragma: no cover
+    timer = time.time
+
+# Sampling rate of the synthetic recording, as for the test sound files
+synthetic_fs = 22050
+# Arguments of shrp and shr_pitch after the data and sampling rate, as used
+# by the tests with the Matlab reference data
+shrp_args = ([50, 550], 25, 1, 0.4)
+shr_pitch_args = (25, 1, 50, 550, 0.4, 5)
+
+# Benchmarks as (name, setup) pairs, in the order they run.  setup(context)
+# returns the function to time, which is called without arguments.
+benchmarks = []
+
+def benchmark(name):
+    """Decorator adding a benchmark setup function under name"""
+    def add(setup):
+        benchmarks.append((name, setup))
+        return setup
+    return add
+
+
+class Context(object):
+
+    def __init__(self, wav_dir, tmp_dir, duration):
+        """Sound files and scratch space shared by the benchmarks"""
+        self.corpus = sorted(glob.glob(os.path.join(wav_dir, '*.wav')))
+        self.corpus_textgrids = sorted(glob.glob(os.path.join(wav_dir,
+                                                              '*.TextGrid')))
+        self.tmp_dir = tmp_dir
+        self.duration = duration
+        self.long_wav = os.path.join(tmp_dir, 'synthetic.wav')
+        self.long_textgrid = os.path.join(tmp_dir, 'synthetic.TextGrid')
+        write_synthetic_recording(self.long_wav, self.long_textgrid, duration)
+
+
+def write_synthetic_recording(wav_fn, textgrid_fn, duration, seed=0):
+    """Write a synthetic recording of duration seconds, and a TextGrid for it
+
+    The recording is a sequence of harmonic "syllables" of 100 to 300 ms with
+    an F0 contour between 80 and 300 Hz, separated by pauses of 50 to 150 ms,
+    with some background noise.  The TextGrid has one tier with an interval
+    for each syllable and each pause, and a second tier with an interval for
+    every two syllables.
+    """
+    rng = np.random.RandomState(seed)
+    ns = int(duration * synthetic_fs)
+    y = 0.01 * rng.standard_normal(ns)
+    syllables = []
+    t = 0.05
+    while True:
+        length = rng.uniform(0.1, 0.3)
+        if t + length > duration - 0.05:
+            break
+        start = int(t * synthetic_fs)
+        stop = int((t + length) * synthetic_fs)
+        f0 = np.linspace(rng.uniform(80, 300), rng.uniform(80, 300),
+                         stop - start)
+        phase = 2 * np.pi * np.cumsum(f0) / synthetic_fs
+        envelope = np.hanning(stop - start)
+        for k in range(1, 11):
+            y[start:stop] += envelope * 0.3 / k * np.sin(k * phase)
+        syllables.append((t, t + length))
+        t += length + rng.uniform(0.05, 0.15)
+    y_int = np.int16(np.clip(y, -1, 32767 / 32768) * 32768)
+    wavfile.write(wav_fn, synthetic_fs, y_int)
+
+    end = ns / synthetic_fs
+    tg = TextGrid(maxTime=end)
+    tier = IntervalTier(name='syllables', maxTime=end)
+    prev = 0
+    for i, (start, stop) in enumerate(syllables):
+        tier.add(prev, start, '')
+        tier.add(start, stop, 'syl{}'.format(i))
+        prev = stop
+    tier.add(prev, end, '')
+    tg.append(tier)
+    tier = IntervalTier(name='words', maxTime=end)
+    prev = 0
+    for i in range(0, len(syllables) - 1, 2):
+        start, stop = syllables[i][0], syllables[i + 1][1]
+        tier.add(prev, start, '')
+        tier.add(start, stop, 'word{}'.format(i // 2))
+        prev = stop
+    tier.add(prev, end, '')
+    tg.append(tier)
+    tg.write(textgrid_fn)
+
+
+#
+# Benchmarks
+#
+
+@benchmark('shrp.corpus')
+def shrp_corpus(context):
+    data = [SoundFile(fn) for fn in context.corpus]
+    data = [(s.wavdata, s.fs) for s in data]
+    def run():
+        for wavdata, fs in data:
+            shrp(wavdata, fs, *shrp_args)
+    return run
+
+@benchmark('shrp.long')
+def shrp_long(context):
+    s = SoundFile(context.long_wav)
+    wavdata, fs = s.wavdata, s.fs
+    return lambda: shrp(wavdata, fs, *shrp_args)
+
+@benchmark('shr_pitch.corpus')
+def shr_pitch_corpus(context):
+    data = []
+    for fn in context.corpus:
+        s = SoundFile(fn)
+        data.append((s.wavdata, s.fs, s.ms_len))
+    def run():
+        for wavdata, fs, datalen in data:
+            shr_pitch(wavdata, fs, *(shr_pitch_args + (datalen,)))
+    return run
+
+@benchmark('shr_pitch.long')
+def shr_pitch_long(context):
+    s = SoundFile(context.long_wav)
+    wavdata, fs, datalen = s.wavdata, s.fs, s.ms_len
+    return lambda: shr_pitch(wavdata, fs, *(shr_pitch_args + (datalen,)))
+
+def _raw_times(duration, frame_shift, rng):
+    """Return times like those of raw Praat estimates every frame_shift ms"""
+    # Praat centers the frames in the sound, so its times are offset from
+    # the output frames and drift slightly
+    t = np.arange(0.0125, duration - 0.0125, frame_shift / 1000)
+    return t + rng.uniform(-0.0002, 0.0002, len(t))
+
+@benchmark('praat_pitch_from_raw.long')
+def praat_pitch_from_raw_long(context):
+    rng = np.random.RandomState(1)
+    t_raw = _raw_times(context.duration, 1, rng)
+    F0_raw = rng.uniform(80, 300, len(t_raw))
+    F0_raw[rng.uniform(size=len(t_raw)) < 0.3] = np.nan
+    data_len = int(context.duration * 1000)
+    return lambda: praat_pitch_from_raw(t_raw, F0_raw, data_len)
+
+@benchmark('praat_formants_from_raw.long')
+def praat_formants_from_raw_long(context):
+    rng = np.random.RandomState(2)
+    estimates_raw = {'ptFormants': _raw_times(context.duration, 1, rng)}
+    for i in range(1, 5):
+        n = len(estimates_raw['ptFormants'])
+        estimates_raw['pF' + str(i)] = rng.uniform(500 * i, 1000 * i, n)
+        estimates_raw['pB' + str(i)] = rng.uniform(50, 400, n)
+    data_len = int(context.duration * 1000)
+    return lambda: praat_formants_from_raw(estimates_raw, data_len)
+
+@benchmark('textgrid.corpus')
+def textgrid_corpus(context):
+    def run():
+        for fn in context.corpus_textgrids:
+            TextGrid.fromFile(fn)
+    return run
+
+@benchmark('textgrid.long')
+def textgrid_long(context):
+    return lambda: TextGrid.fromFile(context.long_textgrid)
+
+@benchmark('soundfile.load.corpus')
+def soundfile_load_corpus(context):
+    def run():
+        for fn in context.corpus:
+            SoundFile(fn).wavdata
+    return run
+
+@benchmark('soundfile.load.long')
+def soundfile_load_long(context):
+    return lambda: SoundFile(context.long_wav).wavdata
+
+def _resample(wav_fn, method):
+    s = SoundFile(wav_fn, resample_freq=16000, resample_method=method)
+    s.wavdata_rs
+
+@benchmark('soundfile.resample_fft.long')
+def soundfile_resample_fft_long(context):
+    return lambda: _resample(context.long_wav, 'fft')
+
+@benchmark('soundfile.resample_polyphase.long')
+def soundfile_resample_polyphase_long(context):
+    return lambda: _resample(context.long_wav, 'polyphase')
+
+@benchmark('output.text_writer.long')
+def output_text_writer_long(context):
+    # One row per millisecond with the fields of Praat F0 and formants
+    rng = np.random.RandomState(3)
+    intervals = []
+    for tier in TextGrid.fromFile(context.long_textgrid):
+        for interval in tier:
+            nrows = int(round(interval.maxTime * 1000) -
+                        round(interval.minTime * 1000))
+            intervals.append((interval.mark, interval.minTime * 1000,
+                              interval.maxTime * 1000, nrows))
+    nrows = sum(n for _, _, _, n in intervals)
+    data = [rng.uniform(0, 5000, nrows) for _ in range(9)]
+    data[0][rng.uniform(size=nrows) < 0.3] = np.nan
+    table = OutputTable(os.path.basename(context.long_wav), intervals,
+                        np.arange(nrows), data)
+    def run():
+        f = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+        writer = TextWriter(f, csv.excel, True, 'NaN')
+        writer.write(table)
+    return run
+
+@benchmark('cli.csv_cached.all')
+def cli_csv_cached(context):
+    # The measurements come from the cache, which is filled by the warmup
+    # run, so this times reading the sound files and TextGrids, the cache
+    # lookups and writing the CSV output
+    args = context.corpus + [
+        context.long_wav,
+        '--measurements', 'shrF0', 'SHR',
+        '--output-delimiter', 'comma',
+        '--include-empty-labels',
+        '--no-output-settings',
+        '--cache-dir', os.path.join(context.tmp_dir, 'cache'),
+        '-o', os.path.join(context.tmp_dir, 'output.csv'),
+        ]
+    return lambda: CLI(args).process()
+
+
+#
+# Running and reporting
+#
+
+def time_benchmark(run, repeat):
+    """Return the times of repeat calls of run, after a warmup call"""
+    run()
+    times = []
+    for _ in range(repeat):
+        t0 = timer()
+        run()
+        times.append(timer() - t0)
+    return times
+
+def summary(times):
+    return {
+        'times': times,
+        'median': float(np.median(times)),
+        'min': float(np.min(times)),
+        'mean': float(np.mean(times)),
+        'stdev': float(np.std(times)),
+        }
+
+def git_commit():
+    """Return the git commit of the working directory, or None"""
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                      stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode('ascii').strip()
+
+def environment():
+    return {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count() if hasattr(os, 'cpu_count') else None,
+        }
+
+def compare(results, old_results):
+    """Print the median times of results relative to old_results"""
+    print('')
+    print('Compared with {} ({})'.format(old_results['environment']['date'],
+                                        old_results['environment']['commit']))
+    if old_results['settings'] != results['settings']:
+        print('Warning: the runs have different settings ({} and {})'.format(
+            old_results['settings'], results['settings']))
+    print('{:<36} {:>10} {:>10} {:>8}'.format('benchmark', 'old (s)',
+                                               'new (s)', 'ratio'))
+    old = old_results['benchmarks']
+    for name, result in sorted(results['benchmarks'].items()):
+        if name not in old:
+            continue
+        old_median = old[name]['median']
+        print('{:<36} {:10.4f} {:10.4f} {:8.2f}'.format(
+            name, old_median, result['median'],
+            result['median'] / old_median))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time the hot paths of OpenSauce')
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='File to save the results to')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Results file of an earlier run to compare with')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of times to time each benchmark')
+    parser.add_argument('--duration', type=float, default=60,
+                        help='Length of the synthetic recording in seconds')
+    parser.add_argument('-k', dest='select', action='append', default=[],
+                        help='Only run benchmarks whose name contains SELECT')
+    parser.add_argument('--list', action='store_true',
+                        help='List the benchmarks and exit')
+    parser.add_argument('--wav-dir',
+                        default=os.path.join('test', 'data', 'wav-files'),
+                        help='Directory with the sound files and TextGrids')
+    args = parser.parse_args(argv)
+
+    selected = [(name, setup) for name, setup in benchmarks
+                if not args.select or any(s in name for s in args.select)]
+    if args.list:
+        for name, _ in selected:
+            print(name)
+        return
+
+    results = {
+        'environment': environment(),
+        'settings': {'repeat': args.repeat, 'duration': args.duration},
+        'benchmarks': {},
+        }
+    tmp_dir = tempfile.mkdtemp(prefix='opensauce-benchmark-')
+    try:
+        context = Context(args.wav_dir, tmp_dir, args.duration)
+        print('{:<36} {:>10} {:>10} {:>10}'.format('benchmark', 'median (s)',
+                                                   'min (s)', 'stdev (s)'))
+        for name, setup in selected:
+            times = time_benchmark(setup(context), args.repeat)
+            result = summary(times)
+            results['benchmarks'][name] = result
+            print('{:<36} {:10.4f} {:10.4f} {:10.4f}'.format(
+                name, result['median'], result['min'], result['stdev']))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print('Results saved to {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
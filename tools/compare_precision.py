@@ -0,0 +1,126 @@
+# Script to report the accuracy cost of computing in single precision
+# (--precision float32) instead of double precision
+#
+# For each wav file, SHR and F0 are computed with float64 and with float32
+# sound data, and the differences are printed along with the time taken.
+# Then both precisions are compared with the reference outputs in test/data:
+# the Matlab SHR and F0 for beijing_f3_50_a.wav, and the VoiceSauce
+# Iseli-Alwan harmonic amplitude corrections.
+#
+# Usage (from the top level directory of the repository):
+#   PYTHONPATH=. python tools/compare_precision.py [wav_dir]
+#
+# wav_dir defaults to test/data/wav-files.
+
+# Licensed under Apache v2 (see LICENSE)
+
+from __future__ import division
+
+import sys
+import os
+import glob
+import time
+import numpy as np
+
+from opensauce.harmonics import correction_iseli_i
+from opensauce.shrp import shr_pitch
+from opensauce.soundfile import SoundFile
+from test.support import (load_json, sound_file_path, wav_fns, get_raw_data,
+                          get_harmonics_internal_test_data)
+
+# Arguments of shr_pitch after the data and sampling rate, as used by the
+# tests with the Matlab reference data
+shr_args = (25, 1, 50, 550, 0.4, 5)
+
+def max_abs_diff(x, y):
+    """Return the largest absolute difference between x and y, ignoring
+    positions where both are NaN, or NaN if the NaN positions differ"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if not np.array_equal(np.isnan(x), np.isnan(y)):
+        return np.nan
+    valid = ~np.isnan(x)
+    if not np.any(valid):
+        return 0.0
+    return np.max(np.abs(x[valid] - y[valid]))
+
+def shr_analysis(wav_file, precision):
+    """Return SHR, F0 and the time taken to compute them for wav_file"""
+    s = SoundFile(wav_file, precision=precision)
+    data_len = int(np.floor(s.ns / s.fs * 1000))
+    # Load the data before starting the timer
+    s.wavdata
+    t0 = time.time()
+    SHR, F0 = shr_pitch(s.wavdata, s.fs, *(shr_args + (data_len,)))
+    return SHR, F0, time.time() - t0
+
+def compare_shr(wav_dir):
+    """Compare float32 with float64 SHR and F0 for the wav files in wav_dir"""
+    wav_files = sorted(glob.glob(os.path.join(wav_dir, '*.wav')))
+
+    print('SHR analysis, float32 relative to float64')
+    print('{:<24} {:>9} {:>9} {:>12} {:>10} {:>12}'.format(
+        'file', 't64 (s)', 't32 (s)', 'F0 max err', 'F0 frames', 'SHR max err'))
+    for wav_file in wav_files:
+        SHR64, F064, t64 = shr_analysis(wav_file, 'float64')
+        SHR32, F032, t32 = shr_analysis(wav_file, 'float32')
+        # Number of frames where F0 differs, out of the frames with an F0
+        valid = ~np.isnan(F064)
+        changed = np.sum(F032[valid] != F064[valid])
+        print('{:<24} {:9.4f} {:9.4f} {:12.3g} {:>10} {:12.3g}'.format(
+            os.path.basename(wav_file), t64, t32,
+            max_abs_diff(F032, F064),
+            '{}/{}'.format(changed, np.sum(valid)),
+            max_abs_diff(SHR32, SHR64)))
+
+def compare_reference():
+    """Compare both precisions with the reference outputs in test/data"""
+    print('')
+    print('Maximum absolute error relative to the reference outputs')
+    print('{:<40} {:>12} {:>12}'.format('reference', 'float64', 'float32'))
+
+    try:
+        data = load_json(os.path.join('shrp', 'shr_pitch_data'))
+    except Exception:
+        data = None
+    if data is None:
+        print('{:<40} {:>12} {:>12}'.format('Matlab shr_pitch', 'n/a', 'n/a'))
+    else:
+        wav_file = sound_file_path('beijing_f3_50_a.wav')
+        errors = {}
+        for precision in ('float64', 'float32'):
+            s = SoundFile(wav_file, precision=precision)
+            SHR, F0 = shr_pitch(s.wavdata, s.fs, *(shr_args + (200,)))
+            errors[precision] = (max_abs_diff(F0, data['F0']),
+                                 max_abs_diff(SHR, data['SHR']))
+        for i, name in enumerate(('F0', 'SHR')):
+            print('{:<40} {:12.3g} {:12.3g}'.format(
+                'Matlab shr_pitch ' + name,
+                errors['float64'][i], errors['float32'][i]))
+
+    # Iseli-Alwan corrections for the first formant, at F0 and F1 (see
+    # test_harmonics.py)
+    for fn in sorted(wav_fns):
+        name = 'VoiceSauce iseli ' + os.path.basename(fn)
+        try:
+            Fs = get_raw_data(fn, 'Fs', 'strF0', 'FMTs', 'estimated')
+            args = [get_raw_data(fn, v, 'strF0', 'FMTs', 'estimated')
+                    for v in ('sF0', 'sF1', 'sB1')]
+            expected = get_harmonics_internal_test_data(fn, 'iseli')[0]
+        except Exception:
+            print('{:<40} {:>12} {:>12}'.format(name, 'n/a', 'n/a'))
+            continue
+        corr64 = correction_iseli_i(*(args + [Fs]))
+        corr32 = correction_iseli_i(*([a.astype(np.float32) for a in args]
+                                      + [Fs]))
+        print('{:<40} {:12.3g} {:12.3g}'.format(
+            name, max_abs_diff(corr64, expected),
+            max_abs_diff(corr32, expected)))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        wav_dir = sys.argv[1]
+    else:
+        wav_dir = os.path.join('test', 'data', 'wav-files')
+    compare_shr(wav_dir)
+    compare_reference()
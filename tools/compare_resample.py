@@ -1,4 +1,9 @@
-# Script to plot original wav file against wav file resampled at 16 kHz
+# Script to plot original wav file against wav file resampled at 16 kHz,
+# and to compare the accuracy and speed of the resampling methods
+#
+# Usage:
+#   python compare_resample.py wav_dir fs_rs
+#   python compare_resample.py --methods wav_dir fs_rs
 
 # Licensed under Apache v2 (see LICENSE)
 
@@ -7,21 +12,30 @@ from __future__ import division
 import sys
 import os
 import glob
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 
 from numpy.random import randint
 from scipy.signal import resample
 
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+
 # Problems doing this import
 # May need to move this file to top level directory
 from opensauce.helpers import wavread, round_half_away_from_zero
+from opensauce.soundfile import SoundFile, valid_resample_methods
 from test.support import load_json
 
 def main(wav_dir, fs_rs):
     """Compare original data vs resampled data for all wav files in wav_dir,
     where resampling frequency is given in Hz by fs_rs
     """
+    # Only needed for plotting
+    import matplotlib.pyplot as plt
+
     # Find all .wav files in test/data directory
     wav_files = glob.glob(os.path.join(wav_dir, '*.wav'))
 
@@ -82,5 +96,63 @@ def main(wav_dir, fs_rs):
         plt.ylabel('Amplitude')
         plt.savefig(os.path.splitext(os.path.basename(wav_file))[0] + '-matlab.pdf')
 
+def snr(y, y_ref):
+    """Return signal-to-noise ratio in dB of y relative to y_ref"""
+    noise = np.sum((y - y_ref)**2)
+    if noise == 0:
+        return np.inf
+    return 10 * np.log10(np.sum(y_ref**2) / noise)
+
+def compare_methods(wav_dir, fs_rs, edge=1000):
+    """Compare the resampling methods available in SoundFile for all wav
+    files in wav_dir, where resampling frequency is given in Hz by fs_rs
+
+    For each file and method, print the time taken to resample, and the SNR
+    (in dB) and maximum absolute error relative to a reference and, if the
+    data is available, to the Matlab resampled data.
+
+    The reference is an FFT resample of the signal truncated to a whole
+    number of resampling periods, so that its output is exactly on the
+    fs_rs time grid.  (The 'fft' method resamples to ceil(ns * fs_rs / fs)
+    samples, which stretches the time axis slightly.)  The first and last
+    edge samples are left out of the comparison, because the methods handle
+    the ends of the signal differently.
+    """
+    wav_files = sorted(glob.glob(os.path.join(wav_dir, '*.wav')))
+
+    print('{:<24} {:<10} {:>9} {:>8} {:>9} {:>10}'.format(
+        'file', 'method', 'time (s)', 'SNR ref', 'max err', 'SNR matlab'))
+    for wav_file in wav_files:
+        y, y_int, fs = wavread(wav_file)
+        # Reference resample on the exact time grid
+        period = fs // gcd(fs, fs_rs)
+        ns = len(y) - len(y) % period
+        y_ref = resample(y[:ns], ns * fs_rs // fs)[edge:-edge]
+
+        fn = os.path.splitext(os.path.basename(wav_file))[0] + '-matlab-resample'
+        try:
+            y_matlab = np.array(load_json(os.path.join('soundfile', 'resample', fn))['y_rs'])
+        except Exception:
+            y_matlab = None
+
+        for method in valid_resample_methods:
+            s = SoundFile(wav_file, resample_freq=fs_rs, resample_method=method)
+            # Load the data before starting the timer
+            s.wavdata
+            t0 = time.time()
+            y_rs = s.wavdata_rs
+            t = time.time() - t0
+            y_cmp = y_rs[edge:edge + len(y_ref)]
+            if y_matlab is not None and len(y_matlab) == len(y_rs):
+                snr_matlab = format(snr(y_rs[edge:-edge], y_matlab[edge:-edge]), '10.2f')
+            else:
+                snr_matlab = format('n/a', '>10')
+            print('{:<24} {:<10} {:9.4f} {:8.2f} {:9.6f} {}'.format(
+                os.path.basename(wav_file), method, t, snr(y_cmp, y_ref),
+                np.max(np.abs(y_cmp - y_ref)), snr_matlab))
+
 if __name__ == '__main__':
-    main(sys.argv[1], int(sys.argv[2]))
+    if sys.argv[1] == '--methods':
+        compare_methods(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(sys.argv[1], int(sys.argv[2]))